@@ -0,0 +1,116 @@
+"""
+Async serving mode: the same app on an aiohttp event loop
+
+Each webhook turn runs the regular synchronous pipeline from main.py in a
+greenlet (async_bridge.spawn). Backend, docuseek, Twilio media and
+tmpfiles calls made through BackendClient go out on a shared aiohttp
+session, and the turn is suspended while they are in flight. One worker
+process therefore holds many conversations at once, limited by upstream
+latency and CPU rather than by its thread count. Speech recognition and
+synthesis, which have no async API, run on the loop's thread pool.
+
+/webhook and /media are served natively. Every other route is passed to
+the Flask app, so both modes share a single set of handlers.
+
+Usage:
+    gunicorn async_app:app --worker-class aiohttp.GunicornWebWorker --bind 0.0.0.0:5000
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Response as WerkzeugResponse
+
+import main
+from async_bridge import spawn
+
+# Threads for blocking work started from the loop (speech recognition, gTTS, audio decoding)
+ASYNC_BLOCKING_WORKERS = int(os.getenv("ASYNC_BLOCKING_WORKERS", 32))
+
+# Hop-by-hop or recomputed by aiohttp, never copied from the Flask response
+SKIPPED_HEADERS = {"content-length", "transfer-encoding", "connection"}
+
+
+async def webhook(request):
+    """Main webhook handler for Twilio WhatsApp messages"""
+    if request.query.get("x_api_key") != "abcdef":
+        return web.json_response({"error": "Unauthorized"}, status=401)
+
+    if main._request_base_url is None:
+        main._request_base_url = f"{request.scheme}://{request.host}/"
+
+    form = dict((await request.post()).items())
+    body, content_type = await spawn(main.answer_webhook, form)
+    response = web.Response(body=body.encode("utf-8"))
+    response.headers["Content-Type"] = content_type
+    return response
+
+
+async def media(request):
+    """Serve generated reply audio by signed token (supports Range and conditional GET)"""
+    path = main.media_store.resolve(request.match_info["token"])
+    if not path:
+        return web.json_response({"error": "Not found"}, status=404)
+    return web.FileResponse(path, headers={
+        "Content-Type": "audio/mpeg",
+        "Cache-Control": f"public, max-age={main.MEDIA_TTL}",
+    })
+
+
+def call_flask(method, path, query_string, headers, body, base_url):
+    """Run one request through the Flask app and return the buffered werkzeug response"""
+    builder = EnvironBuilder(
+        path=path, base_url=base_url, method=method,
+        query_string=query_string, headers=headers, data=body,
+    )
+    try:
+        environ = builder.get_environ()
+    finally:
+        builder.close()
+    return WerkzeugResponse.from_app(main.app, environ, buffered=True)
+
+
+async def flask_route(request):
+    """Everything else (/stats, /metrics, /healthz, /warmup, ...) through the Flask app"""
+    flask_response = await spawn(
+        call_flask,
+        request.method,
+        request.path,
+        request.query_string,
+        [(name, value) for name, value in request.headers.items() if name.lower() != "content-length"],
+        await request.read(),
+        f"{request.scheme}://{request.host}",
+    )
+    response = web.Response(body=flask_response.get_data(), status=flask_response.status_code)
+    for name, value in flask_response.headers.items():
+        if name.lower() not in SKIPPED_HEADERS:
+            response.headers.add(name, value)
+    return response
+
+
+async def on_startup(app):
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=ASYNC_BLOCKING_WORKERS, thread_name_prefix="blocking"))
+
+
+async def on_cleanup(app):
+    for upstream in (main.backend, main.docuseek, main.twilio_media, main.tmpfiles):
+        await upstream.aclose()
+
+
+def create_app():
+    app = web.Application(client_max_size=10 * 1024 * 1024)
+    app.router.add_post("/webhook", webhook)
+    app.router.add_get("/media/{token}", media)
+    app.router.add_route("*", "/{tail:.*}", flask_route)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+app = create_app()
+
+if __name__ == "__main__":
+    web.run_app(app, port=int(os.getenv("PORT", 5000)))
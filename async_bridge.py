@@ -0,0 +1,125 @@
+import asyncio
+import functools
+import sys
+import threading
+import time
+
+import greenlet
+
+
+class _Bridged(greenlet.greenlet):
+    """Greenlet running synchronous code on behalf of a coroutine on the event loop"""
+
+    __slots__ = ("driver",)
+
+    def __init__(self, fn, driver):
+        super().__init__(fn, driver)
+        self.driver = driver
+
+
+def in_async_context():
+    """True when called from code started by spawn(), i.e. on the event loop"""
+    return isinstance(greenlet.getcurrent(), _Bridged)
+
+
+async def spawn(fn, *args, **kwargs):
+    """
+    Run synchronous fn(*args, **kwargs) on the event loop, awaiting its I/O
+
+    fn runs in a greenlet. Whenever it calls await_only(), the greenlet
+    switches back here, the awaitable is awaited on the loop, and fn resumes
+    with the result. The loop serves other requests while fn waits, so plain
+    synchronous handlers get I/O multiplexing without threads. This is the
+    same technique SQLAlchemy's asyncio support uses.
+    """
+    context = _Bridged(fn, greenlet.getcurrent())
+    result = context.switch(*args, **kwargs)
+    while not context.dead:
+        try:
+            value = await result
+        except BaseException:
+            result = context.throw(*sys.exc_info())
+        else:
+            result = context.switch(value)
+    return result
+
+
+def await_only(awaitable):
+    """Wait for awaitable from synchronous code started by spawn(); returns its result"""
+    current = greenlet.getcurrent()
+    if not isinstance(current, _Bridged):
+        raise RuntimeError("await_only() called outside spawn()")
+    return current.driver.switch(awaitable)
+
+
+def blocking(fn, *args, **kwargs):
+    """
+    Call fn(*args, **kwargs); on the event loop, run it in the loop's thread pool
+
+    For work with no async version (speech libraries, CPU-bound decoding)
+    that would otherwise stall every other request on the loop. Outside the loop it is a plain call.
+    """
+    if not in_async_context():
+        return fn(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    return await_only(loop.run_in_executor(None, functools.partial(fn, *args, **kwargs)))
+
+
+def sleep(seconds):
+    """time.sleep that yields to the event loop when called from spawn()ed code"""
+    if in_async_context():
+        await_only(asyncio.sleep(seconds))
+    else:
+        time.sleep(seconds)
+
+
+class Event:
+    """
+    threading.Event whose wait() suspends spawn()ed code on the loop
+
+    A waiter on the event loop parks on a future of its own loop instead of
+    holding a thread of the pool, so any number of requests can wait for
+    the same in-flight work. set() may be called from any thread. Outside
+    the loop it behaves like threading.Event.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._waiters = []
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def set(self):
+        with self._lock:
+            self._event.set()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                pass  # Loop already closed, nobody left to wake
+
+    def wait(self, timeout=None):
+        """Return True once the event is set, or False if timeout seconds pass first"""
+        if not in_async_context():
+            return self._event.wait(timeout)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._event.is_set():
+                return True
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await_only(asyncio.wait({waiter[1]}, timeout=timeout))
+        finally:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        return self._event.is_set()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
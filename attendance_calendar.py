@@ -0,0 +1,193 @@
+import calendar
+import threading
+from datetime import date
+from functools import lru_cache
+
+from cache import MISSING, TTLCache
+
+# One byte per day of the month; 0 means no record
+STATUS_CODES = {"PRESENT": 1, "ABSENT": 2, "WFH": 3}
+STATUS_EMOJI = {1: "✅", 2: "❌", 3: "🏠"}
+WEEK_HEADER = "Su Mo Tu We Th Fr Sa"
+
+
+def parse_day(value):
+    """Split 'YYYY-MM-DD' (optionally followed by a time) into (year, month, day)"""
+    return int(value[:4]), int(value[5:7]), int(value[8:10])
+
+
+def month_range(first, last):
+    """Yield (year, month) pairs from first to last inclusive"""
+    year, month = first
+    while (year, month) <= last:
+        yield year, month
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+
+
+def month_runs(months):
+    """Group a sorted list of (year, month) pairs into runs of consecutive months"""
+    runs = []
+    for ym in months:
+        if runs:
+            year, month = runs[-1][-1]
+            if ym == ((year, month + 1) if month < 12 else (year + 1, 1)):
+                runs[-1].append(ym)
+                continue
+        runs.append([ym])
+    return runs
+
+
+@lru_cache(maxsize=256)
+def month_layout(year, month):
+    """Title, Sunday-first column of the 1st, and number of days for a month"""
+    first_weekday, days = calendar.monthrange(year, month)  # Monday is 0
+    return f"\n📅 {calendar.month_name[month]} {year}", (first_weekday + 1) % 7, days
+
+
+def format_calendar(months, from_day, to_day):
+    """
+    Render month grids, marking only days between from_day and to_day
+
+    Args:
+        months: List of (year, month, day status bytes) in order
+        from_day: First date of the requested range
+        to_day: Last date of the requested range
+
+    Returns:
+        Calendar text, one Sunday-first grid per month with any records
+    """
+    lines = []
+    for year, month, days in months:
+        first = from_day.day if (year, month) == (from_day.year, from_day.month) else 1
+        last = to_day.day if (year, month) == (to_day.year, to_day.month) else len(days)
+        if not any(days[first - 1:last]):
+            continue
+
+        title, offset, count = month_layout(year, month)
+        lines.append(title)
+        lines.append(WEEK_HEADER)
+        week = ["   "] * offset
+        for day in range(1, count + 1):
+            emoji = STATUS_EMOJI.get(days[day - 1], " ") if first <= day <= last else " "
+            week.append(f"{emoji}{day:2}")
+            if len(week) == 7:
+                lines.append(" ".join(week))
+                week = []
+        if week:
+            lines.append(" ".join(week))
+
+    return "\n".join(lines)
+
+
+class AttendanceCalendarCache:
+    """
+    Per-employee attendance kept month by month as one status byte per day
+
+    calendar() serves a date range from cached months and fetches only the
+    missing ones, one backend call per run of consecutive months. mark()
+    patches a cached month in place after a successful write, and
+    invalidate() drops months the backend changed on its own (an approved
+    leave or WFH request). A fetch that raced with either is used for that
+    reply but not cached, so a write is never overwritten by an older read.
+
+    Args:
+        maxsize: Maximum number of employee-months kept
+        ttl: Seconds a month is trusted before it is fetched again
+    """
+
+    def __init__(self, maxsize=4096, ttl=900):
+        self.months = TTLCache(maxsize, ttl, name="attendance_calendar")
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.fetches = 0
+        self.months_fetched = 0
+        self.marks = 0
+
+    def calendar(self, emp_id, from_day, to_day, fetch):
+        """
+        Return [(year, month, day status bytes)] covering from_day..to_day
+
+        Args:
+            emp_id: Employee ID
+            from_day: First date of the range
+            to_day: Last date of the range
+            fetch: Callable (from 'YYYY-MM-DD', to 'YYYY-MM-DD') returning
+                   {status: [dates]} for that range
+        """
+        key = str(emp_id)
+        wanted = list(month_range((from_day.year, from_day.month), (to_day.year, to_day.month)))
+        months = {}
+        missing = []
+        for ym in wanted:
+            days = self.months.get((key, *ym))
+            if days is MISSING:
+                missing.append(ym)
+            else:
+                months[ym] = days
+
+        for run in month_runs(missing):
+            months.update(self._fetch(key, run, fetch))
+
+        return [(year, month, months[(year, month)]) for year, month in wanted]
+
+    def _fetch(self, key, run, fetch):
+        since = self._generation
+        (first_year, first_month), (last_year, last_month) = run[0], run[-1]
+        start = date(first_year, first_month, 1)
+        end = date(last_year, last_month, month_layout(last_year, last_month)[2])
+        attendance = fetch(start.isoformat(), end.isoformat())
+
+        fetched = {ym: bytearray(month_layout(*ym)[2]) for ym in run}
+        for status, dates in attendance.items():
+            code = STATUS_CODES.get(status)
+            if code is None:
+                continue
+            for value in dates:
+                year, month, day = parse_day(value)
+                days = fetched.get((year, month))
+                if days is not None and 1 <= day <= len(days):
+                    days[day - 1] = code
+
+        with self._lock:
+            self.fetches += 1
+            self.months_fetched += len(run)
+            if since == self._generation:
+                for (year, month), days in fetched.items():
+                    self.months.set((key, year, month), days)
+        return fetched
+
+    def mark(self, emp_id, date_str, status):
+        """Record a successful attendance write in the cached month, if any"""
+        year, month, day = parse_day(date_str)
+        code = STATUS_CODES.get(status)
+        with self._lock:
+            self._generation += 1
+            self.marks += 1
+            days = self.months.get((str(emp_id), year, month))
+            if days is MISSING:
+                return
+            if code is None:
+                self.months.invalidate((str(emp_id), year, month))
+            else:
+                days[day - 1] = code
+
+    def invalidate(self, emp_id, from_date, to_date):
+        """Drop the cached months covering from_date..to_date ('YYYY-MM-DD'), e.g. after the backend wrote them"""
+        first, last = parse_day(from_date)[:2], parse_day(to_date)[:2]
+        if first > last:
+            first, last = last, first
+        with self._lock:
+            self._generation += 1
+            for year, month in month_range(first, last):
+                self.months.invalidate((str(emp_id), year, month))
+
+    def stats(self):
+        stats = self.months.stats()
+        stats.update({
+            "fetches": self.fetches,
+            "months_fetched": self.months_fetched,
+            "marks": self.marks,
+        })
+        return stats
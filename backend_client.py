@@ -0,0 +1,407 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from async_bridge import await_only, in_async_context
+from metrics import UPSTREAM_SECONDS
+
+# Pool and timeout defaults, overridable per deployment
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", 4))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 16))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 30))
+# Connections per host for the async client; requests on the event loop are not bounded by threads
+ASYNC_HTTP_POOL_MAXSIZE = int(os.getenv("ASYNC_HTTP_POOL_MAXSIZE", 100))
+
+
+class PoolStats:
+    """Thread-safe counters for requests sent and connections opened"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+        self.errors = 0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_connection(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self):
+        with self._lock:
+            reused = max(self.requests - self.connections_opened, 0)
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "connections_reused": reused,
+                "reuse_ratio": round(reused / self.requests, 4) if self.requests else 0.0,
+                "errors": self.errors,
+            }
+
+
+def _counting_pool_classes(stats):
+    """Build urllib3 pool classes that report every new TCP/TLS connection to stats"""
+
+    class CountingHTTPConnectionPool(HTTPConnectionPool):
+        def _new_conn(self):
+            stats.record_connection()
+            return super()._new_conn()
+
+    class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+        def _new_conn(self):
+            stats.record_connection()
+            return super()._new_conn()
+
+    return {"http": CountingHTTPConnectionPool, "https": CountingHTTPSConnectionPool}
+
+
+class _CountingAdapter(HTTPAdapter):
+    def __init__(self, stats, **kwargs):
+        self._stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _counting_pool_classes(self._stats)
+
+
+class BackendClient:
+    """
+    Keep-alive HTTP client bound to one upstream host
+
+    Every call goes through a single requests.Session whose connection pool is
+    sized by pool_connections/pool_maxsize, so repeated calls reuse open
+    TCP+TLS connections instead of paying a handshake each time. Default
+    headers (e.g. the API key) are built once here rather than per call.
+
+    Called from code running on the event loop (see async_bridge.spawn),
+    the same request goes out through an aiohttp session instead and the
+    caller's greenlet is suspended until it completes. Callers get a
+    requests.Response and requests exceptions either way.
+
+    Args:
+        name: Short label used in stats (e.g. "backend", "docuseek")
+        base_url: Root URL that relative paths are joined to (may be None)
+        headers: Headers sent with every request
+        auth: Optional (user, password) tuple sent with every request
+        pool_connections: Number of per-host pools to keep
+        pool_maxsize: Max open connections kept per host
+        timeout: (connect, read) timeout in seconds applied unless overridden
+        breaker: Optional CircuitBreaker; network errors and 5xx responses
+                 count as failures, and calls raise CircuitOpenError while
+                 it is open
+        hedge_after: Seconds to wait before sending a second copy of a
+                     request made with hedge=True; None disables hedging
+        hedge_ratio: Largest fraction of requests that may be hedged, so a
+                     slow upstream does not get twice the load
+    """
+
+    def __init__(self, name, base_url=None, headers=None, auth=None,
+                 pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE,
+                 timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+                 breaker=None, hedge_after=None, hedge_ratio=0.1):
+        self.name = name
+        self.base_url = (base_url or "").rstrip("/")
+        self.timeout = timeout
+        self.breaker = breaker
+        self.hedge_after = hedge_after
+        self.hedge_ratio = hedge_ratio
+        # A hedged read holds up to two threads, one per copy, like the two connections it uses
+        self.hedge_workers = 2 * pool_maxsize
+        self.stats = PoolStats()
+        self._hedge_pool = None
+        self._hedge_lock = threading.Lock()
+        self.hedged = 0
+        self.hedges_won = 0
+        self.headers = dict(headers or {})
+        self.auth = auth
+        self._async_session = None
+        self._async_loop = None
+
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        if auth:
+            self.session.auth = auth
+
+        adapter = _CountingAdapter(
+            self.stats,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url(self, path):
+        if path.startswith(("http://", "https://")):
+            return path
+        return self.base_url + path
+
+    def request(self, method, path, hedge=False, **kwargs):
+        """
+        Send a request through the pooled session; raises requests exceptions like requests.request
+
+        Pass hedge=True only for idempotent reads: if no response arrives
+        within hedge_after seconds the same request is sent again and
+        whichever answers first is returned.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        if self.breaker is None:
+            return self._dispatch(method, path, hedge, kwargs)
+
+        self.breaker.allow()
+        try:
+            response = self._dispatch(method, path, hedge, kwargs)
+        except requests.exceptions.RequestException:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # A local error or a cancelled turn says nothing about the upstream
+            self.breaker.release()
+            raise
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _dispatch(self, method, path, hedge, kwargs):
+        if in_async_context():
+            return await_only(self._async_request(method, path, hedge, kwargs))
+        if hedge and self.hedge_after:
+            return self._send_hedged(method, path, kwargs)
+        return self._send(method, path, kwargs)
+
+    def _send(self, method, path, kwargs):
+        self.stats.record_request()
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.url(path), **kwargs)
+        except requests.exceptions.RequestException:
+            self.stats.record_error()
+            UPSTREAM_SECONDS.observe(time.perf_counter() - started, self.name, method, "error")
+            raise
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, self.name, method, f"{response.status_code // 100}xx")
+        return response
+
+    def _send_hedged(self, method, path, kwargs):
+        if self._hedge_pool is None:
+            with self._hedge_lock:
+                if self._hedge_pool is None:
+                    self._hedge_pool = ThreadPoolExecutor(
+                        max_workers=self.hedge_workers, thread_name_prefix=f"{self.name}-hedge")
+        sent = threading.Event()
+
+        def send_first():
+            sent.set()
+            return self._send(method, path, kwargs)
+
+        first = self._hedge_pool.submit(send_first)
+        # hedge_after counts from the send, not from the time spent waiting for a thread
+        sent.wait()
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done or not self._take_hedge():
+            return first.result()
+
+        second = self._hedge_pool.submit(self._send, method, path, kwargs)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except requests.exceptions.RequestException as e:
+                    error = e
+                    continue
+                # The slower copy cannot be stopped; it finishes on its thread and is dropped
+                if future is second:
+                    self._hedge_won()
+                return response
+        raise error
+
+    def _take_hedge(self):
+        """Count a hedge and return True if the hedge_ratio budget allows one more"""
+        with self._hedge_lock:
+            if self.hedged >= self.hedge_ratio * self.stats.requests:
+                return False
+            self.hedged += 1
+            return True
+
+    def _hedge_won(self):
+        with self._hedge_lock:
+            self.hedges_won += 1
+
+    def _async_client(self):
+        """aiohttp session for the running event loop, created on first use"""
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        if self._async_session is None or self._async_loop is not loop:
+            async def on_connection_create_end(session, context, params):
+                self.stats.record_connection()
+
+            trace = aiohttp.TraceConfig()
+            trace.on_connection_create_end.append(on_connection_create_end)
+            auth = aiohttp.BasicAuth(self.auth[0] or "", self.auth[1] or "") if self.auth else None
+            self._async_session = aiohttp.ClientSession(
+                headers=self.headers,
+                auth=auth,
+                connector=aiohttp.TCPConnector(limit=0, limit_per_host=ASYNC_HTTP_POOL_MAXSIZE),
+                trace_configs=[trace],
+            )
+            self._async_loop = loop
+        return self._async_session
+
+    async def _async_request(self, method, path, hedge, kwargs):
+        if hedge and self.hedge_after:
+            return await self._async_send_hedged(method, path, kwargs)
+        return await self._async_send(method, path, kwargs)
+
+    async def _async_send(self, method, path, kwargs):
+        import aiohttp
+
+        timeout = kwargs.get("timeout")
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        options = {"timeout": aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)}
+        # requests drops None values from params and headers; aiohttp rejects them
+        if kwargs.get("params"):
+            options["params"] = {k: str(v) for k, v in kwargs["params"].items() if v is not None}
+        if kwargs.get("headers"):
+            options["headers"] = {k: v for k, v in kwargs["headers"].items() if v is not None}
+        if kwargs.get("json") is not None:
+            options["json"] = kwargs["json"]
+        if kwargs.get("files"):
+            options["data"] = _form_data(kwargs["files"], kwargs.get("data"))
+        elif kwargs.get("data") is not None:
+            options["data"] = kwargs["data"]
+
+        self.stats.record_request()
+        started = time.perf_counter()
+        try:
+            # Bodies are read in full; stream=True callers iterate over the buffered content
+            async with self._async_client().request(method, self.url(path), **options) as resp:
+                body = await resp.read()
+        except Exception as e:
+            self.stats.record_error()
+            UPSTREAM_SECONDS.observe(time.perf_counter() - started, self.name, method, "error")
+            error = _as_requests_error(e)
+            if error is e:
+                raise
+            raise error from e
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, self.name, method, f"{resp.status // 100}xx")
+
+        response = requests.Response()
+        response.status_code = resp.status
+        response.reason = resp.reason
+        response.url = str(resp.url)
+        response.headers = CaseInsensitiveDict(resp.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body
+        response._content_consumed = True
+        return response
+
+    async def _async_send_hedged(self, method, path, kwargs):
+        first = asyncio.ensure_future(self._async_send(method, path, kwargs))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+        if done or not self._take_hedge():
+            return await first
+
+        second = asyncio.ensure_future(self._async_send(method, path, kwargs))
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                # Unlike a thread, the slower copy can be abandoned
+                for loser in pending:
+                    loser.cancel()
+                if future is second:
+                    self._hedge_won()
+                return future.result()
+        raise error
+
+    async def aclose(self):
+        if self._async_session is not None:
+            await self._async_session.close()
+            self._async_session = None
+
+    def hedge_stats(self):
+        with self._hedge_lock:
+            return {"hedged": self.hedged, "hedges_won": self.hedges_won}
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def _form_data(files, data=None):
+    """aiohttp FormData for requests-style files={field: (filename, content[, content type])} and data"""
+    import aiohttp
+
+    form = aiohttp.FormData()
+    for key, value in (data or {}).items():
+        form.add_field(key, str(value))
+    for key, value in files.items():
+        if isinstance(value, tuple):
+            filename, content, *rest = value
+            form.add_field(key, content, filename=filename, content_type=rest[0] if rest else None)
+        else:
+            form.add_field(key, value, filename=key)
+    return form
+
+
+def _as_requests_error(error):
+    """The requests exception callers already handle for an aiohttp or timeout error"""
+    import aiohttp
+
+    if isinstance(error, aiohttp.ConnectionTimeoutError):
+        return requests.exceptions.ConnectTimeout(str(error))
+    if isinstance(error, asyncio.TimeoutError):
+        return requests.exceptions.ReadTimeout(str(error) or "read timed out")
+    if isinstance(error, aiohttp.ClientConnectionError):
+        return requests.exceptions.ConnectionError(str(error))
+    if isinstance(error, (aiohttp.ClientError, ValueError)):
+        return requests.exceptions.RequestException(str(error))
+    return error
+
+
+def pool_stats(*clients):
+    """Return {client name: stats snapshot} for the given clients"""
+    return {c.name: c.stats.snapshot() for c in clients}
+
+
+def resilience_stats(*clients):
+    """Return {client name: breaker state and hedging counters} for the given clients"""
+    stats = {}
+    for c in clients:
+        stats[c.name] = c.hedge_stats()
+        if c.breaker is not None:
+            stats[c.name]["breaker"] = c.breaker.stats()
+    return stats
@@ -0,0 +1,141 @@
+"""
+Concurrent conversations one worker can sustain, per serving mode
+
+Runs a single gunicorn worker against the stand-ins (see load_test.py) and
+simulates N users at once. Each user sends a message from the webhook
+corpus, waits for the reply, pauses for --think-ms, and repeats. N steps up
+through --levels. A level counts as sustained when it has no errors and
+its p95 stays under --slo-ms. The highest sustained level is reported for
+each serving mode:
+    sync     gunicorn's default worker, one request at a time
+    gthread  --threads request threads
+    aiohttp  async_app.py, turns multiplexed on one event loop
+
+Usage:
+    python bench/conversations.py [--servers sync,gthread,aiohttp] [--levels 1,2,4,8,16,32,64,128]
+                                  [--think-ms 1000] [--duration 10] [--slo-ms 1000]
+                                  [--threads 8] [--latency-ms 50] [--json results.json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from load_test import WEBHOOK_KEY, Corpus, app_environment, free_port, percentile, start_app  # noqa: E402
+from standins import StandIns  # noqa: E402
+
+
+def converse(url, corpus, users, duration, think, seed):
+    """Closed loop: `users` threads each send, wait for the reply, think, and send again"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def user(index):
+        rng = random.Random(seed * 10007 + index)
+        session = requests.Session()
+        # Spread the first messages over one think time so users do not arrive in lockstep
+        time.sleep(rng.uniform(0, think))
+        while time.perf_counter() < stop_at:
+            _, form = corpus.sample(rng)
+            started = time.perf_counter()
+            try:
+                ok = session.post(f"{url}/webhook", params={"x_api_key": WEBHOOK_KEY},
+                                  data=form, timeout=60).status_code == 200
+            except requests.RequestException:
+                ok = False
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                if not ok:
+                    errors[0] += 1
+            time.sleep(think)
+
+    threads = [threading.Thread(target=user, args=(i,), daemon=True) for i in range(users)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "users": users,
+        "requests": len(latencies),
+        "errors": errors[0],
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+    }
+
+
+def measure(server, args, standins, corpus_path):
+    port = free_port()
+    env = app_environment(standins, port, args.voice_latency_ms)
+    process, log_path = start_app(port, env, workers=1, threads=args.threads, server=server)
+    url = f"http://127.0.0.1:{port}"
+    print(f"\n{server}: 1 worker on {url}, log: {log_path}")
+    print(f"{'users':>8}{'requests':>10}{'errors':>8}{'rps':>10}{'p50_ms':>10}{'p95_ms':>10}")
+
+    rows = []
+    sustained = 0
+    try:
+        corpus = Corpus(corpus_path, standins)
+        converse(url, corpus, 2, 1.0, 0.1, args.seed)  # warm-up
+        for users in args.levels:
+            row = converse(url, corpus, users, args.duration, args.think_ms / 1000, args.seed)
+            row["sustained"] = row["errors"] == 0 and row["p95_ms"] <= args.slo_ms
+            rows.append(row)
+            print(f"{row['users']:>8}{row['requests']:>10}{row['errors']:>8}{row['throughput_rps']:>10}"
+                  f"{row['p50_ms']:>10}{row['p95_ms']:>10}{'' if row['sustained'] else '  over SLO'}")
+            if not row["sustained"]:
+                break
+            sustained = users
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    print(f"{server}: sustains {sustained} concurrent conversations (p95 <= {args.slo_ms}ms, no errors)")
+    return {"server": server, "sustained": sustained, "levels": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--servers", default="sync,gthread,aiohttp")
+    parser.add_argument("--levels", default="1,2,4,8,16,32,64,128,256", help="users per step")
+    parser.add_argument("--think-ms", type=float, default=1000, help="pause between a reply and the next message")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per level")
+    parser.add_argument("--slo-ms", type=float, default=1000, help="p95 a level must stay under")
+    parser.add_argument("--threads", type=int, default=8, help="request threads for the gthread worker")
+    parser.add_argument("--latency-ms", type=float, default=50, help="injected latency for every stand-in")
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--voice-latency-ms", type=float, default=300)
+    parser.add_argument("--employees", type=int, default=200)
+    parser.add_argument("--corpus", default=os.path.join(BENCH_DIR, "webhook_corpus.json"))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    args.levels = [int(level) for level in args.levels.split(",")]
+
+    standins = StandIns({"default": args.latency_ms / 1000}, args.jitter_ms / 1000, args.employees).start()
+    try:
+        results = [measure(server, args, standins, args.corpus) for server in args.servers.split(",")]
+    finally:
+        standins.stop()
+
+    print("\nconcurrent conversations per worker:", ", ".join(f"{r['server']} {r['sustained']}" for r in results))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
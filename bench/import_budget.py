@@ -0,0 +1,85 @@
+"""
+Import-time budget for the app
+
+Imports `main` in fresh interpreters with -X importtime and reports the
+median cumulative time, the slowest top-level imports, and any of the
+lazily loaded subsystems (speech libraries, twilio.rest) that were
+imported anyway. Exits 1 if the median is above --budget-ms or a lazy
+module was imported eagerly.
+
+Usage:
+    python bench/import_budget.py [--budget-ms 600] [--repeat 5] [--top 10]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+# Loaded on first use; importing any of them with main is a regression
+LAZY_MODULES = ("speech_recognition", "pydub", "gtts", "twilio.rest")
+
+
+def import_times(module):
+    """Return {module name: (self us, cumulative us, depth)} for one fresh import of module"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        times[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, help="exit 1 if the median import is slower than this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level imports to list")
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.repeat)]
+    totals = sorted(run[args.module][1] / 1000 for run in runs)
+    median = statistics.median(totals)
+    print(f"import {args.module}: median {median:.1f} ms, min {totals[0]:.1f} ms, max {totals[-1]:.1f} ms "
+          f"over {args.repeat} runs")
+
+    # Direct imports of the module, by median cumulative time
+    last = runs[-1]
+    children = [name for name, (_, _, depth) in last.items() if depth == 1]
+    rows = []
+    for name in children:
+        samples = [run[name][1] / 1000 for run in runs if name in run]
+        rows.append((statistics.median(samples), name))
+    rows.sort(reverse=True)
+    print(f"\n{'module':<40}{'cumulative ms':>14}")
+    for ms, name in rows[:args.top]:
+        print(f"{name:<40}{ms:>14.1f}")
+    own = statistics.median(run[args.module][0] / 1000 for run in runs)
+    print(f"{'(module body)':<40}{own:>14.1f}")
+
+    failed = False
+    eager = [name for name in LAZY_MODULES if name in last]
+    if eager:
+        print(f"\nimported eagerly, should load on first use: {', '.join(eager)}")
+        failed = True
+    if args.budget_ms is not None and median > args.budget_ms:
+        print(f"\nmedian {median:.1f} ms is above the {args.budget_ms} ms budget")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Load test for the webhook against local stand-ins
+
+Starts the stand-in services (bench/standins.py), runs the app under
+gunicorn pointed at them (bench/standin_app.py) and replays a corpus of
+Twilio webhook form posts, text and voice, at a fixed arrival rate.
+Reports p50/p95/p99 latency, throughput and error rate per command.
+
+Usage:
+    python bench/load_test.py [--rate 20] [--duration 30] [--workers 2] [--threads 8]
+                              [--server gthread|sync|aiohttp] [--latency-ms 50] [--async]
+                              [--json results.json]
+                              [--fail-p95-ms 800]
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from standins import StandIns  # noqa: E402
+
+WEBHOOK_KEY = "abcdef"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+# gunicorn app and worker class per serving mode; "aiohttp" is async_app.py
+SERVERS = {
+    "sync": ("bench.standin_app:app", "sync"),
+    "gthread": ("bench.standin_app:app", "gthread"),
+    "aiohttp": ("bench.standin_app:web_app", "aiohttp.GunicornWebWorker"),
+}
+
+
+def start_app(port, env, workers, threads, server="gthread"):
+    """Run gunicorn on bench.standin_app and wait until it accepts connections"""
+    app, worker_class = SERVERS[server]
+    command = [
+        sys.executable, "-m", "gunicorn", app,
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(workers),
+        "--threads", str(threads),
+        "--worker-class", worker_class,
+        "--log-level", "warning",
+    ]
+    log = tempfile.NamedTemporaryFile(prefix="load-test-app-", suffix=".log", delete=False)
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {process.returncode}, see {log.name}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/healthz", timeout=1)
+            return process, log.name
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"gunicorn did not start within 60s, see {log.name}")
+
+
+class Corpus:
+    """Weighted webhook form posts; senders are drawn from the stand-in backend's employees"""
+
+    def __init__(self, path, standins):
+        with open(path) as f:
+            self.entries = json.load(f)
+        self.weights = [entry.get("weight", 1) for entry in self.entries]
+        self.employees = list(standins.backend.employees.values())
+        self.managers = standins.backend.managers()
+        self.media_url = standins.media_url()
+
+    def sample(self, rng):
+        entry = rng.choices(self.entries, self.weights)[0]
+        sender = entry.get("sender", "employee")
+        if sender == "unknown":
+            phone = "8" + "".join(rng.choice("0123456789") for _ in range(9))
+        else:
+            phone = rng.choice(self.managers if sender == "manager" else self.employees)["phone"]
+
+        form = {
+            "MessageSid": "SM" + uuid.uuid4().hex,
+            "From": f"whatsapp:+91{phone}",
+            "To": "whatsapp:+10000000000",
+            "Body": entry.get("body", ""),
+            "NumMedia": "0",
+        }
+        if entry.get("audio"):
+            form.update({"NumMedia": "1", "MediaUrl0": self.media_url, "MediaContentType0": "audio/ogg"})
+        return entry["command"], form
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.late = 0
+
+    def record(self, command, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(command, []).append(seconds)
+            if not ok:
+                self.errors[command] = self.errors.get(command, 0) + 1
+
+    def report(self, elapsed):
+        rows = []
+        everything = []
+        for command in sorted(self.samples):
+            latencies = sorted(self.samples[command])
+            everything.extend(latencies)
+            rows.append(self._row(command, latencies, self.errors.get(command, 0), elapsed))
+        everything.sort()
+        total = self._row("all", everything, sum(self.errors.values()), elapsed)
+        return rows, total
+
+    @staticmethod
+    def _row(command, latencies, errors, elapsed):
+        return {
+            "command": command,
+            "requests": len(latencies),
+            "error_rate": round(errors / len(latencies), 4) if latencies else 0.0,
+            "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        }
+
+
+def run(url, corpus, rate, duration, concurrency, seed):
+    """Open-loop replay: requests start on schedule whether or not earlier ones finished"""
+    recorder = Recorder()
+    sessions = threading.local()
+    rng = random.Random(seed)
+
+    def post(command, form):
+        session = getattr(sessions, "session", None)
+        if session is None:
+            session = sessions.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = session.post(f"{url}/webhook", params={"x_api_key": WEBHOOK_KEY}, data=form, timeout=60)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        recorder.record(command, time.perf_counter() - started, ok)
+
+    total = int(rate * duration)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(total):
+            delay = started + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -0.05:
+                recorder.late += 1
+            pool.submit(post, *corpus.sample(rng))
+    return recorder, time.perf_counter() - started
+
+
+def print_report(rows, total, late, standin_stats):
+    columns = ["command", "requests", "error_rate", "throughput_rps", "p50_ms", "p95_ms", "p99_ms"]
+    print("".join(f"{name:>16}" if i else f"{name:<24}" for i, name in enumerate(columns)))
+    for row in rows + [total]:
+        print("".join(f"{row[name]:>16}" if i else f"{row[name]:<24}" for i, name in enumerate(columns)))
+    if late:
+        print(f"\n{late} requests started more than 50ms late; raise --concurrency or lower --rate")
+    print("\nstand-ins:", json.dumps(standin_stats))
+
+
+def app_environment(standins, port, voice_latency_ms, async_mode=False):
+    """Environment for an app under test that talks to the stand-ins and keeps its files in a scratch dir"""
+    scratch = tempfile.mkdtemp(prefix="load-test-")
+    env = dict(os.environ)
+    env.update(standins.environment())
+    env.update({
+        "WEBHOOK_ASYNC": "1" if async_mode else "0",
+        "PUBLIC_BASE_URL": f"http://127.0.0.1:{port}",
+        "TTS_CACHE_DIR": os.path.join(scratch, "tts"),
+        "MEDIA_DIR": os.path.join(scratch, "media"),
+        "METRICS_DIR": os.path.join(scratch, "metrics"),
+        "WEBHOOK_DEDUP_DIR": os.path.join(scratch, "webhooks"),
+        "MEDIA_SECRET": "load-test",
+        "BENCH_VOICE_LATENCY_MS": str(voice_latency_ms),
+    })
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rate", type=float, default=20, help="webhook posts per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of load before measuring")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument("--server", choices=sorted(SERVERS), default="gthread", help="serving mode")
+    parser.add_argument("--concurrency", type=int, default=256, help="maximum requests in flight")
+    parser.add_argument("--latency-ms", type=float, default=50, help="injected latency for every stand-in")
+    parser.add_argument("--jitter-ms", type=float, default=20, help="extra random latency, up to this much")
+    parser.add_argument("--docuseek-latency-ms", type=float, help="override for the information-retrieval stand-in")
+    parser.add_argument("--voice-latency-ms", type=float, default=300, help="stand-in speech recognition/synthesis time")
+    parser.add_argument("--employees", type=int, default=200)
+    parser.add_argument("--async", dest="async_mode", action="store_true", help="run with WEBHOOK_ASYNC=1")
+    parser.add_argument("--corpus", default=os.path.join(BENCH_DIR, "webhook_corpus.json"))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--fail-p95-ms", type=float, help="exit 1 if the overall p95 is above this")
+    args = parser.parse_args()
+
+    latency = {"default": args.latency_ms / 1000}
+    if args.docuseek_latency_ms is not None:
+        latency["docuseek"] = args.docuseek_latency_ms / 1000
+    standins = StandIns(latency, args.jitter_ms / 1000, args.employees).start()
+
+    port = free_port()
+    env = app_environment(standins, port, args.voice_latency_ms, args.async_mode)
+    process, log_path = start_app(port, env, args.workers, args.threads, args.server)
+    url = f"http://127.0.0.1:{port}"
+    print(f"app on {url} ({args.workers} {args.server} workers x {args.threads} threads), log: {log_path}")
+
+    try:
+        corpus = Corpus(args.corpus, standins)
+        if args.warmup:
+            run(url, corpus, args.rate, args.warmup, args.concurrency, args.seed + 1)
+        recorder, elapsed = run(url, corpus, args.rate, args.duration, args.concurrency, args.seed)
+        rows, total = recorder.report(elapsed)
+        print_report(rows, total, recorder.late, standins.stats())
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"args": vars(args), "commands": rows, "all": total, "late": recorder.late,
+                           "standins": standins.stats()}, f, indent=2)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        standins.stop()
+
+    if args.fail_p95_ms is not None and total["p95_ms"] > args.fail_p95_ms:
+        print(f"\np95 {total['p95_ms']}ms is above the {args.fail_p95_ms}ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
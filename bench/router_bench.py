@@ -0,0 +1,74 @@
+"""
+Micro-benchmark for command classification
+
+Measures how long router.classify() takes per message for every command
+type, including Message normalization, without calling any handler.
+Exits with status 1 if any message is routed to the wrong command.
+
+Usage:
+    python bench/router_bench.py [--number 20000]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import router  # noqa: E402
+from router import CommandContext, Message  # noqa: E402
+
+EMPLOYEE = {"id": 1, "name": "Bench User", "level": 5, "employeeType": "A", "reportsTo": 2}
+
+# Representative messages per command, as typed or transcribed
+CORPUS = {
+    "mark_attendance": ["PRESENT", "absent 2024-01-02", "WFH2024-01-03"],
+    "mark_attendance_bulk": ["WFH 2024-01-01 to 2024-01-05", "present team"],
+    "leave_request": ["WFH from 2024-01-01 to 2024-01-05", "leave from 2024-02-01 to 2024-02-02"],
+    "today_attendance": ["what is my attendance today", "today attendance"],
+    "attendance_calendar": ["my attendance from 2024-01-01 to 2024-03-31"],
+    "request_history": ["my request history"],
+    "active_requests": ["my active request"],
+    "requests_on_me": ["request on me"],
+    "pending_requests_on_me": ["active request on me"],
+    "accept_request": ["accept request 123", "accept request"],
+    "reject_request": ["reject request 123"],
+    "decide_requests_bulk": ["accept all", "accept 12,15,18", "reject all from john"],
+    "more": ["more"],
+    "find_contact": ["find contact of John Doe"],
+    "custom_employee": ["custom employee who are engineers in Bangalore"],
+    "custom_query": ["custom how many employees joined this year"],
+    "default": ["how many leaves do I get in a year", "what is the notice period", "WFH policy to follow?"],
+}
+
+
+def classify(text):
+    message = Message(text)
+    return router.classify(message, CommandContext(message, EMPLOYEE, "whatsapp:+910000000000"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000, help="classifications per message")
+    args = parser.parse_args()
+
+    print(f"{'command':<24}{'matched':<24}{'ns/message':>12}")
+    total_time, total_messages = 0.0, 0
+    mismatches = 0
+    for expected, messages in CORPUS.items():
+        for text in messages:
+            route, _ = classify(text)
+            seconds = min(timeit.repeat(lambda: classify(text), number=args.number, repeat=3))
+            total_time += seconds
+            total_messages += args.number
+            flag = "" if route.name == expected else "  MISMATCH"
+            mismatches += bool(flag)
+            print(f"{expected:<24}{route.name:<24}{seconds / args.number * 1e9:>12.0f}{flag}")
+    print(f"{'all':<48}{total_time / total_messages * 1e9:>12.0f}")
+    if mismatches:
+        print(f"{mismatches} message(s) routed to the wrong command")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+gunicorn entry point for load tests
+
+Serves the real app. With BENCH_VOICE=standin (the default) the two calls
+that leave for Google, speech recognition and text-to-speech, are replaced
+by stand-ins that wait BENCH_VOICE_LATENCY_MS and return a fixed transcript
+(BENCH_TRANSCRIPT) or a tiny mp3, so voice turns can be measured offline.
+Audio download and decoding still run for real.
+
+Usage:
+    gunicorn bench.standin_app:app
+    gunicorn bench.standin_app:web_app --worker-class aiohttp.GunicornWebWorker
+"""
+import os
+import time
+
+import async_app
+import main
+import voice
+
+app = main.app
+# The same app in async serving mode
+web_app = async_app.app
+
+if os.getenv("BENCH_VOICE", "standin") == "standin":
+    VOICE_LATENCY = float(os.getenv("BENCH_VOICE_LATENCY_MS", 300)) / 1000
+    TRANSCRIPT = os.getenv("BENCH_TRANSCRIPT", "what is my attendance today")
+
+    def recognize_google(audio_data, *args, **kwargs):
+        time.sleep(VOICE_LATENCY)
+        return TRANSCRIPT
+
+    def synthesize(text, lang="en"):
+        time.sleep(VOICE_LATENCY)
+        return b"ID3\x03\x00\x00\x00\x00\x00\x00" + text.encode("utf-8")[:256]
+
+    voice.recognizer.recognize_google = recognize_google
+    voice.synthesize = synthesize
@@ -0,0 +1,413 @@
+"""
+Local stand-ins for every service the app calls
+
+Each stand-in is a threaded keep-alive HTTP server that waits an injected
+latency (fixed plus uniform jitter) before answering, so the app can be
+load-tested offline with realistic upstream timings:
+
+    backend   API_URL: employees, attendance, requests and /query
+    docuseek  DOCUSEEK_URL: answers questions and writes SQL for "custom"
+    twilio    TWILIO_API_URL: Messages.json, plus the voice note media files
+    tmpfiles  TMPFILES_URL: /api/v1/upload for MEDIA_BACKEND=tmpfiles
+
+Usage:
+    python bench/standins.py [--latency-ms 40] [--jitter-ms 20] [--employees 200]
+
+prints the environment that points the app at the stand-ins and serves
+until interrupted.
+"""
+import argparse
+import io
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+import wave
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+ACCOUNT_SID = "AC" + "0" * 32
+AUTH_TOKEN = "bench-token"
+WHATSAPP_NUMBER = "whatsapp:+10000000000"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _dispatch(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        self.server.wait()
+        try:
+            status, payload = self.server.route(self.command, url.path, parse_qs(url.query), body)
+        except Exception as e:
+            status, payload = 500, {"error": repr(e)}
+
+        if isinstance(payload, bytes):
+            data, content_type = payload, "application/octet-stream"
+        else:
+            data, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.count(status)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandIn(ThreadingHTTPServer):
+    """
+    A stand-in service on 127.0.0.1 with a random free port
+
+    Args:
+        name: Label used in reports
+        route: Callable (method, path, query dict, body bytes) -> (status, payload);
+               payload is JSON-serializable or raw bytes
+        latency: Seconds added to every response
+        jitter: Extra uniformly random seconds, up to this much
+    """
+
+    daemon_threads = True
+
+    def __init__(self, name, route, latency=0.0, jitter=0.0):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.name = name
+        self.route = route
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def wait(self):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def count(self, status):
+        with self._lock:
+            self.requests += 1
+            if status >= 500:
+                self.errors += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name=f"standin-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def _json(body):
+    return json.loads(body or b"{}")
+
+
+class Backend:
+    """In-memory employees, attendance and requests behind the API_URL endpoints"""
+
+    def __init__(self, employees=200, team_size=10, seed=7):
+        rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.employees = {}
+        for emp_id in range(1, employees + 1):
+            manager_id = ((emp_id - 1) // team_size) * team_size + 1
+            self.employees[emp_id] = {
+                "id": emp_id,
+                "name": f"Employee {emp_id:04d}",
+                "email": f"employee{emp_id}@example.com",
+                "phone": f"9{emp_id:09d}",
+                "role": "manager" if emp_id == manager_id else "engineer",
+                "level": 5 if emp_id == manager_id else rng.randint(1, 3),
+                "employeeType": rng.choice("ABC"),
+                "reportsTo": None if emp_id == manager_id else manager_id,
+                "clientCompany": rng.choice(["Acme", "Globex", "Initech"]),
+                "location": rng.choice(["Bangalore", "Delhi", "Pune"]),
+            }
+        self.by_phone = {employee["phone"]: employee for employee in self.employees.values()}
+
+        self.requests = {}
+        start = date(2024, 1, 1)
+        for employee in self.employees.values():
+            approver = employee["reportsTo"] or employee["id"]
+            for _ in range(rng.randint(0, 6)):
+                from_day = start + timedelta(days=rng.randint(0, 300))
+                self._add_request(employee["id"], approver, rng.choice(["LEAVE", "WFH"]), from_day,
+                                  from_day + timedelta(days=rng.randint(0, 3)),
+                                  rng.choice(["PENDING", "APPROVED", "REJECTED"]))
+
+        self.attendance = {}
+        for employee in self.employees.values():
+            days = self.attendance.setdefault(employee["id"], {})
+            for offset in range(300):
+                if rng.random() < 0.7:
+                    days[(start + timedelta(days=offset)).isoformat()] = rng.choice(["PRESENT", "PRESENT", "WFH", "ABSENT"])
+
+    def managers(self):
+        return [employee for employee in self.employees.values() if employee["reportsTo"] is None]
+
+    def _add_request(self, emp_id, approver_id, request_type, from_day, to_day, status="PENDING"):
+        request_id = len(self.requests) + 1
+        self.requests[request_id] = {
+            "id": request_id,
+            "requestType": request_type,
+            "fromDate": str(from_day),
+            "toDate": str(to_day),
+            "requestStatus": status,
+            "requesterEmpId": emp_id,
+            "approverEmpId": approver_id,
+        }
+        return request_id
+
+    def route(self, method, path, query, body):
+        param = lambda name: (query.get(name) or [None])[0]  # noqa: E731
+        parts = path.strip("/").split("/")
+
+        if path == "/employees":
+            employee = self.by_phone.get(param("phone") or "")
+            return (200, [employee]) if employee else (404, {"error": "Employee not found"})
+        if parts[0] == "employees" and len(parts) == 2:
+            employee = self.employees.get(int(parts[1])) if parts[1].isdigit() else None
+            return (200, employee) if employee else (404, {"error": "Employee not found"})
+        if parts[0] == "employees" and len(parts) == 3 and parts[2] == "requests":
+            return 200, self._list_requests(int(parts[1]), param)
+        if len(parts) == 2 and parts[1] == "attendance_by_date":
+            return 200, self.attendance.get(int(parts[0]), {}).get(param("date"), "")
+        if path == "/attendance":
+            data = _json(body)
+            with self._lock:
+                self.attendance.setdefault(int(data["empId"]), {})[data["date"]] = data["status"]
+            return 200, {"success": True}
+        if parts[0] == "attendance" and len(parts) == 2:
+            return 200, {"attendance": self._attendance_between(int(parts[1]), param("from"), param("to"))}
+        if path == "/request-approvals" and method == "POST":
+            data = _json(body)
+            employee = self.employees[int(data["empId"])]
+            with self._lock:
+                request_id = self._add_request(employee["id"], employee["reportsTo"] or employee["id"],
+                                               data["requestType"], data["fromDate"], data["toDate"])
+            return 200, {"success": True, "requestId": request_id}
+        if parts[0] == "request-approvals" and method == "PUT":
+            with self._lock:
+                req = self.requests.get(int(parts[1]))
+                if req is None:
+                    return 404, {"error": "Request not found"}
+                req["requestStatus"] = _json(body)["requestStatus"]
+            return 200, {"success": True}
+        if path == "/get-all-request":
+            req = self.requests.get(int(param("id") or 0))
+            return 200, [dict(req)] if req else []
+        if path == "/query":
+            return 200, self._query(_json(body).get("query", ""))
+        return 404, {"error": f"No stand-in route for {method} {path}"}
+
+    def _list_requests(self, emp_id, param):
+        kind, status = param("type") or "all", param("status")
+        before, limit = param("before"), param("limit")
+        with self._lock:
+            rows = [
+                dict(req) for req in self.requests.values()
+                if ((kind in ("created", "all") and req["requesterEmpId"] == emp_id)
+                    or (kind in ("approval", "all") and req["approverEmpId"] == emp_id))
+                and (not status or req["requestStatus"] == status)
+                and (not param("from") or req["toDate"] >= param("from"))
+                and (not param("to") or req["fromDate"] <= param("to"))
+                and (not before or req["id"] < int(before))
+            ]
+        rows.sort(key=lambda req: req["id"], reverse=True)
+        return rows[:int(limit)] if limit else rows
+
+    def _attendance_between(self, emp_id, from_date, to_date):
+        by_status = {}
+        with self._lock:
+            days = dict(self.attendance.get(emp_id, {}))
+        for day, status in sorted(days.items()):
+            if (not from_date or day >= from_date) and (not to_date or day <= to_date):
+                by_status.setdefault(status, []).append(day)
+        return by_status
+
+    def _query(self, sql):
+        """Just enough SQL for the statements the app sends to the employee table"""
+        lower = sql.lower()
+        if "from employee" not in lower:
+            return []
+        rows = list(self.employees.values())
+        match = re.search(r"\bid\s+in\s*\(([^)]*)\)", lower)
+        if match:
+            ids = {int(value) for value in match.group(1).split(",") if value.strip()}
+            rows = [row for row in rows if row["id"] in ids]
+        match = re.search(r"\bid\s*>\s*(\d+)", lower)
+        if match:
+            rows = [row for row in rows if row["id"] > int(match.group(1))]
+        match = re.search(r"\breportsto\s*=\s*(\d+)", lower)
+        if match:
+            rows = [row for row in rows if row["reportsTo"] == int(match.group(1))]
+        match = re.search(r"like\s*'%([^%']*)%'", lower)
+        if match:
+            rows = [row for row in rows if match.group(1) in row["name"].lower()]
+        return rows
+
+
+def docuseek_route(method, path, query, body):
+    if path != "/query":
+        return 404, {"error": "not found"}
+    question = _json(body).get("question", "")
+    if "SQL expert" in question:
+        return 200, {"answer": "```sql\nSELECT id, name, email, phone FROM employee WHERE level >= 3\n```"}
+    return 200, {"answer": f"Stand-in answer to: {question[:200]}"}
+
+
+def voice_note(seconds=1.5, rate=8000):
+    """A short mono WAV tone standing in for a WhatsApp voice note"""
+    frames = b"".join(
+        struct.pack("<h", int(8000 * math.sin(2 * math.pi * 440 * i / rate)))
+        for i in range(int(seconds * rate))
+    )
+    out = io.BytesIO()
+    with wave.open(out, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(frames)
+    return out.getvalue()
+
+
+class Twilio:
+    """Messages.json for outbound messages, plus voice note media under /media/"""
+
+    def __init__(self):
+        self.sent = 0
+        self._lock = threading.Lock()
+        self.media = voice_note()
+
+    def route(self, method, path, query, body):
+        if path.startswith("/media/"):
+            return 200, self.media
+        if path.endswith("/Messages.json") and method == "POST":
+            form = parse_qs(body.decode("utf-8"))
+            with self._lock:
+                self.sent += 1
+                sid = f"SM{self.sent:032x}"
+            return 201, {
+                "sid": sid,
+                "account_sid": ACCOUNT_SID,
+                "to": (form.get("To") or [""])[0],
+                "from": (form.get("From") or [""])[0],
+                "body": (form.get("Body") or [""])[0],
+                "status": "queued",
+                "num_media": str(len(form.get("MediaUrl") or [])),
+            }
+        return 404, {"error": "not found"}
+
+
+class Tmpfiles:
+    def __init__(self):
+        self.url = ""
+        self.uploads = 0
+        self._lock = threading.Lock()
+
+    def route(self, method, path, query, body):
+        if path == "/api/v1/upload":
+            with self._lock:
+                self.uploads += 1
+                upload = self.uploads
+            return 200, {"status": "success", "data": {"url": f"{self.url}/dl/{upload}/reply.mpeg"}}
+        if path.startswith("/dl/"):
+            return 200, b"ID3"
+        return 404, {"error": "not found"}
+
+
+class StandIns:
+    """
+    All stand-ins together, started and stopped as one
+
+    Args:
+        latency: Seconds of injected latency per service name, with a
+                 "default" entry for services not listed
+        jitter: Extra random seconds per response, up to this much
+        employees: Number of employees in the fake backend
+    """
+
+    def __init__(self, latency=None, jitter=0.0, employees=200):
+        latency = latency or {}
+        default = latency.get("default", 0.0)
+        self.backend = Backend(employees)
+        self.twilio = Twilio()
+        self.tmpfiles = Tmpfiles()
+        self.servers = {
+            "backend": StandIn("backend", self.backend.route, latency.get("backend", default), jitter),
+            "docuseek": StandIn("docuseek", docuseek_route, latency.get("docuseek", default), jitter),
+            "twilio": StandIn("twilio", self.twilio.route, latency.get("twilio", default), jitter),
+            "tmpfiles": StandIn("tmpfiles", self.tmpfiles.route, latency.get("tmpfiles", default), jitter),
+        }
+        self.tmpfiles.url = self.servers["tmpfiles"].url
+
+    def start(self):
+        for server in self.servers.values():
+            server.start()
+        return self
+
+    def stop(self):
+        for server in self.servers.values():
+            server.stop()
+
+    def media_url(self, name="voice-note.ogg"):
+        return f"{self.servers['twilio'].url}/media/{name}"
+
+    def environment(self):
+        """Environment variables that point the app at the stand-ins"""
+        return {
+            "API_URL": self.servers["backend"].url,
+            "DOCUSEEK_URL": self.servers["docuseek"].url,
+            "TWILIO_API_URL": self.servers["twilio"].url,
+            "TMPFILES_URL": self.servers["tmpfiles"].url,
+            "TWILIO_ACCOUNT_SID": ACCOUNT_SID,
+            "TWILIO_AUTH_TOKEN": AUTH_TOKEN,
+            "TWILIO_WHATSAPP_NUMBER": WHATSAPP_NUMBER,
+        }
+
+    def stats(self):
+        stats = {name: {"requests": server.requests, "errors": server.errors} for name, server in self.servers.items()}
+        stats["twilio"]["messages_sent"] = self.twilio.sent
+        stats["tmpfiles"]["uploads"] = self.tmpfiles.uploads
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latency-ms", type=float, default=40, help="injected latency per response")
+    parser.add_argument("--jitter-ms", type=float, default=20, help="extra random latency, up to this much")
+    parser.add_argument("--employees", type=int, default=200)
+    args = parser.parse_args()
+
+    standins = StandIns({"default": args.latency_ms / 1000}, args.jitter_ms / 1000, args.employees).start()
+    for name, value in standins.environment().items():
+        print(f"export {name}={value}")
+    print(f"# voice note media: {standins.media_url()}")
+    print(f"# employee phones: 9000000001 .. 9{args.employees:09d}; managers are 1, 11, 21, ...")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        standins.stop()
+
+
+if __name__ == "__main__":
+    main()
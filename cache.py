@@ -0,0 +1,349 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from async_bridge import Event
+
+# Returned by TTLCache.get on a miss, so that None can be cached as a value
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded in-process cache with per-entry expiry and LRU eviction
+
+    Values are kept for `ttl` seconds (or the ttl passed to set()); once the
+    cache holds `maxsize` entries the least recently used one is evicted.
+    None is a valid cached value, which lets callers negatively cache
+    "not found" results with a shorter ttl. All methods are thread-safe.
+
+    Args:
+        maxsize: Maximum number of entries kept
+        ttl: Default time-to-live in seconds
+        name: Label used in stats
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, name="cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=MISSING):
+        """Return the cached value, or default if absent or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self._removed(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            if value is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._set_locked(key, value, ttl)
+
+    def _set_locked(self, key, value, ttl):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        if key in self._data:
+            self._removed(key)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            evicted, _ = self._data.popitem(last=False)
+            self._removed(evicted)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        """Drop one key; returns True if it was cached"""
+        with self._lock:
+            if self._data.pop(key, None) is None:
+                return False
+            self._removed(key)
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._cleared()
+
+    def _removed(self, key):
+        """Hook for subclasses, called with the lock held when a key leaves the cache"""
+
+    def _cleared(self):
+        """Hook for subclasses, called with the lock held after clear()"""
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class TaggedTTLCache(TTLCache):
+    """
+    TTLCache whose entries carry tags that can be invalidated as a group
+
+    Used for results that depend on several backend tables: each entry is
+    tagged with the tables it read, and a write to a table drops every entry
+    tagged with it. To avoid caching a result that was read before a
+    concurrent write landed, take generation() before reading and pass it
+    to set(); the value is discarded if any invalidation happened since.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, name="cache"):
+        super().__init__(maxsize, ttl, name)
+        self._tags = {}
+        self._keys_by_tag = {}
+        self._generation = 0
+        self.tag_invalidations = 0
+
+    def generation(self):
+        return self._generation
+
+    def set(self, key, value, ttl=None, tags=(), since=None):
+        """Cache value under key with tags; skipped if invalidate_tags ran after generation `since`"""
+        with self._lock:
+            if since is not None and since != self._generation:
+                return False
+            self._set_locked(key, value, ttl)
+            self._tags[key] = frozenset(tags)
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            return True
+
+    def invalidate_tags(self, *tags):
+        """Drop every entry carrying any of tags; returns how many were dropped"""
+        dropped = 0
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    if self._data.pop(key, None) is not None:
+                        dropped += 1
+                    self._removed(key)
+            self.tag_invalidations += dropped
+        return dropped
+
+    def _removed(self, key):
+        for tag in self._tags.pop(key, ()):
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def _cleared(self):
+        self._tags.clear()
+        self._keys_by_tag.clear()
+
+    def stats(self):
+        stats = super().stats()
+        stats["tag_invalidations"] = self.tag_invalidations
+        return stats
+
+
+class SharedTTLCache(TTLCache):
+    """
+    TTLCache kept as JSON files in a directory shared by every worker
+
+    For small per-user state that the user's next message may need in any
+    gunicorn worker. With `directory` set the files are the only copy:
+    set() replaces a key's file atomically, get() reads it back and
+    invalidate() removes it. Values must be JSON-serializable (tuples come
+    back as lists). Expired files are swept on later writes. Without a
+    directory it is a plain in-process TTLCache.
+
+    Args:
+        directory: Shared directory (created if missing), or None
+        maxsize, ttl, name: As for TTLCache
+    """
+
+    SWEEP_SECONDS = 60
+
+    def __init__(self, directory=None, maxsize=1024, ttl=300, name="cache"):
+        super().__init__(maxsize, ttl, name)
+        self.directory = directory
+        self._last_sweep = 0.0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(str(key).encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key, default=MISSING):
+        if not self.directory:
+            return super().get(key, default)
+        try:
+            with open(self._path(key)) as f:
+                expires_at, value = json.load(f)
+        except (OSError, ValueError):
+            self._count("misses")
+            return default
+        if expires_at <= time.time():
+            self._count("expirations")
+            self._count("misses")
+            return default
+        self._count("hits")
+        return value
+
+    def set(self, key, value, ttl=None):
+        if not self.directory:
+            return super().set(key, value, ttl)
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump([expires_at, value], f)
+                os.replace(tmp_path, self._path(key))
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Could not save {self.name} entry: {e}")
+        self._sweep()
+
+    def invalidate(self, key):
+        if not self.directory:
+            return super().invalidate(key)
+        try:
+            os.remove(self._path(key))
+            return True
+        except OSError:
+            return False
+
+    def _sweep(self):
+        """Delete expired files, at most once a minute"""
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep < self.SWEEP_SECONDS:
+                return
+            self._last_sweep = now
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(".json"):
+                        continue
+                    try:
+                        with open(entry.path) as f:
+                            expires_at, _ = json.load(f)
+                        if expires_at <= now:
+                            os.remove(entry.path)
+                    except (OSError, ValueError):
+                        continue
+        except OSError as e:
+            print(f"Could not sweep {self.name}: {e}")
+
+    def _count(self, attr):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def __len__(self):
+        if not self.directory:
+            return super().__len__()
+        try:
+            return sum(1 for name in os.listdir(self.directory) if name.endswith(".json"))
+        except OSError:
+            return 0
+
+    def stats(self):
+        stats = super().stats()
+        stats["size"] = len(self)
+        return stats
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into one
+
+    The first caller for a key runs fn(); callers arriving while it is in
+    flight wait for and share its result (or exception) instead of
+    repeating the work. Thread-safe.
+    """
+
+    def __init__(self, name="singleflight"):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+            }
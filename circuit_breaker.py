@@ -0,0 +1,96 @@
+import threading
+import time
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+# Gauge values for metrics
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose breaker is open"""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} is unavailable (circuit open, retry in {retry_in:.0f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Fail fast while an upstream is unhealthy instead of waiting on it
+
+    After `failures` consecutive failed calls the breaker opens and allow()
+    refuses every call for `reset_timeout` seconds. Then it lets a single
+    probe call through (half-open). A successful probe closes the breaker,
+    and a failed one opens it again for another `reset_timeout`. A probe
+    whose outcome is never recorded frees its slot after `reset_timeout`,
+    so one lost call cannot keep the breaker half-open for good.
+    Thread-safe.
+
+    Args:
+        name: Upstream label used in errors, logs and stats
+        failures: Consecutive failures that open the breaker
+        reset_timeout: Seconds the breaker stays open before probing
+    """
+
+    def __init__(self, name, failures=5, reset_timeout=30.0):
+        self.name = name
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self):
+        """Raise CircuitOpenError unless a call may go through now"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = time.monotonic()
+            retry_in = self._opened_at + self.reset_timeout - now
+            if self.state == OPEN and retry_in <= 0:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and (
+                    not self._probing or now - self._probe_started >= self.reset_timeout):
+                self._probing = True
+                self._probe_started = now
+                return
+            self.rejected += 1
+        raise CircuitOpenError(self.name, max(retry_in, 0.0))
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._probing = False
+            if self.state != CLOSED:
+                print(f"Circuit for {self.name} closed")
+                self.state = CLOSED
+
+    def release(self):
+        """Give back a call's slot without judging the upstream, e.g. when the call failed locally"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            self._probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self._consecutive >= self.failures):
+                print(f"Circuit for {self.name} opened after {self._consecutive} consecutive failures")
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self.opened += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._consecutive,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,209 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class DirectorySnapshot:
+    """
+    Array-backed employee contact records with trigram and token-prefix indexes
+
+    Records are stored column-wise (ids in an array, strings in flat lists)
+    and addressed by row number. Rows are only ever appended, and each
+    append writes the columns before the index entries, so readers running
+    alongside an append see either the old or the new row, never half of it.
+    """
+
+    def __init__(self):
+        self.ids = array("q")
+        self.names = []
+        self.emails = []
+        self.phones = []
+        self._lower = []
+        self._rows_by_id = {}
+        self._trigrams = {}
+        self._tokens = []  # sorted (token, row) pairs for prefix search
+        self.max_id = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, records):
+        snapshot = cls()
+        for record in records:
+            snapshot.add(record, sort_tokens=False)
+        snapshot._tokens.sort()
+        return snapshot
+
+    def add(self, record, sort_tokens=True):
+        emp_id = int(record["id"])
+        if emp_id in self._rows_by_id:
+            return False
+        name = record.get("name") or ""
+        lower = name.lower()
+        row = len(self.ids)
+        self.names.append(name)
+        self.emails.append(record.get("email") or "")
+        self.phones.append(str(record.get("phone") or ""))
+        self._lower.append(lower)
+        self.ids.append(emp_id)
+        self._rows_by_id[emp_id] = row
+        for gram in trigrams(lower):
+            self._trigrams.setdefault(gram, array("I")).append(row)
+        for token in lower.split():
+            if sort_tokens:
+                pair = (token, row)
+                self._tokens.insert(bisect_left(self._tokens, pair), pair)
+            else:
+                self._tokens.append((token, row))
+        self.max_id = max(self.max_id, emp_id)
+        return True
+
+    def record(self, row):
+        return {
+            "id": self.ids[row],
+            "name": self.names[row],
+            "email": self.emails[row],
+            "phone": self.phones[row],
+        }
+
+    def _prefix_rows(self, prefix):
+        rows = set()
+        start = bisect_left(self._tokens, (prefix, -1))
+        for token, row in self._tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            rows.add(row)
+        return rows
+
+    def search(self, query, limit=10):
+        """Case-insensitive substring match on name (the matches LIKE '%query%' would return)"""
+        query = " ".join(query.lower().split())
+        if not query:
+            return []
+
+        if len(query) < 3:
+            # Too short for trigrams: names with a word starting with the
+            # query come first, then any other name containing it
+            rows = sorted(self._prefix_rows(query))
+            if len(rows) < limit:
+                seen = set(rows)
+                for row, lower in enumerate(self._lower):
+                    if query in lower and row not in seen:
+                        rows.append(row)
+                        if len(rows) >= limit:
+                            break
+            return [self.record(row) for row in rows[:limit]]
+
+        postings = []
+        for gram in trigrams(query):
+            posting = self._trigrams.get(gram)
+            if posting is None:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return []
+
+        rows = sorted(row for row in candidates if row < len(self._lower) and query in self._lower[row])
+        return [self.record(row) for row in rows[:limit]]
+
+
+class DirectoryIndex:
+    """
+    Local employee directory kept fresh by a background thread
+
+    `load_all()` returns every employee row and `load_since(max_id)` returns
+    rows with a larger id. The refresher appends new rows every
+    `delta_interval` seconds and rebuilds the whole snapshot (to pick up
+    edits and leavers) every `full_interval` seconds, swapping it in
+    atomically. search() returns None until the first snapshot is loaded.
+
+    Args:
+        load_all: Callable returning a list of {id, name, email, phone} dicts
+        load_since: Callable taking a max id and returning newer rows
+        full_interval: Seconds between full rebuilds
+        delta_interval: Seconds between incremental refreshes
+    """
+
+    def __init__(self, load_all, load_since, full_interval=600, delta_interval=60):
+        self.load_all = load_all
+        self.load_since = load_since
+        self.full_interval = full_interval
+        self.delta_interval = delta_interval
+        self.snapshot = None
+        self.loaded_at = None
+        self.full_refreshes = 0
+        self.delta_refreshes = 0
+        self.refresh_errors = 0
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="directory-refresh", daemon=True)
+                self._thread.start()
+
+    def refresh(self, full=False):
+        """Refresh now; a full rebuild if requested or nothing is loaded yet"""
+        if full or self.snapshot is None:
+            rows = self.load_all()
+            if rows is None:
+                raise RuntimeError("employee snapshot unavailable")
+            self.snapshot = DirectorySnapshot.build(rows)
+            self.full_refreshes += 1
+        else:
+            rows = self.load_since(self.snapshot.max_id)
+            if rows is None:
+                raise RuntimeError("employee delta unavailable")
+            for record in rows:
+                self.snapshot.add(record)
+            self.delta_refreshes += 1
+        self.loaded_at = time.time()
+
+    def invalidate(self):
+        """Ask the refresher for a full rebuild as soon as possible"""
+        self._wake.set()
+
+    def _run(self):
+        last_full = None
+        while True:
+            full = (self._wake.is_set() or last_full is None
+                    or time.monotonic() - last_full >= self.full_interval)
+            self._wake.clear()
+            try:
+                self.refresh(full=full)
+                if full:
+                    last_full = time.monotonic()
+            except Exception as e:
+                self.refresh_errors += 1
+                print(f"Directory refresh failed: {e}")
+            self._wake.wait(self.delta_interval if self.snapshot is not None else min(self.delta_interval, 10))
+
+    def search(self, name, limit=10):
+        self.start()
+        snapshot = self.snapshot
+        if snapshot is None:
+            return None
+        return snapshot.search(name, limit)
+
+    def stats(self):
+        snapshot = self.snapshot
+        return {
+            "records": len(snapshot) if snapshot is not None else 0,
+            "loaded": snapshot is not None,
+            "age_seconds": round(time.time() - self.loaded_at, 1) if self.loaded_at else None,
+            "full_refreshes": self.full_refreshes,
+            "delta_refreshes": self.delta_refreshes,
+            "refresh_errors": self.refresh_errors,
+        }
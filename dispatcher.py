@@ -0,0 +1,291 @@
+import heapq
+import itertools
+import queue
+import random
+import threading
+import time
+
+# Twilio rejects WhatsApp bodies longer than this
+MAX_BODY_LENGTH = 1600
+
+
+def split_body(body, limit=MAX_BODY_LENGTH):
+    """
+    Split text into parts of at most `limit` characters
+
+    Cuts at the last paragraph break in the second half of the window, else
+    at the last line break, else at the last space, and only mid-word when
+    a single word is too long.
+    """
+    parts = []
+    while len(body) > limit:
+        cut = body.rfind("\n\n", 0, limit + 1)
+        if cut < limit // 2:
+            cut = body.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = body.rfind(" ", 0, limit + 1)
+        if cut <= 0:
+            parts.append(body[:limit])
+            body = body[limit:]
+            continue
+        parts.append(body[:cut].rstrip())
+        body = body[cut + 1:] if body[cut] == " " else body[cut:].lstrip("\n")
+    parts.append(body)
+    return parts
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, at most `burst` saved up"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available; returns the seconds spent waiting"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class OutboundMessage:
+    __slots__ = ("to", "body", "media_url", "context", "enqueued_at", "attempts")
+
+    def __init__(self, to, body=None, media_url=None, context=None):
+        self.to = to
+        self.body = body
+        self.media_url = media_url
+        self.context = context
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+
+def is_retryable(exc):
+    """Retry throttling, server errors and transport failures; give up on other 4xx"""
+    status = getattr(exc, "status", None)
+    if status is None:
+        return True
+    return status == 429 or status >= 500
+
+
+class OutboundDispatcher:
+    """
+    Bounded outbound message queue drained by worker threads
+
+    enqueue() never blocks. Workers pull up to `batch_size` queued messages
+    at a time, coalesce consecutive text messages to the same recipient into
+    one body (within Twilio's length limit), split bodies over the limit into
+    several messages sent in order, wait on a shared token bucket so
+    the sending number stays under its throughput limit, and retry failed
+    sends with exponential backoff and jitter.
+
+    A failed send does not hold its worker while it backs off: the unsent
+    parts are parked with a due time and the next free worker picks them up
+    once it has passed, ahead of newly queued messages.
+
+    Args:
+        send: Callable taking an OutboundMessage and delivering it
+        workers: Number of worker threads
+        maxsize: Maximum number of queued messages
+        rate: Messages per second allowed for the sending number
+        burst: Messages that may be sent back to back after idling
+        max_retries: Retries per message after the first attempt
+        backoff: Base delay in seconds, doubled after every failed attempt
+        batch_size: Messages taken from the queue per worker wake-up
+    """
+
+    def __init__(self, send, workers=2, maxsize=500, rate=10.0, burst=10,
+                 max_retries=4, backoff=0.5, batch_size=10):
+        self.send = send
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.bucket = TokenBucket(rate, burst)
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        # (due, seq, parts) waiting for their next attempt, soonest first
+        self._retries = []
+        self._retry_seq = itertools.count()
+        self._retry_lock = threading.Lock()
+        # Parked retries plus ones a worker is currently sending
+        self._retries_unfinished = 0
+        self.enqueued = 0
+        self.dropped = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.split = 0
+        self.retries = 0
+        self.failed = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.throttled_seconds = 0.0
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"outbound-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def enqueue(self, to, body=None, media_url=None, context=None):
+        """Queue a message for delivery; returns False (and drops it) if the queue is full"""
+        if not self._threads:
+            self._start()
+        try:
+            self._queue.put_nowait(OutboundMessage(to, body, media_url, context))
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            print(f"Outbound queue full, dropped message to {to}")
+            return False
+        with self._stats_lock:
+            self.enqueued += 1
+        return True
+
+    def _take_batch(self):
+        """Queued messages, or [] when a parked retry may have come due first"""
+        with self._retry_lock:
+            # Wake up at least every `backoff` seconds while retries are parked,
+            # in case another worker parked one due sooner
+            timeout = min(self._retries[0][0] - time.monotonic(), self.backoff) if self._retries else None
+        try:
+            batch = [self._queue.get(timeout=None if timeout is None else max(timeout, 0.001))]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _take_retry(self):
+        """The parts of the earliest parked retry if it is due, else None"""
+        with self._retry_lock:
+            if self._retries and self._retries[0][0] <= time.monotonic():
+                return heapq.heappop(self._retries)[2]
+        return None
+
+    def _park(self, parts, delay):
+        with self._retry_lock:
+            heapq.heappush(self._retries, (time.monotonic() + delay, next(self._retry_seq), parts))
+            self._retries_unfinished += 1
+
+    def _coalesce(self, batch):
+        merged = []
+        for message in batch:
+            previous = merged[-1] if merged else None
+            if (previous is not None and previous.to == message.to
+                    and previous.context is message.context
+                    and not previous.media_url and not message.media_url
+                    and len(previous.body or "") + len(message.body or "") + 2 <= MAX_BODY_LENGTH):
+                previous.body = f"{previous.body}\n\n{message.body}"
+                with self._stats_lock:
+                    self.coalesced += 1
+                continue
+            merged.append(message)
+        return merged
+
+    def _split(self, message):
+        if not message.body or len(message.body) <= MAX_BODY_LENGTH:
+            return [message]
+        parts = []
+        for i, body in enumerate(split_body(message.body)):
+            part = OutboundMessage(message.to, body, message.media_url if i == 0 else None, message.context)
+            part.enqueued_at = message.enqueued_at
+            parts.append(part)
+        with self._stats_lock:
+            self.split += len(parts) - 1
+        return parts
+
+    def _worker(self):
+        while True:
+            parts = self._take_retry()
+            if parts is not None:
+                try:
+                    self._deliver(parts)
+                finally:
+                    with self._retry_lock:
+                        self._retries_unfinished -= 1
+                continue
+            batch = self._take_batch()
+            try:
+                for message in self._coalesce(batch):
+                    self._deliver(self._split(message))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _deliver(self, parts):
+        """Send parts in order; on a retryable failure park the unsent ones, so they still arrive in order"""
+        for i, message in enumerate(parts):
+            waited = self.bucket.acquire()
+            message.attempts += 1
+            try:
+                self.send(message)
+            except Exception as e:
+                if message.attempts > self.max_retries or not is_retryable(e):
+                    with self._stats_lock:
+                        self.failed += 1
+                        self.throttled_seconds += waited
+                    print(f"Failed to send message to {message.to} after {message.attempts} attempts: {e}")
+                    continue
+                delay = self.backoff * (2 ** (message.attempts - 1))
+                delay += random.uniform(0, delay / 2)
+                with self._stats_lock:
+                    self.retries += 1
+                    self.throttled_seconds += waited
+                print(f"Send to {message.to} failed ({e}), retrying in {delay:.2f}s")
+                self._park(parts[i:], delay)
+                return
+
+            latency = time.monotonic() - message.enqueued_at
+            with self._stats_lock:
+                self.sent += 1
+                self.throttled_seconds += waited
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+
+    def flush(self, timeout=None):
+        """Wait until every queued message, retries included, has been handled; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks or self._retries_unfinished:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "workers": self.workers,
+                "depth": self._queue.qsize(),
+                "retry_parked": len(self._retries),
+                "enqueued": self.enqueued,
+                "dropped": self.dropped,
+                "sent": self.sent,
+                "coalesced": self.coalesced,
+                "split": self.split,
+                "retries": self.retries,
+                "failed": self.failed,
+                "avg_latency_ms": round(self.total_latency / self.sent * 1000, 2) if self.sent else 0.0,
+                "max_latency_ms": round(self.max_latency * 1000, 2),
+                "throttled_seconds": round(self.throttled_seconds, 3),
+            }
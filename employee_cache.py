@@ -0,0 +1,79 @@
+from cache import MISSING, TTLCache
+
+
+class EmployeeCache:
+    """
+    Employee records cached by id, with a phone-number index on top
+
+    Records live in one id-keyed store; the phone index only keeps the ids a
+    number resolves to, so a record fetched by phone is also a hit for a
+    later lookup by id (and vice versa) and invalidating an id drops it for
+    both paths.
+
+    Args:
+        maxsize: Maximum number of records (and phone index entries) kept
+        ttl: Seconds a record stays cached
+        negative_ttl: Seconds an unknown phone number stays cached
+    """
+
+    def __init__(self, maxsize=2048, ttl=300, negative_ttl=60):
+        self.negative_ttl = negative_ttl
+        self.records = TTLCache(maxsize, ttl, name="employee_by_id")
+        self.phones = TTLCache(maxsize, ttl, name="employee_by_phone")
+
+    def get(self, emp_id):
+        """Return the cached record for emp_id, or MISSING"""
+        return self.records.get(str(emp_id))
+
+    def get_many(self, emp_ids):
+        """Return ({id: record} for cached ids, [ids that missed])"""
+        found, missing = {}, []
+        for emp_id in emp_ids:
+            record = self.get(emp_id)
+            if record is MISSING:
+                missing.append(emp_id)
+            else:
+                found[emp_id] = record
+        return found, missing
+
+    def put(self, record):
+        if record and record.get("id") is not None:
+            self.records.set(str(record["id"]), record)
+
+    def get_by_phone(self, phone):
+        """Return the cached list of records for phone, None if known to be unknown, or MISSING"""
+        ids = self.phones.get(phone)
+        if ids is MISSING or ids is None:
+            return ids
+        records = [self.get(emp_id) for emp_id in ids]
+        if any(record is MISSING for record in records):
+            # A record expired or was invalidated; resolve the number again
+            self.phones.invalidate(phone)
+            return MISSING
+        return records
+
+    def put_phone(self, phone, employees):
+        """Cache the backend answer for phone; an empty answer is cached negatively"""
+        if not employees:
+            self.phones.set(phone, None, ttl=self.negative_ttl)
+            return
+        for record in employees:
+            self.put(record)
+        self.phones.set(phone, tuple(str(record.get("id")) for record in employees))
+
+    def invalidate(self, emp_id=None, phone=None):
+        """Drop one id and/or phone number, or everything when neither is given"""
+        if emp_id is None and phone is None:
+            self.records.clear()
+            self.phones.clear()
+            return
+        if emp_id is not None:
+            self.records.invalidate(str(emp_id))
+        if phone is not None:
+            self.phones.invalidate(phone)
+
+    def stats(self):
+        return {
+            "by_id": self.records.stats(),
+            "by_phone": self.phones.stats(),
+        }
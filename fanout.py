@@ -0,0 +1,191 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from async_bridge import await_only, in_async_context, spawn
+
+
+class Outcome:
+    """Result of one call in a gather(): value on success, error (an exception) otherwise"""
+
+    __slots__ = ("value", "error", "elapsed")
+
+    def __init__(self, value=None, error=None, elapsed=0.0):
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class QueueTimeout(TimeoutError):
+    """A call that never got a pool thread before its timeout; unlike a plain timeout it was not sent"""
+
+
+class _Start:
+    """Set by a pool call when it starts running, so its deadline excludes time spent queued"""
+
+    __slots__ = ("event", "at")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.at = 0.0
+
+    def mark(self):
+        self.at = time.monotonic()
+        self.event.set()
+
+
+class FanOut:
+    """
+    Run independent blocking calls concurrently on a shared thread pool
+
+    gather() starts every call at once and waits for all of them, so a turn
+    takes as long as its slowest call instead of the sum. Each call has its
+    own deadline and its own Outcome: an exception or timeout in one call
+    does not affect the others. A timed-out call cannot be interrupted; it
+    finishes in the background and its result is discarded. The pool is
+    created on first use so each gunicorn worker builds its own after fork.
+
+    A call's deadline counts from when it starts running, so time spent
+    queued behind a busy pool is not charged to it. The queue wait has the
+    same cap: a call still unstarted once its timeout has passed is
+    dropped unsent with a QueueTimeout, so a gather() takes at most twice
+    its longest timeout. On the event loop (async serving mode) calls run
+    as greenlets that all start at once, so there is no queue wait and
+    deadlines count from the gather().
+
+    Args:
+        name: Label used in thread names and stats
+        workers: Maximum number of pool threads
+        timeout: Default per-call timeout in seconds
+    """
+
+    def __init__(self, name="fanout", workers=16, timeout=20.0):
+        self.name = name
+        self.workers = workers
+        self.timeout = timeout
+        self._pool = None
+        self._lock = threading.Lock()
+        self.gathers = 0
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.total_wall = 0.0
+        self.total_sequential = 0.0
+
+    def _executor(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+        return self._pool
+
+    def gather(self, *calls, timeout=None):
+        """
+        Run calls concurrently and wait for all of them
+
+        Args:
+            calls: Zero-argument callables, or (callable, timeout) pairs for
+                   a call that needs its own deadline
+            timeout: Deadline in seconds for calls without one (defaults to
+                     the instance timeout)
+
+        Returns:
+            List of Outcome in the same order as calls
+        """
+        default_timeout = self.timeout if timeout is None else timeout
+        calls = [call if isinstance(call, tuple) else (call, default_timeout) for call in calls]
+        started = time.monotonic()
+        if in_async_context():
+            results = await_only(self._gather_on_loop(calls))
+        else:
+            results = self._gather_on_pool(calls)
+
+        outcomes = []
+        errors = timeouts = 0
+        for outcome in results:
+            if outcome is None:
+                outcome = Outcome(error=TimeoutError("call timed out"), elapsed=time.monotonic() - started)
+            if isinstance(outcome.error, TimeoutError):
+                timeouts += 1
+            if outcome.error is not None:
+                errors += 1
+                print(f"[{self.name}] call failed: {outcome.error!r}")
+            outcomes.append(outcome)
+
+        wall = time.monotonic() - started
+        with self._lock:
+            self.gathers += 1
+            self.calls += len(calls)
+            self.errors += errors
+            self.timeouts += timeouts
+            self.total_wall += wall
+            self.total_sequential += sum(outcome.elapsed for outcome in outcomes)
+        return outcomes
+
+    def _gather_on_pool(self, calls):
+        """Outcome per call, or None for a call that missed its deadline"""
+        pool = self._executor()
+        queued_at = time.monotonic()
+        pending = []
+        for fn, call_timeout in calls:
+            start = _Start()
+            pending.append((pool.submit(self._timed, fn, start), start, call_timeout))
+        results = []
+        for future, start, call_timeout in pending:
+            if not start.event.wait(max(0.0, queued_at + call_timeout - time.monotonic())) and future.cancel():
+                results.append(Outcome(error=QueueTimeout("call not started"), elapsed=0.0))
+                continue
+            start.event.wait()  # cancel() lost the race: the call has just started
+            try:
+                results.append(future.result(timeout=max(0.0, start.at + call_timeout - time.monotonic())))
+            except FutureTimeout:
+                results.append(None)
+        return results
+
+    async def _gather_on_loop(self, calls):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        tasks = [asyncio.ensure_future(spawn(self._timed, fn)) for fn, _ in calls]
+        results = []
+        for task, (_, call_timeout) in zip(tasks, calls):
+            done, _ = await asyncio.wait({task}, timeout=max(0.0, started + call_timeout - loop.time()))
+            results.append(task.result() if done else None)
+        return results
+
+    def map(self, fn, items, concurrency=None, timeout=None):
+        """gather() fn(item) for every item, at most `concurrency` at a time; Outcomes in item order"""
+        items = list(items)
+        step = concurrency or len(items) or 1
+        outcomes = []
+        for start in range(0, len(items), step):
+            chunk = items[start:start + step]
+            outcomes.extend(self.gather(*[lambda item=item: fn(item) for item in chunk], timeout=timeout))
+        return outcomes
+
+    @staticmethod
+    def _timed(fn, start=None):
+        if start is not None:
+            start.mark()
+        started = time.monotonic()
+        try:
+            return Outcome(value=fn(), elapsed=time.monotonic() - started)
+        except Exception as e:
+            return Outcome(error=e, elapsed=time.monotonic() - started)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "gathers": self.gathers,
+                "calls": self.calls,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "avg_wall_ms": round(self.total_wall / self.gathers * 1000, 2) if self.gathers else 0.0,
+                # Time the same calls would have taken one after another, minus what they took together
+                "saved_ms": round((self.total_sequential - self.total_wall) * 1000, 2),
+            }
@@ -0,0 +1,321 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from async_bridge import Event, sleep
+from cache import MISSING, TTLCache
+
+
+class _Delivery:
+    __slots__ = ("done", "response", "error")
+
+    def __init__(self):
+        self.done = Event()
+        self.response = None
+        self.error = None
+
+
+class MessageLedger:
+    """
+    Run the webhook at most once per Twilio MessageSid within a time window
+
+    Twilio retries a webhook whose reply was slow, with the same MessageSid.
+    run() runs the pipeline for the first delivery and keeps its response.
+    A duplicate that arrives later gets the kept response back. A duplicate
+    that arrives while the first delivery is still being processed waits for
+    it instead of processing the message again.
+
+    Responses are kept in memory, bounded by `maxsize`. When `directory` is
+    set they are also written there, so every gunicorn worker on the host
+    sees them. Ownership of a message is claimed across workers by creating
+    <key>.claim with O_EXCL. While the message runs its claim is touched
+    every claim_ttl / 4 seconds, so a claim older than `claim_ttl` belongs
+    to a worker that died mid-message and can be taken over, however long a
+    live turn takes. If the first delivery raises, its claim is released
+    and the next delivery processes the message again.
+
+    A duplicate that gives up waiting leaves a late marker. Whichever of it
+    and the first delivery finishes second (claimed atomically by removing
+    the marker) hands the response to `on_late`, so a reply whose TwiML went
+    to a connection Twilio already dropped is still delivered, exactly once.
+
+    Args:
+        directory: Shared directory for claims and responses, or None for
+                   this process only
+        maxsize: Maximum number of responses kept in memory
+        window: Seconds a response is replayed to duplicates
+        wait: Seconds a duplicate waits for an in-progress first delivery
+        claim_ttl: Seconds after which an unfinished claim is abandoned
+    """
+
+    POLL_SECONDS = 0.05
+    SWEEP_SECONDS = 60
+
+    def __init__(self, directory=None, maxsize=10000, window=3600, wait=15, claim_ttl=120):
+        self.directory = directory
+        self.window = window
+        self.wait = wait
+        self.claim_ttl = claim_ttl
+        self.responses = TTLCache(maxsize, window, name="webhook_replies")
+        self._inflight = {}
+        self._late = set()
+        self._held = set()
+        self._heartbeat = None
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self.processed = 0
+        self.replayed = 0
+        self.waited = 0
+        self.timed_out = 0
+        self.sent_late = 0
+        self.failed = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def run(self, sid, fn, on_late=None):
+        """
+        Return fn()'s response for message sid, running fn at most once
+
+        Args:
+            sid: Twilio MessageSid; fn is simply called when it is empty
+            fn: Zero-argument callable returning a JSON-serializable response
+            on_late: Called with the response when it is ready after a
+                     duplicate gave up waiting for it (optional)
+
+        Returns:
+            The response, or None if a duplicate gave up waiting for the
+            first delivery to finish
+        """
+        if not sid:
+            return fn()
+
+        response = self.responses.get(sid)
+        if response is not MISSING:
+            self._count("replayed")
+            return response
+
+        with self._lock:
+            delivery = self._inflight.get(sid)
+            leader = delivery is None
+            if leader:
+                delivery = self._inflight[sid] = _Delivery()
+
+        key = hashlib.sha256(sid.encode("utf-8")).hexdigest()
+        if not leader:
+            # Same message already being handled by another request in this worker
+            self._count("waited")
+            if not delivery.done.wait(self.wait):
+                return self._give_up(sid, key)
+            if delivery.error is not None:
+                raise delivery.error
+            return delivery.response
+
+        try:
+            delivery.response = self._run(sid, key, fn, on_late)
+            return delivery.response
+        except Exception as e:
+            delivery.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[sid]
+            delivery.done.set()
+
+    def _run(self, sid, key, fn, on_late):
+        """Claim sid across workers and run fn, or wait for the worker that holds the claim"""
+        deadline = time.monotonic() + self.wait
+        waiting = False
+        while True:
+            response = self._load(key)
+            if response is not MISSING:
+                self.responses.set(sid, response)
+                self._count("waited" if waiting else "replayed")
+                return response
+
+            if self._claim(key):
+                self._hold(key)
+                try:
+                    response = fn()
+                except Exception:
+                    self._count("failed")
+                    self._unhold(key)
+                    self._release(key)
+                    raise
+                self._unhold(key)
+                self.responses.set(sid, response)
+                self._save(key, response)
+                self._count("processed")
+                if self._take_late(key) and on_late is not None:
+                    self._count("sent_late")
+                    on_late(response)
+                return response
+
+            if time.monotonic() >= deadline:
+                return self._give_up(sid, key)
+            waiting = True
+            sleep(self.POLL_SECONDS)
+
+    def _give_up(self, sid, key):
+        """Leave a late marker for the first delivery; returns its response if that already finished"""
+        self._count("timed_out")
+        self._mark_late(key)
+        response = self.responses.get(sid)
+        if response is MISSING:
+            response = self._load(key)
+        if response is not MISSING and self._take_late(key):
+            # Finished while the marker was being left; answer this delivery instead
+            return response
+        return None
+
+    def _mark_late(self, key):
+        if not self.directory:
+            with self._lock:
+                self._late.add(key)
+            return
+        try:
+            os.close(os.open(self._path(key, "late"), os.O_CREAT | os.O_WRONLY))
+        except OSError as e:
+            print(f"Could not mark webhook {key[:12]} late: {e}")
+
+    def _take_late(self, key):
+        """True for exactly one caller once a late marker exists"""
+        if not self.directory:
+            with self._lock:
+                if key not in self._late:
+                    return False
+                self._late.discard(key)
+                return True
+        try:
+            os.remove(self._path(key, "late"))
+            return True
+        except OSError:
+            return False
+
+    def _hold(self, key):
+        """Keep touching key's claim until _unhold, so a live but slow turn never looks abandoned"""
+        if not self.directory:
+            return
+        with self._lock:
+            self._held.add(key)
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._touch_claims, name="webhook-claims", daemon=True)
+                self._heartbeat.start()
+
+    def _unhold(self, key):
+        with self._lock:
+            self._held.discard(key)
+
+    def _touch_claims(self):
+        while True:
+            time.sleep(self.claim_ttl / 4)
+            with self._lock:
+                held = list(self._held)
+            for key in held:
+                try:
+                    os.utime(self._path(key, "claim"))
+                except OSError:
+                    pass
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, f"{key}.{ext}")
+
+    def _load(self, key):
+        if not self.directory:
+            return MISSING
+        path = self._path(key, "json")
+        try:
+            if time.time() - os.stat(path).st_mtime > self.window:
+                return MISSING
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return MISSING
+
+    def _claim(self, key):
+        if not self.directory:
+            return True
+        path = self._path(key, "claim")
+        for _ in range(2):
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.stat(path).st_mtime <= self.claim_ttl:
+                        return False
+                    os.remove(path)
+                    print(f"Taking over abandoned webhook claim {key[:12]}")
+                except OSError:
+                    pass
+        return False
+
+    def _release(self, key):
+        if self.directory:
+            try:
+                os.remove(self._path(key, "claim"))
+            except OSError:
+                pass
+
+    def _save(self, key, response):
+        if not self.directory:
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(response, f)
+                os.replace(tmp_path, self._path(key, "json"))
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        except (OSError, TypeError, ValueError) as e:
+            # Still replayed by this worker from memory
+            print(f"Could not save webhook response: {e}")
+        self._release(key)
+        self._sweep()
+
+    def _sweep(self):
+        """Delete responses and late markers older than the window and claims older than claim_ttl, at most once a minute"""
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep < self.SWEEP_SECONDS:
+                return
+            self._last_sweep = now
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith((".json", ".late")):
+                        limit = self.window
+                    elif entry.name.endswith(".claim"):
+                        limit = self.claim_ttl
+                    else:
+                        continue
+                    try:
+                        if now - entry.stat().st_mtime > limit:
+                            os.remove(entry.path)
+                    except OSError:
+                        continue
+        except OSError as e:
+            print(f"Could not sweep webhook responses: {e}")
+
+    def _count(self, attr):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "in_flight": len(self._inflight),
+                "processed": self.processed,
+                "replayed": self.replayed,
+                "waited": self.waited,
+                "timed_out": self.timed_out,
+                "sent_late": self.sent_late,
+                "failed": self.failed,
+            }
+        stats["kept"] = len(self.responses)
+        return stats
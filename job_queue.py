@@ -0,0 +1,114 @@
+import queue
+import threading
+import time
+import traceback
+
+
+class JobQueue:
+    """
+    Bounded queue of callables drained by a pool of daemon worker threads
+
+    submit() never blocks: when `maxsize` jobs are already waiting it returns
+    False and the caller decides how to apply backpressure. Workers start
+    lazily on the first submit so that each gunicorn worker process gets its
+    own threads after fork. Every job records how long it waited in the queue
+    and how long it ran.
+
+    Args:
+        name: Label used in logs and stats
+        workers: Number of worker threads
+        maxsize: Maximum number of queued (not yet running) jobs
+    """
+
+    def __init__(self, name, workers=4, maxsize=100):
+        self.name = name
+        self.workers = workers
+        self.maxsize = maxsize
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+        self.max_wait = 0.0
+        self.max_run = 0.0
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs); returns False if the queue is full"""
+        if not self._threads:
+            self._start()
+        try:
+            self._queue.put_nowait((time.monotonic(), fn, args, kwargs))
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            return False
+        with self._stats_lock:
+            self.submitted += 1
+        return True
+
+    def _worker(self):
+        while True:
+            enqueued_at, fn, args, kwargs = self._queue.get()
+            started_at = time.monotonic()
+            with self._stats_lock:
+                self.running += 1
+            ok = True
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                ok = False
+                print(f"[{self.name}] job {getattr(fn, '__name__', fn)} failed: {e}")
+                traceback.print_exc()
+            finally:
+                finished_at = time.monotonic()
+                self._record(started_at - enqueued_at, finished_at - started_at, ok)
+                self._queue.task_done()
+
+    def _record(self, wait, run, ok):
+        with self._stats_lock:
+            self.running -= 1
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+            self.total_wait += wait
+            self.total_run += run
+            self.max_wait = max(self.max_wait, wait)
+            self.max_run = max(self.max_run, run)
+        print(f"[{self.name}] job done ok={ok} wait={wait * 1000:.1f}ms run={run * 1000:.1f}ms")
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._stats_lock:
+            finished = self.completed + self.failed
+            return {
+                "workers": self.workers,
+                "depth": self._queue.qsize(),
+                "maxsize": self.maxsize,
+                "running": self.running,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_ms": round(self.total_wait / finished * 1000, 2) if finished else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+                "avg_run_ms": round(self.total_run / finished * 1000, 2) if finished else 0.0,
+                "max_run_ms": round(self.max_run * 1000, 2),
+            }
@@ -1,15 +1,35 @@
+import time
+
+# Start of the module import, reported by /healthz
+_import_started = time.perf_counter()
+
+import hashlib
 import re
-from datetime import datetime
+import threading
+from datetime import date, datetime, timedelta
 import requests
-import speech_recognition as sr
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, send_file
 from flask_cors import CORS
-from pydub import AudioSegment
 from twilio.twiml.messaging_response import MessagingResponse
 from dotenv import load_dotenv
 import os
-from gtts import gTTS
-from twilio.rest import Client
+import tempfile
+import voice
+import async_bridge
+from backend_client import BackendClient, pool_stats, resilience_stats
+from cache import MISSING, SharedTTLCache, SingleFlight, TaggedTTLCache, TTLCache
+from attendance_calendar import AttendanceCalendarCache, format_calendar
+from circuit_breaker import STATE_VALUES, CircuitBreaker, CircuitOpenError
+from directory import DirectoryIndex
+from dispatcher import OutboundDispatcher, split_body
+from employee_cache import EmployeeCache
+from fanout import FanOut, QueueTimeout
+from idempotency import MessageLedger
+from job_queue import JobQueue
+from media_store import MediaStore
+import metrics
+from router import CommandContext, CommandRouter, Message
+from tts_cache import TTSCache
 
 # Load environment variables
 load_dotenv()
@@ -17,6 +37,96 @@ TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_WHATSAPP_NUMBER = os.getenv("TWILIO_WHATSAPP_NUMBER")
 API_URL = os.getenv("API_URL")
+BACKEND_API_KEY = os.getenv("BACKEND_API_KEY", "abcdef")
+DOCUSEEK_URL = os.getenv("DOCUSEEK_URL", "https://information-retrieval-service.onrender.com")
+# Bearer token for GET /metrics; without one it takes the x-api-key header like /stats
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Overridable so the app can run against local stand-ins (see bench/load_test.py)
+TWILIO_API_URL = os.getenv("TWILIO_API_URL")
+TMPFILES_URL = os.getenv("TMPFILES_URL", "https://tmpfiles.org")
+EMPLOYEE_CACHE_SIZE = int(os.getenv("EMPLOYEE_CACHE_SIZE", 2048))
+EMPLOYEE_CACHE_TTL = float(os.getenv("EMPLOYEE_CACHE_TTL", 300))
+EMPLOYEE_NEGATIVE_TTL = float(os.getenv("EMPLOYEE_NEGATIVE_TTL", 60))
+# Async webhook mode: acknowledge Twilio at once and reply through the REST API from worker threads
+WEBHOOK_ASYNC = os.getenv("WEBHOOK_ASYNC", "0") == "1"
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 4))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 100))
+# Twilio retries of the same MessageSid are answered from the first delivery's reply
+WEBHOOK_DEDUP_DIR = os.getenv("WEBHOOK_DEDUP_DIR", os.path.join(tempfile.gettempdir(), "chat-engine-webhooks"))
+WEBHOOK_DEDUP_SIZE = int(os.getenv("WEBHOOK_DEDUP_SIZE", 10000))
+WEBHOOK_DEDUP_WINDOW = float(os.getenv("WEBHOOK_DEDUP_WINDOW", 3600))
+WEBHOOK_DEDUP_WAIT = float(os.getenv("WEBHOOK_DEDUP_WAIT", 15))
+# Independent backend calls made concurrently within one turn
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", 16))
+FANOUT_TIMEOUT = float(os.getenv("FANOUT_TIMEOUT", 20))
+# Attendance marked over a date range or for a team
+ATTENDANCE_BULK_MAX_DAYS = int(os.getenv("ATTENDANCE_BULK_MAX_DAYS", 31))
+ATTENDANCE_BULK_MAX_ENTRIES = int(os.getenv("ATTENDANCE_BULK_MAX_ENTRIES", 100))
+ATTENDANCE_BULK_CONCURRENCY = int(os.getenv("ATTENDANCE_BULK_CONCURRENCY", 8))
+# Request status updates sent in parallel by "accept all" and friends
+REQUEST_BULK_CONCURRENCY = int(os.getenv("REQUEST_BULK_CONCURRENCY", 8))
+# Outbound WhatsApp messages (manager notifications, async replies)
+OUTBOUND_WORKERS = int(os.getenv("OUTBOUND_WORKERS", 2))
+OUTBOUND_QUEUE_SIZE = int(os.getenv("OUTBOUND_QUEUE_SIZE", 500))
+OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE", 10))  # messages/second for TWILIO_WHATSAPP_NUMBER
+OUTBOUND_BURST = int(os.getenv("OUTBOUND_BURST", 10))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", 4))
+OUTBOUND_BACKOFF = float(os.getenv("OUTBOUND_BACKOFF", 0.5))
+# Synthesized reply audio, shared by all workers on the host
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "chat-engine-tts"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+TTS_URL_TTL = float(os.getenv("TTS_URL_TTL", 3000))  # tmpfiles.org keeps uploads for an hour
+# Where spoken replies are hosted: "local" serves them from GET /media/<token>, "tmpfiles" uploads them
+MEDIA_BACKEND = os.getenv("MEDIA_BACKEND", "local")
+MEDIA_DIR = os.getenv("MEDIA_DIR", os.path.join(tempfile.gettempdir(), "chat-engine-media"))
+MEDIA_TTL = int(os.getenv("MEDIA_TTL", 3600))
+# Must match in every worker; without either, MediaStore warns and uses a key kept in MEDIA_DIR
+MEDIA_SECRET = os.getenv("MEDIA_SECRET") or TWILIO_AUTH_TOKEN
+# Public root URL Twilio can fetch media from; Render provides RENDER_EXTERNAL_URL
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL") or os.getenv("RENDER_EXTERNAL_URL")
+# Natural-language -> SQL translations for the custom commands
+SQL_CACHE_SIZE = int(os.getenv("SQL_CACHE_SIZE", 512))
+SQL_CACHE_TTL = float(os.getenv("SQL_CACHE_TTL", 24 * 3600))
+# Answers from the information-retrieval service for the fallback command
+DOCUSEEK_CACHE_SIZE = int(os.getenv("DOCUSEEK_CACHE_SIZE", 1024))
+DOCUSEEK_CACHE_TTL = float(os.getenv("DOCUSEEK_CACHE_TTL", 3600))
+# Read results of execute_query, dropped when this app writes to the tables they read
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 512))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", 120))
+# Per-employee monthly attendance behind "my attendance from ... to ..."
+ATTENDANCE_CACHE_SIZE = int(os.getenv("ATTENDANCE_CACHE_SIZE", 4096))
+ATTENDANCE_CACHE_TTL = float(os.getenv("ATTENDANCE_CACHE_TTL", 900))
+# Request listings: rows per reply page, and how long "more" remembers where a listing stopped
+REQUEST_PAGE_SIZE = int(os.getenv("REQUEST_PAGE_SIZE", 20))
+CONTINUATION_TTL = float(os.getenv("CONTINUATION_TTL", 1800))
+# Shared by all workers so 'more' works whichever worker gets the next message
+CONTINUATION_DIR = os.getenv("CONTINUATION_DIR", os.path.join(tempfile.gettempdir(), "chat-engine-continuations"))
+# Local contact directory for "find contact of"
+DIRECTORY_FULL_REFRESH = float(os.getenv("DIRECTORY_FULL_REFRESH", 600))
+DIRECTORY_DELTA_REFRESH = float(os.getenv("DIRECTORY_DELTA_REFRESH", 60))
+# Contacts listed per 'find contact of' reply
+CONTACT_SEARCH_LIMIT = int(os.getenv("CONTACT_SEARCH_LIMIT", 10))
+# Seconds /warmup waits for each step
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", 60))
+# Circuit breakers: consecutive failures before an upstream is skipped, and seconds before it is retried
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", 5))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", 30))
+# Seconds before an idempotent backend read is sent a second time; 0 disables hedging
+BACKEND_HEDGE_AFTER = float(os.getenv("BACKEND_HEDGE_AFTER", 0))
+BACKEND_HEDGE_RATIO = float(os.getenv("BACKEND_HEDGE_RATIO", 0.1))
+
+
+def upstream_timeout(prefix, connect, read):
+    """(connect, read) timeout for one upstream from <PREFIX>_CONNECT_TIMEOUT and <PREFIX>_READ_TIMEOUT"""
+    return (
+        float(os.getenv(f"{prefix}_CONNECT_TIMEOUT", connect)),
+        float(os.getenv(f"{prefix}_READ_TIMEOUT", read)),
+    )
+
+
+def upstream_breaker(name):
+    return CircuitBreaker(name, failures=BREAKER_FAILURES, reset_timeout=BREAKER_RESET_SECONDS)
+
 
 app = Flask(__name__)
 CORS(app, supports_credentials=True)
@@ -24,21 +134,214 @@ CORS(app, supports_credentials=True)
 # Database configuration
 DATABASE = "employees.db"
 
-# Speech-to-text recognizer
-recognizer = sr.Recognizer()
+class LazyTwilioClient:
+    """
+    twilio.rest.Client built on first use
+
+    Importing twilio.rest and building the client is only needed to send
+    messages, so it is left out of the import that every cold start pays
+    for. Attribute access is forwarded to the real client.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from twilio.rest import Client
+                    twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+                    if TWILIO_API_URL:
+                        twilio_client.api.base_url = TWILIO_API_URL
+                    self._client = twilio_client
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+
+client = LazyTwilioClient()
+
+# Shared keep-alive HTTP clients, one connection pool per upstream host
+backend = BackendClient(
+    "backend", API_URL, headers={"x-api-key": BACKEND_API_KEY},
+    timeout=upstream_timeout("BACKEND", 3, 10), breaker=upstream_breaker("backend"),
+    hedge_after=BACKEND_HEDGE_AFTER or None, hedge_ratio=BACKEND_HEDGE_RATIO,
+)
+# Cold starts of the onrender.com service can take tens of seconds
+docuseek = BackendClient(
+    "docuseek", DOCUSEEK_URL, headers={"token": BACKEND_API_KEY},
+    timeout=upstream_timeout("DOCUSEEK", 5, 45), breaker=upstream_breaker("docuseek"),
+)
+twilio_media = BackendClient(
+    "twilio_media", auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN),
+    timeout=upstream_timeout("TWILIO_MEDIA", 5, 20), breaker=upstream_breaker("twilio_media"),
+)
+tmpfiles = BackendClient(
+    "tmpfiles", TMPFILES_URL,
+    timeout=upstream_timeout("TMPFILES", 5, 20), breaker=upstream_breaker("tmpfiles"),
+)
+
+# What users are told while an upstream's circuit is open
+UPSTREAM_UNAVAILABLE_REPLIES = {
+    "docuseek": "⚠️ Document search is not responding right now. Please try again in a few minutes.",
+    "twilio_media": "⚠️ Voice messages cannot be fetched right now. Please type your message instead.",
+}
+UNAVAILABLE_REPLY = "⚠️ The HR system is not responding right now. Please try again in a few minutes."
+# add_attendance_bulk result for a write that missed its deadline and may still be saved
+ATTENDANCE_PENDING = "pending"
+
+# Command table for incoming messages; handlers are registered below with @router.command
+router = CommandRouter()
+
+# Patterns compiled once at import instead of per message
+LEAVE_REQUEST_PATTERN = re.compile(r"^(wfh|leave)\s+from\s+(\d{4}-\d{2}-\d{2})\s+to\s+(\d{4}-\d{2}-\d{2})$")
+# "PRESENT", "PRESENT 2023-12-15" or "PRESENT2023-12-15"
+ATTENDANCE_PATTERN = re.compile(r'^(PRESENT|ABSENT|WFH)\s*(\d{4}-\d{2}-\d{2})?$')
+# "WFH 2024-01-01 to 2024-01-05", "PRESENT team" or "WFH team 2024-01-01 to 2024-01-05"
+BULK_ATTENDANCE_PATTERN = re.compile(
+    r'^(PRESENT|ABSENT|WFH)\s+(TEAM\b)?\s*(\d{4}-\d{2}-\d{2})?(?:\s+TO\s+(\d{4}-\d{2}-\d{2}))?$')
+CUSTOM_KEYWORD_PATTERN = re.compile(r'(?i)custom')
+SQL_BLOCK_PATTERN = re.compile(r"```sql\s*(.*?)\s*```", re.DOTALL)
+
+# Schema prompt for the custom commands; {question} is the manager's question
+SQL_PROMPT_TEMPLATE = (
+    "you are a SQL expert for writing queries in sqlite3 python, always write query case insensitive, "
+    "you have to only give the exact query for MySQL so that the result of yours,"
+    "I can directly fire in DB. You have the Employee and Attendance table information: "
+    "Employee with columns (id, name, email, phone, role (engineer, HR, tester, manager, and founder), "
+    "level (integer 1,2,3), clientCompany(string), location(string), employeeType(can have values A, B, C), reportsTo (id of manager who is also an employee), skills (string)); "
+    "Attendance with columns (id, empId, date(yyyy-mm-dd), status(PRESENT/ABSENT)), requestId(integer value), Now tell me the query for - {question}")
+# Changes whenever the prompt text changes, so cached translations from an older prompt are never used
+SQL_PROMPT_VERSION = hashlib.sha256(SQL_PROMPT_TEMPLATE.encode("utf-8")).hexdigest()[:12]
+QUESTION_NOISE_PATTERN = re.compile(r"[^\w\s-]")
+
+# (prompt version, employee type, normalized question) -> extracted SQL
+sql_translation_cache = TTLCache(SQL_CACHE_SIZE, SQL_CACHE_TTL, name="sql_translation")
+
+# (employee type, normalized question) -> docuseek answer, with concurrent identical questions coalesced
+docuseek_answer_cache = TTLCache(DOCUSEEK_CACHE_SIZE, DOCUSEEK_CACHE_TTL, name="docuseek_answer")
+docuseek_flight = SingleFlight("docuseek")
+
+# Normalized SQL -> result rows, tagged with the tables read ("employee", "attendance", "requests")
+query_result_cache = TaggedTTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL, name="query_result")
+QUERY_TABLE_PATTERN = re.compile(r"\b(?:from|join|into|update)\s+[`\"\[]?(\w+)", re.IGNORECASE)
+READ_QUERY_PATTERN = re.compile(r"^\s*\(?\s*(?:select|with)\b", re.IGNORECASE)
+
+CONTACT_NAME_NOISE_PATTERN = re.compile(r"[^\w .'-]")
+
+attendance_calendar = AttendanceCalendarCache(maxsize=ATTENDANCE_CACHE_SIZE, ttl=ATTENDANCE_CACHE_TTL)
+
+# Sender -> (listing, id of the last request shown) for the "more" command
+continuations = SharedTTLCache(CONTINUATION_DIR or None, maxsize=4096, ttl=CONTINUATION_TTL, name="continuations")
+DATE_RANGE_SUFFIX = r"(?: from (\S+) to (\S+))?$"
+
+# Employee records by id plus a phone index, used for authorization and manager/requester lookups
+employee_cache = EmployeeCache(EMPLOYEE_CACHE_SIZE, EMPLOYEE_CACHE_TTL, EMPLOYEE_NEGATIVE_TTL)
+
+# Reply audio keyed by hash of (text, lang), plus the URL each clip was uploaded to
+tts_cache = TTSCache(
+    TTS_CACHE_DIR,
+    max_bytes=TTS_CACHE_MAX_BYTES,
+    # A remembered URL must expire before the media it points at
+    url_ttl=min(TTS_URL_TTL, MEDIA_TTL * 0.9) if MEDIA_BACKEND == "local" else TTS_URL_TTL,
+)
+
+# Generated reply audio served by this app at /media/<token>
+media_store = MediaStore(MEDIA_DIR, MEDIA_SECRET, ttl=MEDIA_TTL)
+
+# Shared pool for the independent backend calls of a turn
+fanout = FanOut("fanout", workers=FANOUT_WORKERS, timeout=FANOUT_TIMEOUT)
+
+# Background workers that run webhook commands in async mode
+webhook_jobs = JobQueue("webhook", workers=WEBHOOK_WORKERS, maxsize=WEBHOOK_QUEUE_SIZE)
+
+# Replies kept by MessageSid so Twilio's retries never run a command twice
+webhook_ledger = MessageLedger(
+    WEBHOOK_DEDUP_DIR or None,
+    maxsize=WEBHOOK_DEDUP_SIZE,
+    window=WEBHOOK_DEDUP_WINDOW,
+    wait=WEBHOOK_DEDUP_WAIT,
+)
+
+
+@metrics.timed("deliver_message")
+def deliver_message(message):
+    """Send one queued OutboundMessage through the Twilio client it was queued with"""
+    if message.media_url:
+        return message.context.messages.create(
+            media_url=[message.media_url],
+            from_=TWILIO_WHATSAPP_NUMBER,
+            to=message.to
+        )
+    else:
+        return message.context.messages.create(
+            body=message.body,
+            from_=TWILIO_WHATSAPP_NUMBER,
+            to=message.to
+        )
+
+
+# Rate-limited, retrying sender so request handlers never wait on Twilio's REST API
+outbound = OutboundDispatcher(
+    deliver_message,
+    workers=OUTBOUND_WORKERS,
+    maxsize=OUTBOUND_QUEUE_SIZE,
+    rate=OUTBOUND_RATE,
+    burst=OUTBOUND_BURST,
+    max_retries=OUTBOUND_MAX_RETRIES,
+    backoff=OUTBOUND_BACKOFF,
+)
+
+def query_tables(query):
+    """Return the cache tags for the tables a SQL statement reads or writes"""
+    tags = set()
+    for table in QUERY_TABLE_PATTERN.findall(query):
+        table = table.lower()
+        if table.startswith("employee"):
+            tags.add("employee")
+        elif table.startswith("attendance"):
+            tags.add("attendance")
+        elif table.startswith("request"):
+            tags.add("requests")
+        else:
+            tags.add(table)
+    return tags
+
 
-client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+@metrics.timed("execute_query")
+def execute_query(query, use_cache=True, store=True):
+    """
+    Execute SQL query through API
 
-def execute_query(query):
-    """Execute SQL query through API"""
+    SELECT results are cached by normalized SQL and tagged with the tables
+    they read; use_cache=False skips the lookup but still refreshes the
+    cache, and store=False keeps the result out of it (for large one-off
+    reads). Write statements drop cached results for the tables they touch.
+    """
     payload = {"query": query}
-    headers = {"Content-Type": "application/json", "x-api-key": "abcdef"}
+    cache_key = " ".join(query.split()).rstrip(";")
+    tables = query_tables(query)
+    is_read = bool(READ_QUERY_PATTERN.match(query))
+    cacheable = is_read and bool(tables)
+
+    if use_cache and cacheable:
+        cached = query_result_cache.get(cache_key)
+        if cached is not MISSING:
+            return cached
+    generation = query_result_cache.generation()
 
     try:
-        response = requests.post(API_URL + "/query", json=payload, headers=headers)
+        response = backend.post("/query", json=payload)
         response_data = response.json()
 
         if response.status_code == 200:
+            if cacheable and store:
+                query_result_cache.set(cache_key, response_data, tags=tables, since=generation)
+            elif not is_read:
+                query_result_cache.invalidate_tags(*tables)
             return response_data
         else:
             print("Error:", response_data.get("error"))
@@ -48,29 +351,61 @@ def execute_query(query):
         return None
 
 
+@metrics.timed("get_employees")
 def get_employees(phone_number):
     """Get employee details by phone number"""
     phone_number = phone_number[-10:]  # Extract last 10 digits
 
-    url = API_URL + "/employees"
     params = {"phone": f"{phone_number}"}  # Optional filter
-    headers = {"x-api-key": "abcdef"}
 
-    response = requests.post(url, params=params, headers=headers)
+    response = backend.post("/employees", params=params, hedge=True)
     if response.status_code == 200:
         return response.json()
-    else:
+    elif response.status_code == 404:
         print(f"Error: No employee found with this phone number {phone_number}")
+        return []
+    else:
+        print(f"Error {response.status_code} looking up phone number {phone_number}")
 
 
-def get_employee_by_id(empId):
-    headers = {"x-api-key": "abcdef"}
+def normalize_phone(phone_number):
+    """Reduce 'whatsapp:+91XXXXXXXXXX' style numbers to the last 10 digits"""
+    digits = re.sub(r"\D", "", phone_number or "")
+    return digits[-10:]
+
+
+def get_employees_cached(phone_number):
+    """
+    get_employees with a TTL/LRU cache in front of it
+
+    Known numbers are cached for EMPLOYEE_CACHE_TTL seconds. Numbers the
+    backend does not know are cached as None for EMPLOYEE_NEGATIVE_TTL
+    seconds so repeated messages from them cost no backend call. Backend
+    errors are never cached.
+    """
+    phone_number = normalize_phone(phone_number)
+    cached = employee_cache.get_by_phone(phone_number)
+    if cached is not MISSING:
+        return cached
+
+    employees = get_employees(phone_number)
+    if employees is not None:
+        employee_cache.put_phone(phone_number, employees)
+    return employees
+
 
+def invalidate_employee_cache(phone_number=None, emp_id=None):
+    """Drop a cached phone number and/or employee id, or everything when neither is given"""
+    phone_number = normalize_phone(phone_number) if phone_number else None
+    employee_cache.invalidate(emp_id=emp_id, phone=phone_number)
+    query_result_cache.invalidate_tags("employee")
+    directory.invalidate()
+
+
+@metrics.timed("get_employee_by_id")
+def get_employee_by_id(empId):
     try:
-        response = requests.post(  # POST method
-            API_URL+f"/employees/{empId}",
-            headers=headers
-        )
+        response = backend.post(f"/employees/{empId}", hedge=True)  # POST method
 
         if response.status_code == 200:
             employee_data = response.json()
@@ -81,30 +416,92 @@ def get_employee_by_id(empId):
         else:
             print(f"Error {response.status_code}: {response.text}")
 
+    except CircuitOpenError:
+        raise
     except Exception as e:
         print(f"Request failed: {str(e)}")
 
 
+def get_employee_by_id_cached(empId):
+    """get_employee_by_id served from the shared employee cache when possible"""
+    cached = employee_cache.get(empId)
+    if cached is not MISSING:
+        return cached
+
+    employee = get_employee_by_id(empId)
+    if isinstance(employee, dict):
+        employee_cache.put(employee)
+    return employee
+
+
+def get_employees_by_ids(emp_ids):
+    """
+    Resolve many employee ids with at most one backend call
+
+    Args:
+        emp_ids: Iterable of employee ids
+
+    Returns:
+        Dictionary of {id: employee record}; ids the backend does not know are omitted
+    """
+    emp_ids = list(dict.fromkeys(int(emp_id) for emp_id in emp_ids if emp_id is not None))
+    found, missing = employee_cache.get_many(emp_ids)
+
+    if missing:
+        query = f"SELECT * FROM employee WHERE id IN ({', '.join(str(emp_id) for emp_id in missing)})"
+        for record in execute_query(query) or []:
+            employee_cache.put(record)
+            found[int(record["id"])] = record
+
+    return found
+
+
+# The directory keeps its own copy, so these rows would only crowd other results out of the query cache
+def load_directory_rows():
+    return execute_query("SELECT id, name, email, phone FROM employee", use_cache=False, store=False)
+
+
+def load_directory_rows_since(max_id):
+    return execute_query(f"SELECT id, name, email, phone FROM employee WHERE id > {int(max_id)}",
+                         use_cache=False, store=False)
+
+
+# In-memory name/email/phone index, refreshed in the background
+directory = DirectoryIndex(
+    load_directory_rows,
+    load_directory_rows_since,
+    full_interval=DIRECTORY_FULL_REFRESH,
+    delta_interval=DIRECTORY_DELTA_REFRESH,
+)
+
+
+def find_contacts(name, limit=10):
+    """Up to `limit` contacts from the local directory, falling back to the backend while it loads"""
+    contacts = directory.search(name, limit)
+    if contacts is not None:
+        return contacts
+
+    # Only plain name characters reach the SQL, with quotes escaped
+    name = CONTACT_NAME_NOISE_PATTERN.sub("", name.lower()).replace("'", "''")
+    query = f"SELECT name, email, phone FROM employee WHERE LOWER(name) LIKE '%{name}%'"
+    return (execute_query(query) or [])[:limit]
+
+
+@metrics.timed("get_attendance")
 def get_attendance(employee_id, date_to_mark):
-    url = API_URL + f"/{employee_id}/attendance_by_date"
-    headers = {"x-api-key": "abcdef"}
     params = {"date": date_to_mark}
 
-    response = requests.post(url, headers=headers, params=params)
+    response = backend.post(f"/{employee_id}/attendance_by_date", params=params, hedge=True)
     return response.json()
 
 
+@metrics.timed("add_attendance")
 def add_attendance(employee_id, today, status):
     # Convert the date string to datetime object for validation
     datetime_obj = datetime.strptime(today, "%Y-%m-%d")
     # Convert back to string for JSON serialization
     date_str = datetime_obj.strftime("%Y-%m-%d")
 
-    url = API_URL + "/attendance"
-    headers = {
-        "Content-Type": "application/json",
-        "x-api-key": "abcdef"
-    }
     data = {
         "empId": employee_id,
         "date": date_str,  # Now using string instead of datetime object
@@ -112,14 +509,51 @@ def add_attendance(employee_id, today, status):
     }
 
     try:
-        response = requests.post(url, json=data, headers=headers)
+        response = backend.post("/attendance", json=data)
         response.raise_for_status()  # Raises an HTTPError for bad responses
+        query_result_cache.invalidate_tags("attendance")
+        attendance_calendar.mark(employee_id, date_str, status)
         return response.json()
     except requests.exceptions.RequestException as e:
         print(f"Error marking attendance: {e}")
         return None
 
 
+def add_attendance_bulk(entries):
+    """
+    Mark many attendance entries, several backend calls at a time
+
+    The backend takes one record per POST /attendance, so entries are sent
+    through the fan-out pool in chunks of ATTENDANCE_BULK_CONCURRENCY and a
+    range or team costs about as long as a few single marks.
+
+    Args:
+        entries: List of (employee_id, 'YYYY-MM-DD', status)
+
+    Returns:
+        List of (employee_id, date, status, result) in input order, where
+        result is the backend response, None if the write failed, or
+        ATTENDANCE_PENDING if it did not answer in time and may still land
+    """
+    outcomes = fanout.map(lambda entry: add_attendance(*entry), entries, ATTENDANCE_BULK_CONCURRENCY)
+    return [(*entry, _bulk_result(outcome)) for entry, outcome in zip(entries, outcomes)]
+
+
+def _bulk_result(outcome):
+    if outcome.ok:
+        return outcome.value
+    # A QueueTimeout was never sent, so only a write that was in flight may still land
+    if isinstance(outcome.error, TimeoutError) and not isinstance(outcome.error, QueueTimeout):
+        return ATTENDANCE_PENDING
+    return None
+
+
+def get_team_members(manager_id):
+    """Employees reporting directly to manager_id"""
+    return execute_query(f"SELECT id, name, phone FROM employee WHERE reportsTo = {int(manager_id)}") or []
+
+
+@metrics.timed("get_attendance_filter")
 def get_attendance_filter(emp_id, days=None, from_date=None, to_date=None):
     """
     Calls the attendance API endpoint
@@ -133,12 +567,6 @@ def get_attendance_filter(emp_id, days=None, from_date=None, to_date=None):
     Returns:
         Dictionary with attendance data and leave statistics
     """
-    # Prepare headers with authentication
-    headers = {
-        "x-api-key": "abcdef",
-        "Content-Type": "application/json"
-    }
-
     # Build query parameters
     params = {}
     if days:
@@ -149,11 +577,7 @@ def get_attendance_filter(emp_id, days=None, from_date=None, to_date=None):
         params["to"] = to_date
 
     # Make the POST request
-    response = requests.post(
-        f"{API_URL}/attendance/{emp_id}",
-        headers=headers,
-        params=params
-    )
+    response = backend.post(f"/attendance/{emp_id}", params=params, hedge=True)
 
     # Handle response
     if response.status_code == 200:
@@ -162,86 +586,59 @@ def get_attendance_filter(emp_id, days=None, from_date=None, to_date=None):
         response.raise_for_status()  # Raises exception for 4XX/5XX errors
 
 
-def format_calendar(data):
-    # Collect all dates with their status
-    date_status = {}
-    for status, dates in data["attendance"].items():
-        for date in dates:
-            date_status[date] = status
-
-    # Group by month
-    months = {}
-    for date_str in sorted(date_status.keys()):
-        date = datetime.strptime(date_str, "%Y-%m-%d")
-        month_key = date.strftime("%Y-%m")
-        if month_key not in months:
-            months[month_key] = []
-        months[month_key].append((date.day, date_status[date_str]))
-
-    # Build calendar
-    calendar = []
-    for month, days in months.items():
-        month_header = datetime.strptime(month, "%Y-%m").strftime("%B %Y")
-        calendar.append(f"\n📅 {month_header}")
-        calendar.append("Su Mo Tu We Th Fr Sa")
-
-        # Find first day of month
-        first_date = datetime.strptime(f"{month}-01", "%Y-%m-%d")
-        first_weekday = first_date.weekday()  # Monday is 0
-
-        # Add leading spaces
-        week = ["  "] * first_weekday
-
-        for day, status in days:
-            # Emoji representation
-            emoji = {
-                "PRESENT": "✅",
-                "ABSENT": "❌",
-                "WFH": "🏠"
-            }.get(status, " ")
-
-            week.append(f"{emoji}{day:2}")
-
-            # New week
-            if len(week) == 7:
-                calendar.append(" ".join(week))
-                week = []
-
-        if week:  # Add remaining days
-            calendar.append(" ".join(week))
-
-    return "\n".join(calendar)
-
+@metrics.timed("get_my_requests")
+def get_my_requests(employee_id, status="", request_type="all", from_date=None, to_date=None,
+                    before_id=None, limit=None):
+    """
+    Fetch requests an employee created or has to approve, newest first
 
-def get_my_requests(employee_id, status="", request_type="all"):
-    api_url = API_URL + "/employees/{}/requests".format(employee_id)
+    Filters and the page window go to the backend as query params (status,
+    from, to, before, limit) and are applied again to the response, so the
+    result is the same whether or not the backend honours them.
 
-    headers = {
-        "Content-Type": "application/json",
-        "x-api-key": "abcdef"  # Your API key
-    }
+    Args:
+        employee_id: Employee ID
+        status: Request status to keep, e.g. "PENDING" (optional)
+        request_type: "created", "approval" or "all"
+        from_date: Keep requests ending on or after this 'YYYY-MM-DD' (optional)
+        to_date: Keep requests starting on or before this 'YYYY-MM-DD' (optional)
+        before_id: Keep requests with a smaller id, i.e. the page after it (optional)
+        limit: Maximum number of requests returned (optional)
 
+    Returns:
+        List of request dicts, or None if the backend call failed
+    """
+    status = status.upper()
     params = {"type": request_type}
-    response = requests.post(api_url, headers=headers, params=params)
+    if status:
+        params["status"] = status
+    if from_date:
+        params["from"] = from_date
+    if to_date:
+        params["to"] = to_date
+    if before_id is not None:
+        params["before"] = before_id
+    if limit:
+        params["limit"] = limit
+    response = backend.post("/employees/{}/requests".format(employee_id), params=params)
 
-    if response.status_code == 200:
-        total_requests = response.json()
-
-        # Filter by status if status parameter is not empty
-        if status:
-            filtered_requests = [
-                req for req in total_requests
-                if req['requestStatus'] == status.upper()
-            ]
-            print(f"Filtered requests (status={status}):", filtered_requests)
-            return filtered_requests
-        else:
-            print("All requests:", total_requests)
-            return total_requests
-    else:
+    if response.status_code != 200:
         print("Error:", response.json())
         return None
 
+    matching = [
+        req for req in response.json()
+        if (not status or req["requestStatus"] == status)
+        and (not from_date or req["toDate"] >= from_date)
+        and (not to_date or req["fromDate"] <= to_date)
+        and (before_id is None or req["id"] < before_id)
+    ]
+    matching.sort(key=lambda req: req["id"], reverse=True)
+    print(f"Fetched {len(matching)} requests (type={request_type}, status={status or 'any'})")
+    return matching[:limit] if limit else matching
+
+
+@metrics.timed("get_request_by_id")
 def get_request_by_id(request_id):
     # params = {
     #     "requesterEmpId": 123,          # Filter by employee who made request
@@ -252,18 +649,11 @@ def get_request_by_id(request_id):
     #     "toDate": "2023-12-31"          # End date range (YYYY-MM-DD)
     # }
 
-    headers = {"Content-Type": "application/json", "x-api-key": "abcdef"}
-
     params = {
          "id": request_id,
     }
     try:
-        response = requests.post(
-            API_URL+"/get-all-request",
-            params=params,
-            headers=headers,
-
-        )
+        response = backend.post("/get-all-request", params=params)
 
         if response.status_code == 200:
             requests_data = response.json()
@@ -272,27 +662,25 @@ def get_request_by_id(request_id):
         else:
             print(f"Error {response.status_code}: {response.text}")
 
+    except CircuitOpenError:
+        raise
     except Exception as e:
         print(f"Request failed: {str(e)}")
 
-def update_request_status(request_id, new_status, user_id, api_key="abcdef"):
+@metrics.timed("update_request_status")
+def update_request_status(request_id, new_status, user_id, api_key=None):
     """
     Update the status of a request approval
 
     Args:
         request_id: ID of the request to update
         new_status: New status (APPROVED/REJECTED/PENDING)
-        api_key: API key for authentication
+        api_key: API key override (defaults to the shared backend key)
 
     Returns:
         Dictionary with response data if successful, None if failed
     """
-    api_url = f"{API_URL}/request-approvals/{request_id}"
-
-    headers = {
-        "Content-Type": "application/json",
-        "x-api-key": api_key
-    }
+    headers = {"x-api-key": api_key} if api_key else None
 
     data = {
         "requestStatus": new_status.upper(),
@@ -300,28 +688,55 @@ def update_request_status(request_id, new_status, user_id, api_key="abcdef"):
     }
 
     try:
-        response = requests.put(api_url, json=data, headers=headers)
+        response = backend.put(f"/request-approvals/{request_id}", json=data, headers=headers)
 
         if response.status_code == 200:
             print("Request status updated successfully")
+            # Approvals can also write attendance on the backend
+            query_result_cache.invalidate_tags("requests", "attendance")
             return response.json()
         else:
             print(f"Error updating request: {response.status_code}", response.json())
             return None
 
+    except CircuitOpenError:
+        raise
     except Exception as e:
         print(f"Request failed: {str(e)}")
         return None
 
 
+def raise_if_unavailable(*outcomes):
+    """Re-raise an open circuit that fanout caught, so handle_message gives its unavailable reply"""
+    for outcome in outcomes:
+        if isinstance(outcome.error, CircuitOpenError):
+            raise outcome.error
+
+
+def update_request_status_bulk(request_ids, new_status, user_id):
+    """
+    Update the status of many requests, REQUEST_BULK_CONCURRENCY at a time
+
+    Returns:
+        Dictionary of {request_id: response data, or None if that update failed}
+    """
+    outcomes = fanout.map(
+        lambda request_id: update_request_status(request_id=request_id, new_status=new_status, user_id=user_id),
+        request_ids,
+        REQUEST_BULK_CONCURRENCY,
+    )
+    if not any(outcome.ok and outcome.value for outcome in outcomes):
+        raise_if_unavailable(*outcomes)
+    return {request_id: outcome.value if outcome.ok else None for request_id, outcome in zip(request_ids, outcomes)}
+
+
 def parse_leave_request(message: str) -> tuple:
     """
     Parse leave/WFH request from message
     Format: "[WFH/LEAVE] from yyyy-mm-dd to yyyy-mm-dd"
     Returns: (request_type, from_date, to_date) or (None, None, None) if invalid
     """
-    pattern = r"^(wfh|leave)\s+from\s+(\d{4}-\d{2}-\d{2})\s+to\s+(\d{4}-\d{2}-\d{2})$"
-    match = re.match(pattern, message.lower())
+    match = LEAVE_REQUEST_PATTERN.match(message.lower())
     if not match:
         return None, None, None
 
@@ -338,12 +753,13 @@ def parse_leave_request(message: str) -> tuple:
         return None, None, None
 
 
+@metrics.timed("create_request_approval")
 def create_request_approval(
         emp_id: int,
         request_type: str,
         from_date: str,  # YYYY-MM-DD format
         to_date: str,    # YYYY-MM-DD format
-        api_key: str = "abcdef"
+        api_key: str = None
 ):
     """
     Create a new request approval (LEAVE/WFH)
@@ -353,17 +769,12 @@ def create_request_approval(
         request_type: 'LEAVE' or 'WFH'
         from_date: Start date (YYYY-MM-DD)
         to_date: End date (YYYY-MM-DD)
-        api_key: API key for authentication
-        base_url: Base URL of the API service
+        api_key: API key override (defaults to the shared backend key)
 
     Returns:
         Dictionary with response data or error message
     """
-    url = f"{API_URL}/request-approvals"
-    headers = {
-        "Content-Type": "application/json",
-        "x-api-key": api_key
-    }
+    headers = {"x-api-key": api_key} if api_key else None
 
     data = {
         "empId": emp_id,
@@ -373,8 +784,9 @@ def create_request_approval(
     }
 
     try:
-        response = requests.post(url, json=data, headers=headers)
+        response = backend.post("/request-approvals", json=data, headers=headers)
         response.raise_for_status()  # Raises exception for 4XX/5XX responses
+        query_result_cache.invalidate_tags("requests")
         return response.json()
 
     except requests.exceptions.HTTPError as http_err:
@@ -392,6 +804,8 @@ def create_request_approval(
                 "error": str(http_err)
             }
 
+    except CircuitOpenError:
+        raise
     except Exception as e:
         return {
             "success": False,
@@ -399,71 +813,106 @@ def create_request_approval(
         }
 
 
+@metrics.timed("download_audio")
 def download_audio(media_url):
-    """Download audio file from Twilio"""
+    """Stream audio from Twilio into a per-message voice.AudioBuffer (caller closes it)"""
     try:
-        response = requests.get(media_url, auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN))
+        response = twilio_media.get(media_url, stream=True)
         response.raise_for_status()
-        audio_file_path = "temp_audio.ogg"
-        with open(audio_file_path, "wb") as f:
-            f.write(response.content)
-        return audio_file_path
+        return voice.read_stream(response)
+    except CircuitOpenError:
+        raise
     except Exception as e:
         print(f"Error downloading audio file: {e}")
         return None
 
 
-def convert_audio_to_text(audio_file_path):
-    """Convert audio to text using Google Speech Recognition"""
+@metrics.timed("convert_audio_to_text")
+def convert_audio_to_text(audio):
+    """Convert an AudioBuffer to text using Google Speech Recognition"""
     try:
-        audio = AudioSegment.from_file(audio_file_path)
-        wav_file_path = "temp_audio.wav"
-        audio.export(wav_file_path, format="wav")
-        with sr.AudioFile(wav_file_path) as source:
-            audio_data = recognizer.record(source)
-            text = recognizer.recognize_google(audio_data)
-        return text
+        # Speech libraries have no async API; off the event loop in async mode
+        return async_bridge.blocking(voice.transcribe, audio.source())
     except Exception as e:
         print(f"Error converting audio to text: {e}")
         return None
 
 
-def text_to_speech(text):
-    """Convert text to speech audio file"""
+@metrics.timed("text_to_speech")
+def text_to_speech(text, lang='en'):
+    """Convert text to speech, returning mp3 bytes (served from the TTS cache when possible)"""
+    audio = tts_cache.get(text, lang)
+    if audio:
+        return audio
     try:
-        tts = gTTS(text=text, lang='en')
-        audio_path = "reply.mpeg"
-        tts.save(audio_path)
-        return audio_path
+        audio = async_bridge.blocking(voice.synthesize, text, lang=lang)
     except Exception as e:
         print(f"Error in text-to-speech: {e}")
         return None
+    try:
+        tts_cache.put(text, lang, audio)
+    except OSError as e:
+        print(f"Error caching text-to-speech audio: {e}")
+    return audio
+
+
+@metrics.timed("publish_audio")
+def publish_audio(audio_bytes):
+    """Make reply audio fetchable by Twilio and return its URL"""
+    base_url = PUBLIC_BASE_URL or _request_base_url
+    if MEDIA_BACKEND != "local" or not base_url:
+        return upload_audio_file(audio_bytes)
+    try:
+        token = media_store.put(audio_bytes)
+    except OSError as e:
+        print(f"Error storing audio file: {e}")
+        return upload_audio_file(audio_bytes)
+    return f"{base_url.rstrip('/')}/media/{token}"
+
+
+def spoken_reply_url(text, lang='en'):
+    """Return a hosted URL for the spoken version of text, reusing a previous upload when possible"""
+    audio_url = tts_cache.get_url(text, lang)
+    if audio_url:
+        return audio_url
+
+    audio_reply = text_to_speech(text, lang)
+    if not audio_reply:
+        return None
+    print(f"Audio reply: {len(audio_reply)} bytes")
+    audio_url = publish_audio(audio_reply)
+    if audio_url:
+        try:
+            tts_cache.put_url(text, lang, audio_url)
+        except OSError as e:
+            print(f"Error caching audio URL: {e}")
+    return audio_url
 
 
-def upload_audio_file(file_path):
-    """Upload audio file to temporary hosting service"""
+@metrics.timed("upload_audio_file")
+def upload_audio_file(audio_bytes):
+    """Upload audio bytes to temporary hosting service"""
     try:
-        files = {'file': open(file_path, 'rb')}
-        response = requests.post('https://tmpfiles.org/api/v1/upload', files=files)
+        files = {'file': ('reply.mpeg', audio_bytes, 'audio/mpeg')}
+        response = tmpfiles.post('/api/v1/upload', files=files)
         print(f"Response from audio file {response.json()['data']}")
         if response.status_code == 200:
             return response.json()['data']['url']
         return None
+    except CircuitOpenError:
+        raise
     except Exception as e:
         print(f"Error uploading audio file: {e}")
         return None
 
 
+@metrics.timed("call_docuseek_api")
 def call_docuseek_api(message, employee_type):
     """Call external API for document search"""
-    url = f"https://information-retrieval-service.onrender.com/query?employee_type={employee_type}"
-    headers = {
-        "token": "abcdef",
-        "Content-Type": "application/json"
-    }
+    params = {"employee_type": employee_type}
     data = {"question": message}
 
-    response = requests.post(url, json=data, headers=headers)
+    response = docuseek.post("/query", params=params, json=data)
     if response.status_code == 200:
         return response.json().get("answer", "No answer found")
     else:
@@ -471,28 +920,41 @@ def call_docuseek_api(message, employee_type):
         return None
 
 
-def process_attendance_message(message):
-    # Normalize the message (remove extra spaces, make uppercase)
-    message = message.strip().upper()
+def ask_docuseek(question, employee_type):
+    """
+    call_docuseek_api with an answer cache and single-flight coalescing
 
-    # Define patterns to match
-    patterns = [
-        r'^(PRESENT|ABSENT|WFH)\s*(\d{4}-\d{2}-\d{2})?$',  # "PRESENT" or "PRESENT 2023-12-15"
-        r'^(PRESENT|ABSENT|WFH)(\d{4}-\d{2}-\d{2})$'  # "PRESENT2023-12-15"
-    ]
+    Answers are cached per (employee type, normalized question). While a
+    question is being answered, identical questions wait for that call
+    instead of sending their own.
+    """
+    key = (employee_type, normalize_question(question))
+    answer = docuseek_answer_cache.get(key)
+    if answer is not MISSING:
+        return answer
 
-    status = None
-    date = None
+    def load():
+        # A flight for this key may have finished and cached its answer after the check above
+        answer = docuseek_answer_cache.get(key)
+        if answer is not MISSING:
+            return answer
+        answer = call_docuseek_api(question, employee_type)
+        if answer:
+            docuseek_answer_cache.set(key, answer)
+        return answer
 
-    for pattern in patterns:
-        match = re.match(pattern, message)
-        if match:
-            status = match.group(1)
-            date_str = match.group(2) if len(match.groups()) > 1 else None
-            break
+    return docuseek_flight.do(key, load)
 
-    if not status:
+
+def process_attendance_message(message):
+    # Normalize the message (remove extra spaces, make uppercase)
+    message = message.strip().upper()
+
+    match = ATTENDANCE_PATTERN.match(message)
+    if not match:
         return None, None  # Invalid format
+    status = match.group(1)
+    date_str = match.group(2)
 
     # Set default date to today if not provided
     date = datetime.strptime(date_str, "%Y-%m-%d").date() if date_str else datetime.today().date()
@@ -500,378 +962,709 @@ def process_attendance_message(message):
     return status, date.strftime("%Y-%m-%d")
 
 
-def sendReply(client, reply, sender_number):
-    client.messages.create(
-        body=reply,
-        from_=TWILIO_WHATSAPP_NUMBER,
-        to=sender_number
+def process_bulk_attendance_message(message):
+    """
+    Parse a range or team attendance message
+
+    Returns:
+        (status, for_team, list of 'YYYY-MM-DD' dates) or (None, None, None) if invalid
+    """
+    match = BULK_ATTENDANCE_PATTERN.match(message.strip().upper())
+    if not match:
+        return None, None, None
+    status, team, from_str, to_str = match.groups()
+    if to_str and not from_str:
+        return None, None, None
+
+    try:
+        from_day = date.fromisoformat(from_str) if from_str else datetime.today().date()
+        to_day = date.fromisoformat(to_str) if to_str else from_day
+    except ValueError:
+        return None, None, None
+    if from_day > to_day:
+        from_day, to_day = to_day, from_day
+
+    days = [(from_day + timedelta(days=offset)).isoformat() for offset in range((to_day - from_day).days + 1)]
+    return status, team is not None, days
+
+
+def format_bulk_attendance(status, results, names=None):
+    """Per-date summary of add_attendance_bulk results; names maps employee id -> name for team marks"""
+    by_date = {}
+    for emp_id, day, _, result in results:
+        marked, pending, failed = by_date.setdefault(day, ([], [], []))
+        if result is ATTENDANCE_PENDING:
+            pending.append(emp_id)
+        else:
+            (marked if result else failed).append(emp_id)
+
+    done = sum(len(marked) for marked, _, _ in by_date.values())
+    waiting = sum(len(pending) for _, pending, _ in by_date.values())
+    lines = [f"Marked {status} for {done}/{len(results)} {'entries' if names is not None else 'dates'}"]
+    for day, (marked, pending, failed) in by_date.items():
+        if names is None:
+            lines.append(f"{day}: {'✅' if marked else '⏳ pending' if pending else '❌ failed'}")
+            continue
+        line = f"{day}: {len(marked)}/{len(marked) + len(pending) + len(failed)} marked"
+        for label, emp_ids in (("pending", pending), ("failed", failed)):
+            if emp_ids:
+                line += f" ({label}: {', '.join(str(names.get(emp_id, emp_id)) for emp_id in emp_ids)})"
+        lines.append(line)
+    if waiting:
+        lines.append(f"{waiting} still being saved; check your attendance in a minute before marking them again")
+    return "\n".join(lines)
+
+
+def sendReply(client, reply, sender_number, media_url=None):
+    """Queue a WhatsApp message for delivery; returns False if the outbound queue is full"""
+    return outbound.enqueue(sender_number, body=reply, media_url=media_url, context=client)
+
+
+def is_manager(ctx):
+    """Managers/HR (level 5 and above) may run custom queries"""
+    return ctx.employee.get("level", 0) >= 5
+
+
+def format_request_list(requests_list, with_status=True):
+    return "\n".join(
+        f"{req['id']}: {req['requestType']} ({req['fromDate']} to {req['toDate']})"
+        + (f" - {req['requestStatus']}" if with_status else "")
+        for req in requests_list
+    )
+
+
+@router.command("today_attendance", pattern=r".*\btoday\b.*\battendance\b|.*\battendance\b.*\btoday\b")
+def today_attendance_command(ctx, match):
+    today = datetime.today().strftime("%Y-%m-%d")
+    employee_id = ctx.employee.get("id")
+    attendance_status = get_attendance(employee_id, today)
+    return f"Your attendance for today ({today}) is: {attendance_status}" if attendance_status else f"No record found for {today}"
+
+
+@router.command("leave_request", keywords=("wfh", "leave"), pattern=r"(?:wfh|leave)\s+from\b")
+def leave_request_command(ctx, match):
+    request_type, from_date, to_date = parse_leave_request(ctx.message.text)
+
+    if not request_type:
+        return "Invalid format. Use: '[WFH/LEAVE] from yyyy-mm-dd to yyyy-mm-dd'"
+
+    employee = ctx.employee
+    employee_id = employee.get("id")
+    employee_reports_to_id = employee.get("reportsTo")
+    employee_name = employee.get("name")
+    # The manager lookup and the request itself do not depend on each other
+    manager, created = fanout.gather(
+        lambda: get_employee_by_id_cached(employee_reports_to_id),
+        lambda: create_request_approval(
+            emp_id=employee_id,
+            request_type=request_type,
+            from_date=from_date,
+            to_date=to_date
+        ),
+    )
+    raise_if_unavailable(created)
+    if not created.ok:
+        return "Your request is taking longer than expected. Check 'my active request' in a minute"
+    result = created.value
+
+    if result.get("success", True):
+        reply = (
+            f"{request_type.capitalize()} request submitted!\n"
+            f"From: {from_date}\n"
+            f"To: {to_date}\n"
+            f"Request ID: {result.get('requestId')}"
+        )
+        reply_to_manager = (
+            f"{request_type.capitalize()} request submitted by {employee_name}!\n"
+            f"From: {from_date}\n"
+            f"To: {to_date}\n"
+            f"Request ID: {result.get('requestId')}")
+
+        if manager.ok and isinstance(manager.value, dict):
+            employee_reports_to_number = manager.value["phone"]
+            print(f"employee reports to number {employee_reports_to_number}")
+            sendReply(client, reply_to_manager, f"whatsapp:+91{employee_reports_to_number}")
+        else:
+            print(f"Could not notify manager {employee_reports_to_id}: {manager.error or manager.value}")
+    else:
+        reply = f"Failed to submit request: {result.get('error')}"
+        if "conflictDates" in result.get("details", {}):
+            reply += f"\nConflicts on: {', '.join(result['details']['conflictDates'])}"
+        elif "leaves_taken" in result.get("details", {}):
+            remaining = 15 - result["details"]["leaves_taken"] - result["details"]["pending_leaves"]
+            reply += f"\nYou have only {remaining} leave days remaining"
+    return reply
+
+
+@router.command("mark_attendance_bulk", keywords=("present", "absent", "wfh"),
+                pattern=r"(?:present|absent|wfh)\s+(?:team\b|\d{4}-\d{2}-\d{2}\s+to\b)")
+def mark_attendance_bulk_command(ctx, match):
+    status, for_team, days = process_bulk_attendance_message(ctx.message.text)
+
+    if not status:
+        return "Invalid format. Use: PRESENT/ABSENT/WFH [team] [YYYY-MM-DD [to YYYY-MM-DD]]"
+    if len(days) > ATTENDANCE_BULK_MAX_DAYS:
+        return f"Attendance can be marked for at most {ATTENDANCE_BULK_MAX_DAYS} days at a time"
+
+    if for_team:
+        if not is_manager(ctx):
+            return "Only managers can mark attendance for their team"
+        members = get_team_members(ctx.employee.get("id"))
+        if not members:
+            return "No team members found"
+        names = {member["id"]: member.get("name") for member in members}
+    else:
+        members = [ctx.employee]
+        names = None
+
+    entries = [(member["id"], day, status) for day in days for member in members]
+    if len(entries) > ATTENDANCE_BULK_MAX_ENTRIES:
+        return (f"That is {len(entries)} attendance entries; at most {ATTENDANCE_BULK_MAX_ENTRIES} "
+                f"can be marked at a time. Please use a shorter date range.")
+    return format_bulk_attendance(status, add_attendance_bulk(entries), names)
+
+
+@router.command("mark_attendance", keywords=("present", "absent", "wfh"),
+                pattern=r"(?:present|absent|wfh)\s*(?:\d{4}-\d{2}-\d{2})?$")
+def mark_attendance_command(ctx, match):
+    status, date = process_attendance_message(ctx.message.text)
+
+    if not status:
+        return "Invalid attendance format. Use: PRESENT/ABSENT/WFH [YYYY-MM-DD]"
+
+    employee_id = ctx.employee.get("id")
+    attendance = add_attendance(employee_id, date, status)
+
+    if attendance:
+        return f"Marked {status} for {date}"
+    return "Failed to mark attendance"
+
+
+@router.command("attendance_calendar", keywords=("my",), pattern=r"my attendance from (\S+) to (\S+)$")
+def attendance_calendar_command(ctx, match):
+    employee_id = ctx.employee.get("id")
+    try:
+        from_day = date.fromisoformat(match.group(1))
+        to_day = date.fromisoformat(match.group(2))
+    except ValueError:
+        return "Invalid format. Use: 'my attendance from yyyy-mm-dd to yyyy-mm-dd'"
+    if from_day > to_day:
+        from_day, to_day = to_day, from_day
+
+    months = attendance_calendar.calendar(
+        employee_id, from_day, to_day,
+        lambda from_date, to_date: get_attendance_filter(
+            emp_id=employee_id, from_date=from_date, to_date=to_date)["attendance"],
+    )
+    return format_calendar(months, from_day, to_day) or f"No attendance records from {from_day} to {to_day}"
+
+
+def request_page_reply(sender, listing, before_id=None):
+    """Render one page of a request listing and remember where the next page starts"""
+    rows = get_my_requests(
+        listing["employee_id"], listing["status"], listing["request_type"],
+        from_date=listing["from_date"], to_date=listing["to_date"],
+        before_id=before_id, limit=REQUEST_PAGE_SIZE + 1,
+    )
+    if not rows:
+        continuations.invalidate(sender)
+        return listing["empty"] if before_id is None else "Nothing more to show"
+
+    page = rows[:REQUEST_PAGE_SIZE]
+    parts = [f"{listing['title']}:\n{format_request_list(page, listing['with_status'])}"]
+    if len(rows) > REQUEST_PAGE_SIZE:
+        continuations.set(sender, (listing, page[-1]["id"]))
+        parts.append("Reply 'more' for older requests")
+    else:
+        continuations.invalidate(sender)
+    if listing.get("footer"):
+        parts.append(listing["footer"])
+    return "\n\n".join(parts)
+
+
+def list_requests(ctx, match, title, empty, status="", request_type="created", with_status=True, footer=None):
+    """First page of a request listing, with the optional 'from <date> to <date>' of the match"""
+    from_date, to_date = (match.group(1), match.group(2)) if match is not None else (None, None)
+    try:
+        for value in (from_date, to_date):
+            if value:
+                date.fromisoformat(value)
+    except ValueError:
+        return "Invalid date. Add 'from yyyy-mm-dd to yyyy-mm-dd' to filter by dates"
+
+    listing = {
+        "employee_id": ctx.employee.get("id"),
+        "status": status,
+        "request_type": request_type,
+        "from_date": from_date,
+        "to_date": to_date,
+        "title": title,
+        "empty": empty,
+        "with_status": with_status,
+        "footer": footer,
+    }
+    return request_page_reply(ctx.sender, listing)
+
+
+@router.command("request_history", keywords=("my",), pattern=r"my request history" + DATE_RANGE_SUFFIX)
+def request_history_command(ctx, match):
+    return list_requests(ctx, match, "requests raised by me", "No requests raised by me")
+
+
+@router.command("active_requests", keywords=("my",), pattern=r"my active request" + DATE_RANGE_SUFFIX)
+def active_requests_command(ctx, match):
+    return list_requests(ctx, match, "active requests raised by me", "No active requests raised by me",
+                         status="PENDING")
+
+
+@router.command("requests_on_me", keywords=("request",), pattern=r"request on me" + DATE_RANGE_SUFFIX)
+def requests_on_me_command(ctx, match):
+    return list_requests(ctx, match, "Requests raised to you", "No requests require your approval",
+                         request_type="approval", footer="Reply with 'accept request <ID>' to approve")
+
+
+@router.command("pending_requests_on_me", keywords=("active",), pattern=r"active request on me" + DATE_RANGE_SUFFIX)
+def pending_requests_on_me_command(ctx, match):
+    return list_requests(ctx, match, "Pending requests needing approval", "No pending requests require your approval",
+                         status="PENDING", request_type="approval",
+                         footer="Reply with 'accept request <ID>' to approve")
+
+
+@router.command("more", keywords=("more",), pattern=r"more\W*$")
+def more_command(ctx, match):
+    continuation = continuations.get(ctx.sender, None)
+    if continuation is None:
+        return "Nothing more to show"
+    listing, before_id = continuation
+    return request_page_reply(ctx.sender, listing, before_id)
+
+
+def get_request_with_requester(request_id):
+    """The request and the employee record of whoever raised it"""
+    req = get_request_by_id(request_id)
+    if not req:
+        return None, None
+    return req[0], get_employee_by_id_cached(req[0]["requesterEmpId"])
+
+
+def forget_approved_attendance(new_status, reqs):
+    """The backend writes attendance for an approved request, so drop the requester's cached months"""
+    if new_status != "APPROVED":
+        return
+    for req in reqs:
+        try:
+            attendance_calendar.invalidate(req["requesterEmpId"], req["fromDate"], req["toDate"])
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Could not drop cached attendance for request {req.get('id')}: {e!r}")
+
+
+def decide_request(ctx, request_id, new_status, failure_reply):
+    """Approve or reject one request and notify the requester"""
+    # The request's type, dates and requester do not change with its status, so
+    # they are looked up while the update is in flight
+    updated, details = fanout.gather(
+        lambda: update_request_status(
+            request_id=request_id,
+            new_status=new_status,
+            user_id=ctx.employee.get("id")
+        ),
+        lambda: get_request_with_requester(request_id),
+    )
+    raise_if_unavailable(updated)
+    if not updated.ok:
+        return f"Request {request_id} is taking longer than expected to update. Check 'active request on me' in a minute"
+    result = updated.value
+    print(f"Updated request status: {result}")
+
+    if not (result and result.get("success", True)):
+        return failure_reply
+
+    req, emp = details.value if details.ok else (None, None)
+    if req is None:
+        return f"Request {request_id} {new_status}"
+    forget_approved_attendance(new_status, [req])
+    reqType = req["requestType"]
+    from_date = req["fromDate"]
+    to_date = req["toDate"]
+    reply = f"Request {request_id} of {reqType} from {from_date} to {to_date} {new_status}"
+    if isinstance(emp, dict):
+        sendReply(client, reply, "whatsapp:+91" + emp["phone"])
+    else:
+        print(f"Could not notify requester of request {request_id}")
+    return reply
+
+
+def pending_approvals_reply(ctx):
+    return list_requests(ctx, None, "Pending requests needing approval", "No pending requests require your approval",
+                         status="PENDING", request_type="approval", with_status=False,
+                         footer="Reply with 'accept request <ID>' to approve")
+
+
+@router.command("accept_request", keywords=("accept",), pattern=r"accept request(?:\s+(\S+))?")
+def accept_request_command(ctx, match):
+    if match.group(1) is None:  # Just "accept request"
+        return pending_approvals_reply(ctx)
+    try:
+        request_id = int(match.group(1))
+    except ValueError:
+        return "Invalid request ID. Please use format 'accept request <ID>'"
+    return decide_request(ctx, request_id, "APPROVED", "Failed to approve request")
+
+
+@router.command("reject_request", keywords=("reject",), pattern=r"reject request(?:\s+(\S+))?")
+def reject_request_command(ctx, match):
+    if match.group(1) is None:  # Just "reject request"
+        return pending_approvals_reply(ctx)
+    try:
+        request_id = int(match.group(1))
+    except ValueError:
+        return "Invalid request ID. Please use format 'reject request <ID>'"
+    return decide_request(ctx, request_id, "REJECTED", "Failed to reject request")
+
+
+def decide_requests_bulk(ctx, new_status, request_ids=None, requester_name=None):
+    """
+    Approve or reject many pending requests at once
+
+    Pending requests are fetched once, the updates run in parallel, every
+    requester is resolved with one batched employee lookup and each of them
+    gets a single notification listing their decided requests.
+
+    Args:
+        ctx: CommandContext of the approving manager
+        new_status: "APPROVED" or "REJECTED"
+        request_ids: Only these ids (optional; default is every pending request)
+        requester_name: Only requests from employees whose name contains this (optional)
+    """
+    manager_id = ctx.employee.get("id")
+    pending = get_my_requests(manager_id, "PENDING", "approval")
+    if pending is None:
+        return "Could not fetch your pending requests, please try again"
+
+    not_pending = []
+    if request_ids is not None:
+        by_id = {req["id"]: req for req in pending}
+        not_pending = [request_id for request_id in request_ids if request_id not in by_id]
+        selected = [by_id[request_id] for request_id in dict.fromkeys(request_ids) if request_id in by_id]
+    else:
+        selected = pending
+
+    requesters = get_employees_by_ids(req["requesterEmpId"] for req in selected)
+    if requester_name:
+        needle = requester_name.lower()
+        selected = [
+            req for req in selected
+            if needle in (requesters.get(req["requesterEmpId"]) or {}).get("name", "").lower()
+        ]
+
+    if not selected:
+        if requester_name:
+            return f"No pending requests from {requester_name}"
+        if not_pending:
+            return f"Not pending for your approval: {', '.join(map(str, not_pending))}"
+        return "No pending requests require your approval"
+
+    results = update_request_status_bulk([req["id"] for req in selected], new_status, manager_id)
+    decided = [req for req in selected if results[req["id"]] and results[req["id"]].get("success", True)]
+    decided_ids = {req["id"] for req in decided}
+    failed = [req["id"] for req in selected if req["id"] not in decided_ids]
+    forget_approved_attendance(new_status, decided)
+
+    # One message per requester, all queued together
+    by_requester = {}
+    for req in decided:
+        by_requester.setdefault(req["requesterEmpId"], []).append(req)
+    for requester_id, reqs in by_requester.items():
+        requester = requesters.get(requester_id)
+        if not requester:
+            print(f"Could not notify requester {requester_id}")
+            continue
+        notification = f"Your requests were {new_status}:\n{format_request_list(reqs, with_status=False)}"
+        sendReply(client, notification, "whatsapp:+91" + requester["phone"])
+
+    lines = [f"{new_status.capitalize()} {len(decided)}/{len(selected)} requests"]
+    if decided:
+        lines.append(format_request_list(decided, with_status=False))
+    if failed:
+        lines.append(f"Failed: {', '.join(map(str, failed))}")
+    if not_pending:
+        lines.append(f"Not pending for your approval: {', '.join(map(str, not_pending))}")
+    return "\n".join(lines)
+
+
+@router.command("decide_requests_bulk", keywords=("accept", "reject"),
+                pattern=r"(accept|reject)\s+(?:(all)(?:\s+from\s+(.+?))?|(\d+(?:\s*,\s*\d+)*))\s*$")
+def decide_requests_bulk_command(ctx, match):
+    action, _, requester_name, id_list = match.groups()
+    new_status = "APPROVED" if action == "accept" else "REJECTED"
+    request_ids = [int(request_id) for request_id in id_list.split(",")] if id_list else None
+    return decide_requests_bulk(ctx, new_status, request_ids, requester_name)
+
+
+@router.command("find_contact", keywords=("find",), pattern=r"find contact of (.+)$")
+def find_contact_command(ctx, match):
+    name = match.group(1).strip()
+    # One extra match tells whether the list was cut short
+    contacts = find_contacts(name, CONTACT_SEARCH_LIMIT + 1)
+    if not contacts:
+        return f"No contact found for '{name}'"
+    reply = "\n".join(
+        f"• {contact['name']}"
+        f"\n  📧 {contact['email']}"
+        f"\n  📞 {contact['phone']}"
+        for contact in contacts[:CONTACT_SEARCH_LIMIT]
+    )
+    if len(contacts) > CONTACT_SEARCH_LIMIT:
+        reply += f"\n…and more. Showing the first {CONTACT_SEARCH_LIMIT}; add more of the name to narrow it down"
+    return reply
+
+
+def normalize_question(question):
+    """Lowercase, drop punctuation and collapse whitespace so trivially different phrasings share a key"""
+    return " ".join(QUESTION_NOISE_PATTERN.sub(" ", question.lower()).split())
+
+
+def custom_query_sql(ctx):
+    """
+    Translate a custom question to SQL through the docuseek LLM
+
+    Translations are cached per (prompt version, employee type, normalized
+    question), so a repeated question skips the LLM round trip.
+
+    Returns:
+        The SQL query, or None if no usable query was produced
+    """
+    final_message = CUSTOM_KEYWORD_PATTERN.sub('', ctx.message.text)
+    employee_type = ctx.employee.get("employeeType")
+    cache_key = (SQL_PROMPT_VERSION, employee_type, normalize_question(final_message))
+    query = sql_translation_cache.get(cache_key)
+    if query is not MISSING:
+        return query
+
+    sql_message = SQL_PROMPT_TEMPLATE.format(question=final_message)
+    response_from_service_b = call_docuseek_api(sql_message, employee_type)
+    query = SQL_BLOCK_PATTERN.search(response_from_service_b or "")
+    if not query:
+        return None
+    query = " ".join(query.group(1).strip().split())
+    if "notsure" in query.lower():
+        return None
+    sql_translation_cache.set(cache_key, query)
+    return query
+
+
+@router.command("custom_employee", keywords=("custom",), pattern=r"custom employee\b", allow=is_manager)
+def custom_employee_command(ctx, match):
+    query = custom_query_sql(ctx)
+    if not query:
+        return "Could not generate proper SQL query"
+
+    result = execute_query(query)
+    if not result:
+        return "No employee data found"
+    return "Employee Details:\n" + "\n".join(
+        f"• {emp['name']} ({emp['clientCompany']})"
+        f"\n  📧 {emp['email']}"
+        f"\n  📞 {emp['phone']}"
+        f"\n  📍 {emp['location']} (Level {emp['level']})"
+        for emp in result
     )
 
+
+@router.command("custom_query", keywords=("custom",), allow=is_manager)
+def custom_query_command(ctx, match):
+    query = custom_query_sql(ctx)
+    if not query:
+        return "Could not generate proper SQL query"
+
+    result = execute_query(query)
+    return f"{result}" if result else "No employee data found"
+
+
+@router.default
+def docuseek_command(ctx, match):
+    response_from_service_b = ask_docuseek(ctx.message.text, ctx.employee.get("employeeType"))
+    print("Response from service:", response_from_service_b)
+    return response_from_service_b or "Oops, currently I don't have that information."
+
+
+def handle_message(form):
+    """
+    Run one incoming WhatsApp message through the full pipeline
+
+    Args:
+        form: Twilio webhook form fields as a plain dict
+
+    Returns:
+        (reply text, URL of the spoken reply or None)
+    """
+    # Get incoming message details
+    incoming_message = form.get("Body", "")
+    sender_number = form.get("From", "")
+    num_media = int(form.get("NumMedia", 0))
+    is_audio_received = num_media > 0 and form.get("MediaContentType0", "").startswith("audio/")
+
+    print(f"Received message: {incoming_message} from {sender_number}")
+
+    # Stage timings are recorded under the command once it is known
+    turn = metrics.Turn()
+    command, outcome = "unknown", None
+    try:
+        # Check employee authorization
+        with turn.stage("employee_lookup"):
+            employee = get_employees_cached(sender_number)
+        if employee is None:
+            # Lookup failed, as opposed to an unknown number
+            outcome = "unavailable"
+            return UNAVAILABLE_REPLY, None
+        if not employee:
+            command = "unauthorized"
+            return "You are not authorized to use this service.", None
+        print("employee", employee[0])
+        final_message = incoming_message
+
+        # Handle audio messages
+        if is_audio_received:
+            media_url = form.get("MediaUrl0")
+            with turn.stage("download_audio") as stage:
+                audio = download_audio(media_url)
+                if not audio:
+                    stage.outcome = "error"
+            if audio:
+                with audio, turn.stage("stt") as stage:
+                    transcript = convert_audio_to_text(audio)
+                    if not transcript:
+                        stage.outcome = "empty"
+                final_message = transcript or incoming_message
+                print("Converted audio to text:", final_message)
+
+        ctx = CommandContext(Message(final_message), employee[0], sender_number)
+        with turn.stage("command"):
+            command, reply = router.dispatch(ctx)
+        print(f"Command: {command}")
+
+        # Reply with audio if audio was received, otherwise text
+        audio_url = None
+        if is_audio_received:
+            with turn.stage("spoken_reply") as stage:
+                try:
+                    audio_url = spoken_reply_url(reply)
+                except CircuitOpenError as e:
+                    # The text reply is ready; send it without audio
+                    print(f"Failing fast: {e}")
+                    stage.outcome = "unavailable"
+                else:
+                    if not audio_url:
+                        stage.outcome = "error"
+
+        return reply, audio_url
+    except CircuitOpenError as e:
+        print(f"Failing fast: {e}")
+        outcome = "unavailable"
+        return UPSTREAM_UNAVAILABLE_REPLIES.get(e.name, UNAVAILABLE_REPLY), None
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        print(f"Upstream call failed: {e!r}")
+        outcome = "unavailable"
+        return UNAVAILABLE_REPLY, None
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        turn.finish(command, outcome)
+
+
+def twiml_reply(reply, audio_url=None):
+    """Build the TwiML response for a reply - audio if available, otherwise text"""
+    twiml_response = MessagingResponse()
+
+    if audio_url:
+        twiml_response.message().media(audio_url)
+        return Response(str(twiml_response), content_type="audio/mpeg")
+
+    # Fallback to text response, split into as many messages as the length limit needs
+    for part in split_body(reply or ""):
+        twiml_response.message(body=part)
+    return Response(str(twiml_response), content_type="text/xml")
+
+
+def process_message_job(form):
+    """Worker-side half of async mode: run the pipeline and deliver the reply through the REST API"""
+    reply, audio_url = handle_message(form)
+    sendReply(client, reply, form.get("From", ""), media_url=audio_url)
+
+
+# Root URL of the first webhook call, used for media links when PUBLIC_BASE_URL is not set
+_request_base_url = None
+
+
 @app.route("/webhook", methods=["POST"])
 def webhook():
     """Main webhook handler for Twilio WhatsApp messages"""
+    global _request_base_url
     # Validate API Key
     api_key = request.args.get("x_api_key")
     if api_key != "abcdef":
         return jsonify({"error": "Unauthorized"}), 401
 
-    # Get incoming message details
-    incoming_message = request.form.get("Body", "")
-    sender_number = request.form.get("From", "")
-    num_media = int(request.form.get("NumMedia", 0))
-    is_audio_received = num_media > 0 and request.form.get("MediaContentType0", "").startswith("audio/")
+    if _request_base_url is None:
+        _request_base_url = request.url_root
 
-    print(f"Received message: {incoming_message} from {sender_number}")
+    body, content_type = answer_webhook(request.form.to_dict())
+    return Response(body, content_type=content_type)
 
-    # Check employee authorization
-    employee = get_employees(sender_number[-10:])
-    if not employee:
-        return str(MessagingResponse().message("You are not authorized to use this service."))
-    print("employee", employee[0])
-    employee_type = employee[0].get("employeeType")
-    final_message = incoming_message
-
-    # Handle audio messages
-    if is_audio_received:
-        media_url = request.form.get("MediaUrl0")
-        audio_file_path = download_audio(media_url)
-        if audio_file_path:
-            final_message = convert_audio_to_text(audio_file_path) or incoming_message
-            print("Converted audio to text:", final_message)
-
-    # Process different message types
-    if "today" in final_message.lower() and "attendance" in final_message.lower():
-        today = datetime.today().strftime("%Y-%m-%d")
-        employee_id = employee[0].get("id")
-        attendance_status = get_attendance(employee_id, today)
-        reply = f"Your attendance for today ({today}) is: {attendance_status}" if attendance_status else f"No record found for {today}"
-
-    elif any(keyword in final_message.upper() for keyword in ["PRESENT", "ABSENT", "WFH"]) and "from" not in final_message.lower() and "to" not in final_message.lower():
-        status, date = process_attendance_message(final_message)
-
-        if not status:
-            reply = "Invalid attendance format. Use: PRESENT/ABSENT/WFH [YYYY-MM-DD]"
-        else:
-            employee_id = employee[0].get("id")
-            attendance = add_attendance(employee_id, date, status)
-
-            if attendance:
-                reply = f"Marked {status} for {date}"
-            else:
-                reply = "Failed to mark attendance"
-
-    elif final_message.lower().startswith("my attendance"):
-        employee_id = employee[0].get("id")
-        date_parts = final_message.split()
-        from_index = date_parts.index("from")
-        to_index = date_parts.index("to")
-
-        from_date = date_parts[from_index + 1]
-        to_date = date_parts[to_index + 1]
-
-        reply = format_calendar(get_attendance_filter(emp_id=employee_id, from_date=from_date, to_date=to_date))
-
-    elif final_message.lower() == "my request history":
-        employee_id = employee[0].get("id")
-
-        request_raised_by_me = get_my_requests(employee_id, "", "created")
-
-        if request_raised_by_me:
-            request_list = "\n".join(
-                f"{req['id']}: {req['requestType']} ({req['fromDate']} to {req['toDate']}) - {req['requestStatus']}"
-                for req in request_raised_by_me
-            )
-            reply = (
-                "requests raised by me:\n"
-                f"{request_list}\n\n"
-            )
-        else:
-            reply = "No requests raised by me"
-
-    elif final_message.lower() == "my active request":
-        employee_id = employee[0].get("id")
-
-        active_request_raised_by_me = get_my_requests(employee_id, "PENDING", "created")
-
-        if active_request_raised_by_me:
-            request_list = "\n".join(
-                f"{req['id']}: {req['requestType']} ({req['fromDate']} to {req['toDate']}) - {req['requestStatus']}"
-                for req in active_request_raised_by_me
-            )
-            reply = (
-                "active requests raised by me:\n"
-                f"{request_list}\n\n"
-            )
-        else:
-            reply = "No active requests raised by me"
-
-    elif final_message.lower() == "request on me":
-        employee_id = employee[0].get("id")
-
-        requests_on_me = get_my_requests(employee_id, "", "approval")
-
-        if requests_on_me:
-            request_list = "\n".join(
-                f"{req['id']}: {req['requestType']} ({req['fromDate']} to {req['toDate']}) - {req['requestStatus']}"
-                for req in requests_on_me
-            )
-            reply = (
-                "Requests raised to you:\n"
-                f"{request_list}\n\n"
-                "Reply with 'accept request <ID>' to approve"
-            )
-        else:
-            reply = "No requests require your approval"
-
-    elif final_message.lower() == "active request on me":
-        employee_id = employee[0].get("id")
-
-        pending_requests_on_me = get_my_requests(employee_id, "PENDING", "approval")
-
-        if pending_requests_on_me:
-            request_list = "\n".join(
-                f"{req['id']}: {req['requestType']} ({req['fromDate']} to {req['toDate']}) - {req['requestStatus']}"
-                for req in pending_requests_on_me
-            )
-            reply = (
-                "Pending requests needing approval:\n"
-                f"{request_list}\n\n"
-                "Reply with 'accept request <ID>' to approve"
-            )
-        else:
-            reply = "No pending requests require your approval"
-
-    elif final_message.lower().startswith("accept request"):
-
-        parts = final_message.lower().split()
-        employee_id = employee[0].get("id")
-
-        if len(parts) > 2:  # "accept request 123"
-            try:
-                request_id = int(parts[2])
-                result = update_request_status(
-                    request_id=request_id,
-                    new_status="APPROVED",
-                    user_id=employee_id
-                )
-                print(f"Updated request status: {result}")
-
-                if result and result.get("success", True):
-                    req = get_request_by_id(request_id)
-                    reqType = req[0]["requestType"]
-                    from_date = req[0]["fromDate"]
-                    to_date = req[0]["toDate"]
-                    req_status = req[0]["requestStatus"]
-                    requesterEmpId = req[0]["requesterEmpId"]
-                    emp = get_employee_by_id(requesterEmpId)
-                    replyTo = emp['phone']
-                    reply = f"Request {request_id} of {reqType} from {from_date} to {to_date} {req_status}"
-                    sendReply(client, reply, "whatsapp:+91" + replyTo)
-                else:
-                    reply = "Failed to approve request"
-
-            except ValueError:
-                reply = "Invalid request ID. Please use format 'accept request <ID>'"
-
-        else:  # Just "accept request"
-            pending_requests_on_me = get_my_requests(
-                employee_id=employee_id,
-                status="PENDING",
-                request_type="approval"
-            )
-
-            if pending_requests_on_me:
-                request_list = "\n".join(
-                    f"{req['id']}: {req['requestType']} ({req['fromDate']} to {req['toDate']})"
-                    for req in pending_requests_on_me
-                )
-                reply = (
-                    "Pending requests needing approval:\n"
-                    f"{request_list}\n\n"
-                    "Reply with 'accept request <ID>' to approve"
-                )
-            else:
-                reply = "No pending requests require your approval"
-
-    elif final_message.lower().startswith("reject request"):
-        parts = final_message.lower().split()
-        employee_id = employee[0].get("id")
-
-        if len(parts) > 2:  # "reject request 123"
-            try:
-                request_id = int(parts[2])
-                result = update_request_status(
-                    request_id=request_id,
-                    new_status="REJECTED",
-                    user_id=employee_id
-                )
-                print(f"Updated request status: {result}")
-
-                if result and result.get("success", True):
-                    req = get_request_by_id(request_id)
-                    reqType = req[0]["requestType"]
-                    from_date = req[0]["fromDate"]
-                    to_date = req[0]["toDate"]
-                    req_status = req[0]["requestStatus"]
-                    requesterEmpId = req[0]["requesterEmpId"]
-                    emp = get_employee_by_id(requesterEmpId)
-                    replyTo = emp['phone']
-                    reply = f"Request {request_id} of {reqType} from {from_date} to {to_date} {req_status}"
-                    sendReply(client, reply, "whatsapp:+91" + replyTo)
-                else:
-                    reply = "Failed to reject request"
-
-            except ValueError:
-                reply = "Invalid request ID. Please use format 'reject request <ID>'"
-
-        else:  # Just "reject request"
-            pending_requests_on_me = get_my_requests(
-                employee_id=employee_id,
-                status="PENDING",
-                request_type="approval"
-            )
-
-            if pending_requests_on_me:
-                request_list = "\n".join(
-                    f"{req['id']}: {req['requestType']} ({req['fromDate']} to {req['toDate']})"
-                    for req in pending_requests_on_me
-                )
-                reply = (
-                    "Pending requests needing approval:\n"
-                    f"{request_list}\n\n"
-                    "Reply with 'accept request <ID>' to approve"
-                )
-            else:
-                reply = "No pending requests require your approval"
-
-    elif final_message.lower().startswith(("wfh", "leave")) and "from" in final_message.lower() and "to" in final_message.lower():
-        request_type, from_date, to_date = parse_leave_request(final_message)
-
-        if not request_type:
-            reply = "Invalid format. Use: '[WFH/LEAVE] from yyyy-mm-dd to yyyy-mm-dd'"
-        else:
-            employee_id = employee[0].get("id")
-            employee_reports_to_id = employee[0].get("reportsTo")
-            employee_name = employee[0].get("name")
-            emp_reports_to_response = get_employee_by_id(employee_reports_to_id)
-            employee_reports_to_number = emp_reports_to_response['phone']
-            result = create_request_approval(
-                emp_id=employee_id,
-                request_type=request_type,
-                from_date=from_date,
-                to_date=to_date
-            )
-
-            if result.get("success", True):
-                reply = (
-                    f"{request_type.capitalize()} request submitted!\n"
-                    f"From: {from_date}\n"
-                    f"To: {to_date}\n"
-                    f"Request ID: {result.get('requestId')}"
-                )
-                reply_to_manager = (
-                    f"{request_type.capitalize()} request submitted by {employee_name}!\n"
-                    f"From: {from_date}\n"
-                    f"To: {to_date}\n"
-                    f"Request ID: {result.get('requestId')}")
-
-                print(f"employee reports to number {employee_reports_to_number}")
-                sendReply(client, reply_to_manager, f"whatsapp:+91{employee_reports_to_number}")
-            else:
-                reply = f"Failed to submit request: {result.get('error')}"
-                if "conflictDates" in result.get("details", {}):
-                    reply += f"\nConflicts on: {', '.join(result['details']['conflictDates'])}"
-                elif "leaves_taken" in result.get("details", {}):
-                    remaining = 15 - result["details"]["leaves_taken"] - result["details"]["pending_leaves"]
-                    reply += f"\nYou have only {remaining} leave days remaining"
-    elif final_message.strip().lower().startswith("find contact of "):
-        final_message = re.sub(r'(?i)find contact of', '', final_message)
-
-        query = f"SELECT name, email, phone FROM employee WHERE LOWER(name) LIKE \'%{final_message.lower()}%\' "
-        reply = execute_query(query)
-    else:
-        if final_message.strip().lower().startswith("custom employee") and employee[0].get("level", "0") >= 5:
-            final_message = re.sub(r'(?i)custom', '', final_message)
-            sql_message = (
-                f"you are a SQL expert for writing queries in sqlite3 python, always write query case insensitive, "
-                f"you have to only give the exact query for MySQL so that the result of yours,"
-                f"I can directly fire in DB. You have the Employee and Attendance table information: "
-                f"Employee with columns (id, name, email, phone, role (engineer, HR, tester, manager, and founder), "
-                f"level (integer 1,2,3), clientCompany(string), location(string), employeeType(can have values A, B, C), reportsTo (id of manager who is also an employee), skills (string)); "
-                f"Attendance with columns (id, empId, date(yyyy-mm-dd), status(PRESENT/ABSENT)), requestId(integer value), Now tell me the query for - {final_message}")
-            response_from_service_b = call_docuseek_api(sql_message, employee_type)
-            query = re.search(r"```sql\s*(.*?)\s*```", response_from_service_b or "", re.DOTALL)
-            if query:
-                query = query.group(1).strip()
-                query = " ".join(query.split())
-                if "notsure" not in query.lower():
-                    result = execute_query(query)
-                    if result:
-                        formatted_response = "Employee Details:\n" + "\n".join(
-                            f"• {emp['name']} ({emp['clientCompany']})"
-                            f"\n  📧 {emp['email']}"
-                            f"\n  📞 {emp['phone']}"
-                            f"\n  📍 {emp['location']} (Level {emp['level']})"
-                            for emp in result
-                        )
-                    else:
-                        formatted_response = "No employee data found"
-                    reply = f"{formatted_response}"
-            else:
-                reply = "Could not generate proper SQL query"
-        elif final_message.strip().lower().startswith("custom") and employee[0].get("level", "0") >= 5:
-                final_message = re.sub(r'(?i)custom', '', final_message)
-                sql_message = (
-                    f"you are a SQL expert for writing queries in sqlite3 python, always write query case insensitive, "
-                    f"you have to only give the exact query for MySQL so that the result of yours,"
-                    f"I can directly fire in DB. You have the Employee and Attendance table information: "
-                    f"Employee with columns (id, name, email, phone, role (engineer, HR, tester, manager, and founder), "
-                    f"level (integer 1,2,3), clientCompany(string), location(string), employeeType(can have values A, B, C), reportsTo (id of manager who is also an employee), skills (string)); "
-                    f"Attendance with columns (id, empId, date(yyyy-mm-dd), status(PRESENT/ABSENT)), requestId(integer value), Now tell me the query for - {final_message}")
-                response_from_service_b = call_docuseek_api(sql_message, employee_type)
-                query = re.search(r"```sql\s*(.*?)\s*```", response_from_service_b or "", re.DOTALL)
-                if query:
-                    query = query.group(1).strip()
-                    query = " ".join(query.split())
-                    if "notsure" not in query.lower():
-                        result = execute_query(query)
-                        if result:
-                            formatted_response = result
-                        else:
-                            formatted_response = "No employee data found"
-                        reply = f"{formatted_response}"
-                else:
-                    reply = "Could not generate proper SQL query"
-        else:
-            response_from_service_b = call_docuseek_api(final_message, employee_type)
-            print("Response from service:", response_from_service_b)
-            reply = response_from_service_b or "Oops, currently I don't have that information."
 
-    # Prepare response - audio if received audio, otherwise text
-    twiml_response = MessagingResponse()
+def answer_webhook(form):
+    """(TwiML body, content type) for one webhook delivery, answering Twilio retries from the first one"""
+    sender_number = form.get("From")
+
+    def send_late(kept):
+        # Twilio dropped the first delivery's connection, so its TwiML reply was never seen
+        reply, audio_url = kept[2:4] if len(kept) > 2 else (None, None)
+        if reply:
+            print(f"Sending the reply to {form.get('MessageSid')} after its retry gave up waiting")
+            sendReply(client, reply, sender_number, media_url=audio_url)
+
+    kept = webhook_ledger.run(form.get("MessageSid"), lambda: process_webhook(form), on_late=send_late)
+    if kept is None:
+        # A retry that outwaited the first delivery: acknowledge it; the reply follows by REST
+        print(f"Duplicate webhook {form.get('MessageSid')} still in progress, acknowledging")
+        return str(MessagingResponse()), "text/xml"
+    body, content_type = kept[:2]
+    return body, content_type
+
+
+def process_webhook(form):
+    """
+    Handle one webhook delivery so retries can be answered from it
+
+    Returns:
+        (TwiML body, content type, reply text, audio URL); the reply is
+        None when it is sent later by a worker
+    """
+    if WEBHOOK_ASYNC:
+        if webhook_jobs.submit(process_message_job, form):
+            # Empty TwiML: the reply is sent later by a worker
+            return str(MessagingResponse()), "text/xml", None, None
+        # Queue full: process in this request so callers slow down instead of piling up
+        print(f"Webhook queue full ({webhook_jobs.depth()} jobs), processing inline")
+
+    reply, audio_url = handle_message(form)
+    response = twiml_reply(reply, audio_url)
+    return response.get_data(as_text=True), response.content_type, reply, audio_url
 
-    if is_audio_received:
-        audio_path = text_to_speech(reply)
-        print(f"Audio path: {audio_path}")
-        if audio_path:
-            audio_url = upload_audio_file(audio_path)
-            if audio_url:
-                twiml_response.message().media(audio_url)
-                # Clean up temporary files
-                for file in [audio_path, "temp_audio.ogg", "temp_audio.wav"]:
-                    print(f"Audio file: {file}")
-                    if os.path.exists(file):
-                        os.remove(file)
-                return Response(str(twiml_response), content_type="audio/mpeg")
-
-    # Fallback to text response
-    twiml_response.message(body=reply)
-    return Response(str(twiml_response), content_type="text/xml")
+
+@app.route("/media/<token>", methods=["GET"])
+def media_api(token):
+    """Serve generated reply audio by signed token (supports Range and conditional GET)"""
+    path = media_store.resolve(token)
+    if not path:
+        return jsonify({"error": "Not found"}), 404
+    return send_file(path, mimetype="audio/mpeg", conditional=True, max_age=MEDIA_TTL)
 
 
 @app.route("/execute_query", methods=["POST"])
 def execute_query_api():
-    """API endpoint for direct query execution"""
+    """API endpoint for direct query execution; send 'Cache-Control: no-cache' for fresh data"""
     if request.headers.get("x-api-key") != "abcdef":
         return jsonify({"error": "Unauthorized"}), 401
     data = request.json
@@ -879,12 +1672,187 @@ def execute_query_api():
     if not query:
         return jsonify({"error": "Query is required"}), 400
 
-    result = execute_query(query)
+    use_cache = "no-cache" not in request.headers.get("Cache-Control", "").lower()
+    result = execute_query(query, use_cache=use_cache)
     if result is not None:
         return jsonify(result), 200
     else:
         return jsonify({"error": "Query execution failed"}), 500
 
 
+@app.route("/stats", methods=["GET"])
+def stats_api():
+    """Runtime counters for connection pools"""
+    if request.headers.get("x-api-key") != "abcdef":
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify({
+        "http_pools": pool_stats(backend, docuseek, twilio_media, tmpfiles),
+        "upstreams": resilience_stats(backend, docuseek, twilio_media, tmpfiles),
+        "caches": {
+            "employees": employee_cache.stats(),
+            "sql_translation": sql_translation_cache.stats(),
+            "docuseek_answer": docuseek_answer_cache.stats(),
+            "query_result": query_result_cache.stats(),
+        },
+        "docuseek_singleflight": docuseek_flight.stats(),
+        "stt": voice.stt.stats(),
+        "tts_cache": tts_cache.stats(),
+        "attendance_calendar": attendance_calendar.stats(),
+        "directory": directory.stats(),
+        "fanout": fanout.stats(),
+        "webhook_jobs": webhook_jobs.stats(),
+        "webhook_dedup": webhook_ledger.stats(),
+        "outbound": outbound.stats(),
+    }), 200
+
+
+@metrics.register_collector
+def runtime_metrics():
+    """Cache, connection pool and queue gauges for /metrics, read from this worker's stats"""
+    samples = []
+    caches = {
+        "employees_by_id": employee_cache.records.stats(),
+        "employees_by_phone": employee_cache.phones.stats(),
+        "sql_translation": sql_translation_cache.stats(),
+        "docuseek_answer": docuseek_answer_cache.stats(),
+        "query_result": query_result_cache.stats(),
+        "attendance_calendar": attendance_calendar.stats(),
+        "continuations": continuations.stats(),
+    }
+    for name, cache_stats in caches.items():
+        samples.append(("chat_cache_entries", "gauge", "Entries held by an in-process cache",
+                        {"cache": name}, cache_stats["size"]))
+        for result in ("hits", "negative_hits", "misses"):
+            samples.append(("chat_cache_lookups_total", "counter", "In-process cache lookups by result",
+                            {"cache": name, "result": result}, cache_stats[result]))
+        samples.append(("chat_cache_evictions_total", "counter", "Entries evicted to stay within maxsize",
+                        {"cache": name}, cache_stats["evictions"]))
+    tts_stats = tts_cache.stats()
+    for result in ("hits", "misses", "url_hits"):
+        samples.append(("chat_cache_lookups_total", "counter", "In-process cache lookups by result",
+                        {"cache": "tts", "result": result}, tts_stats[result]))
+
+    for name, pool in pool_stats(backend, docuseek, twilio_media, tmpfiles).items():
+        for key in ("requests", "connections_opened", "errors"):
+            samples.append((f"chat_http_pool_{key}_total", "counter", f"HTTP pool {key.replace('_', ' ')}",
+                            {"upstream": name}, pool[key]))
+
+    for name, upstream in resilience_stats(backend, docuseek, twilio_media, tmpfiles).items():
+        breaker = upstream["breaker"]
+        samples.append(("chat_circuit_state", "gauge", "Circuit breaker state (0 closed, 1 half-open, 2 open)",
+                        {"upstream": name}, STATE_VALUES[breaker["state"]]))
+        samples.append(("chat_circuit_opened_total", "counter", "Times a circuit breaker opened",
+                        {"upstream": name}, breaker["opened"]))
+        samples.append(("chat_circuit_rejected_total", "counter", "Calls refused while a circuit was open",
+                        {"upstream": name}, breaker["rejected"]))
+        samples.append(("chat_hedged_requests_total", "counter", "Idempotent reads sent a second time",
+                        {"upstream": name}, upstream["hedged"]))
+    webhook_stats, outbound_stats = webhook_jobs.stats(), outbound.stats()
+    for queue_name, queue_stats in (("webhook", webhook_stats), ("outbound", outbound_stats)):
+        samples.append(("chat_queue_depth", "gauge", "Jobs waiting in a background queue",
+                        {"queue": queue_name}, queue_stats["depth"]))
+    for key in ("sent", "failed", "retries", "dropped", "coalesced", "split"):
+        samples.append(("chat_outbound_messages_total", "counter", "Outbound WhatsApp messages by result",
+                        {"result": key}, outbound_stats[key]))
+    ledger_stats = webhook_ledger.stats()
+    for key in ("processed", "replayed", "waited", "timed_out", "failed"):
+        samples.append(("chat_webhook_deliveries_total", "counter", "Webhook deliveries by MessageSid outcome",
+                        {"result": key}, ledger_stats[key]))
+    fanout_stats = fanout.stats()
+    for key in ("calls", "errors", "timeouts"):
+        samples.append((f"chat_fanout_{key}_total", "counter", f"Concurrent backend {key} made by turns",
+                        {}, fanout_stats[key]))
+    samples.append(("chat_directory_records", "gauge", "Employees in the local contact directory",
+                    {}, directory.stats()["records"]))
+    return samples
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_api():
+    """Prometheus metrics for every worker on this host"""
+    if METRICS_TOKEN:
+        authorized = request.headers.get("Authorization") == f"Bearer {METRICS_TOKEN}"
+    else:
+        authorized = request.headers.get("x-api-key") == "abcdef"
+    if not authorized:
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness check; answers without touching any upstream"""
+    return jsonify({
+        "status": "ok",
+        "pid": os.getpid(),
+        "uptime_seconds": round(time.perf_counter() - _import_started, 1),
+        "import_ms": round(IMPORT_SECONDS * 1000, 1),
+        "warmed_up": _warmed_up,
+    }), 200
+
+
+# Set once a /warmup call has succeeded in this worker
+_warmed_up = False
+
+
+def warm_upstream(upstream):
+    """Open a pooled connection to an upstream; any HTTP answer counts, only network errors fail"""
+    upstream.request("HEAD", "/", timeout=upstream.timeout)
+
+
+def warm_directory():
+    if directory.snapshot is None:
+        directory.refresh(full=True)
+    directory.start()
+
+
+@app.route("/warmup", methods=["GET", "POST"])
+def warmup():
+    """
+    Load lazy subsystems and open upstream connections before traffic arrives
+
+    Opens keep-alive connections to the backend and document search (waking
+    a cold onrender.com instance), loads the contact directory, builds the
+    Twilio client and, with ?voice=1, imports the speech libraries. Steps
+    run concurrently; the response lists each step's time and error.
+    """
+    global _warmed_up
+    if request.headers.get("x-api-key") != "abcdef":
+        return jsonify({"error": "Unauthorized"}), 401
+
+    steps = {
+        "backend": lambda: warm_upstream(backend),
+        "docuseek": lambda: warm_upstream(docuseek),
+        "directory": warm_directory,
+        "twilio_client": client.load,
+    }
+    if request.args.get("voice") == "1":
+        steps["voice"] = voice.load
+    outcomes = fanout.gather(*steps.values(), timeout=WARMUP_TIMEOUT)
+
+    results = {}
+    for name, outcome in zip(steps, outcomes):
+        results[name] = {"ok": outcome.ok, "ms": round(outcome.elapsed * 1000, 1)}
+        if not outcome.ok:
+            results[name]["error"] = str(outcome.error)
+    ok = all(outcome.ok for outcome in outcomes)
+    _warmed_up = _warmed_up or ok
+    return jsonify({"ok": ok, "steps": results}), 200 if ok else 503
+
+
+@app.route("/cache/employees/invalidate", methods=["POST"])
+def invalidate_employee_cache_api():
+    """Drop cached employee lookups after a change in the employee table"""
+    if request.headers.get("x-api-key") != "abcdef":
+        return jsonify({"error": "Unauthorized"}), 401
+    data = request.get_json(silent=True) or {}
+    phone, emp_id = data.get("phone"), data.get("id")
+    invalidate_employee_cache(phone_number=phone, emp_id=emp_id)
+    return jsonify({"invalidated": {"phone": phone, "id": emp_id} if phone or emp_id else "all"}), 200
+
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
+print(f"main imported in {IMPORT_SECONDS * 1000:.0f} ms")
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,115 @@
+import hashlib
+import hmac
+import os
+import re
+import secrets
+import tempfile
+import time
+
+TOKEN_PATTERN = re.compile(r"^([0-9a-f]{32})-([0-9a-f]+)-([0-9a-f]{32})$")
+SECRET_FILE = ".secret"
+
+
+class MediaStore:
+    """
+    Local store for generated media, addressed by signed expiring tokens
+
+    Files are stored by content hash in `directory` (shared by all workers
+    on the host). put() returns a token "<id>-<expiry>-<signature>" where the
+    signature is an HMAC of id and expiry under `secret`, so tokens cannot be
+    guessed or extended. Files older than `ttl` are swept on later writes.
+
+    Args:
+        directory: Storage directory (created if missing)
+        secret: HMAC key; must be the same in every worker. When empty, a
+                random key is created once in `directory` and shared by every
+                worker on this host (tokens then only work on this host)
+        ttl: Seconds a token and its file stay valid
+    """
+
+    def __init__(self, directory, secret, ttl=3600, ext="mp3"):
+        self.directory = directory
+        self.ttl = ttl
+        self.ext = ext
+        self._last_sweep = 0.0
+        os.makedirs(directory, exist_ok=True)
+        if not secret:
+            print("WARNING: no media secret configured (set MEDIA_SECRET); "
+                  f"signing /media tokens with a host-local key in {directory}")
+            secret = self._host_secret()
+        self.secret = secret.encode("utf-8") if isinstance(secret, str) else secret
+
+    def _host_secret(self):
+        """Key stored in the directory, created by whichever worker gets there first"""
+        path = os.path.join(self.directory, SECRET_FILE)
+        if not os.path.exists(path):
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    f.write(secrets.token_hex(32))
+                # link() fails if another worker published its key first; theirs is then used
+                os.link(tmp_path, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(tmp_path)
+        with open(path) as f:
+            return f.read().strip()
+
+    def _sign(self, media_id, expires):
+        message = f"{media_id}.{expires}".encode("utf-8")
+        return hmac.new(self.secret, message, hashlib.sha256).hexdigest()[:32]
+
+    def _path(self, media_id):
+        return os.path.join(self.directory, f"{media_id}.{self.ext}")
+
+    def put(self, data):
+        """Store data and return a token valid for ttl seconds"""
+        media_id = hashlib.sha256(data).hexdigest()[:32]
+        path = self._path(media_id)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+        expires = int(time.time() + self.ttl)
+        self._maybe_sweep()
+        return f"{media_id}-{expires:x}-{self._sign(media_id, expires)}"
+
+    def resolve(self, token):
+        """Return the file path for a valid, unexpired token, else None"""
+        match = TOKEN_PATTERN.match(token or "")
+        if not match:
+            return None
+        media_id, expires_hex, signature = match.groups()
+        expires = int(expires_hex, 16)
+        if not hmac.compare_digest(signature, self._sign(media_id, expires)):
+            return None
+        if expires <= time.time():
+            return None
+        path = self._path(media_id)
+        return path if os.path.exists(path) else None
+
+    def _maybe_sweep(self):
+        now = time.time()
+        if now - self._last_sweep < self.ttl / 10:
+            return
+        self._last_sweep = now
+        cutoff = now - self.ttl
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name == SECRET_FILE:
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
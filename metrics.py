@@ -0,0 +1,349 @@
+import fcntl
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+# Latency buckets in seconds, from cache hits to slow upstream calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "chat-engine-metrics"))
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", 5))
+# Files not rewritten for this long belong to workers that are gone
+METRICS_STALE_SECONDS = float(os.getenv("METRICS_STALE_SECONDS", 600))
+# Histogram totals of gone workers, kept so the merged counters never go backwards
+DEAD_WORKERS_FILE = "dead_workers.state"
+
+
+class Histogram:
+    """
+    Latency histogram with label values, cheap to observe from any thread
+
+    observe() costs one bisect and a few list increments under a lock.
+    Series are keyed by the tuple of label values in `labels` order.
+    """
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, *label_values):
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts (last one is +Inf), then sum
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += seconds
+        _start_flusher()
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(values), list(counts), total] for values, (counts, total) in self._series.items()]
+
+
+class Stage:
+    __slots__ = ("name", "started", "outcome")
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.outcome = "ok"
+
+
+class Turn:
+    """
+    Stage timings of one webhook turn, recorded once the command is known
+
+    Usage:
+        turn = Turn()
+        with turn.stage("employee_lookup"):
+            ...
+        with turn.stage("stt") as stage:
+            text = ...
+            if not text:
+                stage.outcome = "empty"
+        turn.finish(command)
+
+    A stage that raises is recorded with outcome "error". finish() also
+    records the whole turn as stage "total".
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []
+
+    @property
+    def outcome(self):
+        return "ok" if all(outcome == "ok" for _, _, outcome in self.stages) else "degraded"
+
+    def stage(self, name):
+        return _StageTimer(self, name)
+
+    def finish(self, command, outcome=None):
+        for name, seconds, stage_outcome in self.stages:
+            STAGE_SECONDS.observe(seconds, name, command, stage_outcome)
+        STAGE_SECONDS.observe(time.perf_counter() - self.started, "total", command, outcome or self.outcome)
+
+
+class _StageTimer:
+    __slots__ = ("turn", "stage")
+
+    def __init__(self, turn, name):
+        self.turn = turn
+        self.stage = Stage(name)
+
+    def __enter__(self):
+        return self.stage
+
+    def __exit__(self, exc_type, exc, tb):
+        stage = self.stage
+        if exc_type is not None:
+            stage.outcome = "error"
+        self.turn.stages.append((stage.name, time.perf_counter() - stage.started, stage.outcome))
+        return False
+
+
+def timed(name):
+    """Decorator recording a helper's latency in chat_helper_seconds, with outcome "error" if it raised"""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = fn(*args, **kwargs)
+                outcome = "ok" if result is not None else "empty"
+                return result
+            finally:
+                HELPER_SECONDS.observe(time.perf_counter() - started, name, outcome)
+
+        return wrapper
+
+    return decorator
+
+
+STAGE_SECONDS = Histogram(
+    "chat_stage_seconds", "Time spent in each stage of a webhook turn", ("stage", "command", "outcome"))
+HELPER_SECONDS = Histogram(
+    "chat_helper_seconds", "Latency of backend and media helper functions", ("helper", "outcome"))
+UPSTREAM_SECONDS = Histogram(
+    "chat_upstream_request_seconds", "Latency of HTTP requests to upstream services", ("upstream", "method", "status"))
+HISTOGRAMS = [STAGE_SECONDS, HELPER_SECONDS, UPSTREAM_SECONDS]
+
+# Callables returning [(name, type, help, {label: value}, value)] for gauges and counters read at flush time
+_collectors = []
+
+
+def register_collector(collector):
+    _collectors.append(collector)
+    return collector
+
+
+def _collect():
+    samples = []
+    for collector in _collectors:
+        try:
+            samples.extend(collector())
+        except Exception as e:
+            print(f"Metrics collector failed: {e}")
+    return samples
+
+
+_flusher = None
+_flush_lock = threading.Lock()
+
+
+def _start_flusher():
+    """Start this process's flush thread on first use, so every gunicorn worker gets its own after fork"""
+    global _flusher
+    if _flusher is not None and _flusher[0] == os.getpid():
+        return
+    with _flush_lock:
+        if _flusher is not None and _flusher[0] == os.getpid():
+            return
+        thread = threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True)
+        _flusher = (os.getpid(), thread)
+        thread.start()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            flush()
+        except Exception as e:
+            print(f"Metrics flush failed: {e}")
+
+
+def flush():
+    """Write this process's metrics to METRICS_DIR/<pid>.json, atomically"""
+    state = {
+        "histograms": {
+            histogram.name: histogram.snapshot() for histogram in HISTOGRAMS
+        },
+        "samples": _collect(),
+    }
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    fd, tmp_path = tempfile.mkstemp(dir=METRICS_DIR, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_all():
+    """
+    (pid, state) for every live worker's file, then the dead workers' totals
+
+    A stale file's histograms are folded into DEAD_WORKERS_FILE before it is
+    removed, as prometheus_client's multiprocess mode does, so the summed
+    counters do not drop (which Prometheus would read as a reset) when a
+    recycled worker's file ages out. The dead workers' state has no samples:
+    its gauges described processes that no longer exist.
+    """
+    now = time.time()
+    states = []
+    with os.scandir(METRICS_DIR) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                if now - entry.stat().st_mtime > METRICS_STALE_SECONDS:
+                    _fold_dead(entry.path)
+                    continue
+                with open(entry.path) as f:
+                    states.append((entry.name[:-len(".json")], json.load(f)))
+            except (OSError, ValueError):
+                continue
+    dead = _load_dead()
+    if dead:
+        states.append(("dead", {"histograms": dead, "samples": []}))
+    return states
+
+
+def _merge(merged, series):
+    """Add [(label values, bucket counts, sum)] into {label values tuple: [bucket counts, sum]}"""
+    for values, counts, total in series:
+        key = tuple(values)
+        current = merged.get(key)
+        if current is None:
+            merged[key] = [list(counts), total]
+        else:
+            current[0] = [a + b for a, b in zip(current[0], counts)]
+            current[1] += total
+
+
+def _load_dead():
+    try:
+        with open(os.path.join(METRICS_DIR, DEAD_WORKERS_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _fold_dead(path):
+    """Add a gone worker's histograms to the dead workers' totals and delete its file, exactly once"""
+    folding = path + ".folding"
+    try:
+        # Only one renderer wins the rename; the others skip the file
+        os.rename(path, folding)
+    except OSError:
+        return
+    try:
+        with open(folding) as f:
+            histograms = json.load(f)["histograms"]
+    except (OSError, ValueError, KeyError):
+        os.remove(folding)
+        return
+
+    with open(os.path.join(METRICS_DIR, DEAD_WORKERS_FILE + ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dead = _load_dead()
+        for name, series in histograms.items():
+            merged = {tuple(values): [counts, total] for values, counts, total in dead.get(name, ())}
+            _merge(merged, series)
+            dead[name] = [[list(values), counts, total] for values, (counts, total) in merged.items()]
+        fd, tmp_path = tempfile.mkstemp(dir=METRICS_DIR, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(dead, f)
+            os.replace(tmp_path, os.path.join(METRICS_DIR, DEAD_WORKERS_FILE))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.remove(folding)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """
+    Prometheus text exposition of every worker's metrics
+
+    Histograms are summed across workers, including ones that are gone.
+    Gauges and counters from collectors describe one process each and
+    carry a `pid` label.
+    """
+    flush()
+    states = _read_all()
+    lines = []
+
+    for histogram in HISTOGRAMS:
+        merged = {}
+        for _, state in states:
+            _merge(merged, state["histograms"].get(histogram.name, ()))
+        lines.append(f"# HELP {histogram.name} {histogram.help}")
+        lines.append(f"# TYPE {histogram.name} histogram")
+        for values in sorted(merged):
+            counts, total = merged[values]
+            pairs = list(zip(histogram.labels, values))
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{histogram.name}_bucket{_format_labels(pairs + [('le', _format_number(bound))])} {cumulative}")
+            lines.append(f"{histogram.name}_sum{_format_labels(pairs)} {_format_number(float(total))}")
+            lines.append(f"{histogram.name}_count{_format_labels(pairs)} {cumulative}")
+
+    families = {}
+    for pid, state in states:
+        for name, kind, help, labels, value in state["samples"]:
+            family = families.setdefault(name, (kind, help, []))
+            family[2].append((sorted(labels.items()) + [("pid", pid)], value))
+    for name in sorted(families):
+        kind, help, samples = families[name]
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for pairs, value in samples:
+            lines.append(f"{name}{_format_labels(pairs)} {_format_number(value)}")
+
+    return "\n".join(lines) + "\n"
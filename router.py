@@ -0,0 +1,119 @@
+import re
+
+# Leading keyword of a message: the first run of letters ("present2024-01-01" -> "present")
+KEYWORD_PATTERN = re.compile(r"[a-z]+")
+
+
+class Message:
+    """An incoming message normalized once: whitespace collapsed, lowercased, leading keyword extracted"""
+
+    __slots__ = ("raw", "text", "lower", "keyword")
+
+    def __init__(self, raw):
+        self.raw = raw or ""
+        self.text = " ".join(self.raw.split())
+        self.lower = self.text.lower()
+        match = KEYWORD_PATTERN.match(self.lower)
+        self.keyword = match.group(0) if match else ""
+
+
+class CommandContext:
+    """Everything a command handler needs about the current turn"""
+
+    __slots__ = ("message", "employee", "sender")
+
+    def __init__(self, message, employee, sender):
+        self.message = message
+        self.employee = employee
+        self.sender = sender
+
+
+class Route:
+    __slots__ = ("name", "handler", "pattern", "allow")
+
+    def __init__(self, name, handler, pattern=None, allow=None):
+        self.name = name
+        self.handler = handler
+        self.pattern = re.compile(pattern) if isinstance(pattern, str) else pattern
+        self.allow = allow
+
+    def match(self, message, ctx):
+        """Return a match object (or True for pattern-less routes) if this route takes the message"""
+        if self.pattern is None:
+            match = True
+        else:
+            match = self.pattern.match(message.lower)
+            if not match:
+                return None
+        if self.allow is not None and not self.allow(ctx):
+            return None
+        return match
+
+
+class CommandRouter:
+    """
+    Registry of command handlers, dispatched on a message's leading keyword
+
+    Routes registered for keywords are looked up in a dict and tried in
+    registration order, matching their precompiled pattern against the
+    lowercased message. Routes registered without keywords are tried next,
+    for phrasings that can start with anything (e.g. transcribed voice
+    notes); the default handler takes whatever is left. Handlers are called
+    as handler(ctx, match) and return the reply.
+
+    Usage:
+        router = CommandRouter()
+
+        @router.command("mark_attendance", keywords=("present", "absent"))
+        def mark_attendance(ctx, match):
+            ...
+    """
+
+    def __init__(self):
+        self._by_keyword = {}
+        self._anywhere = []
+        self._default = None
+
+    def command(self, name, keywords=(), pattern=None, allow=None):
+        """Decorator registering a handler under each of keywords (or as a keyword-less route)"""
+
+        def decorator(handler):
+            route = Route(name, handler, pattern, allow)
+            if keywords:
+                for keyword in keywords:
+                    self._by_keyword.setdefault(keyword, []).append(route)
+            else:
+                self._anywhere.append(route)
+            return handler
+
+        return decorator
+
+    def default(self, handler):
+        """Decorator registering the handler for messages no route takes"""
+        self._default = Route("default", handler)
+        return handler
+
+    def classify(self, message, ctx=None):
+        """Return (route, match) for a Message"""
+        for route in self._by_keyword.get(message.keyword, ()):
+            match = route.match(message, ctx)
+            if match:
+                return route, match
+        for route in self._anywhere:
+            match = route.match(message, ctx)
+            if match:
+                return route, match
+        return self._default, None
+
+    def dispatch(self, ctx):
+        """Run the handler for ctx.message; returns (command name, reply)"""
+        route, match = self.classify(ctx.message, ctx)
+        return route.name, route.handler(ctx, match)
+
+    def commands(self):
+        names = []
+        for routes in [*self._by_keyword.values(), self._anywhere]:
+            for route in routes:
+                if route.name not in names:
+                    names.append(route.name)
+        return names
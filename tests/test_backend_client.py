@@ -0,0 +1,62 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend_client import BackendClient
+
+
+class StallFirstHandler(BaseHTTPRequestHandler):
+    """Answers the first request after `stall` seconds and every later one at once"""
+
+    stall = 2.0
+    lock = threading.Lock()
+    seen = 0
+
+    def do_POST(self):
+        with self.lock:
+            type(self).seen += 1
+            first = self.seen == 1
+        if first:
+            time.sleep(self.stall)
+        body = b'{"first": true}' if first else b'{"first": false}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stalled_upstream():
+    StallFirstHandler.seen = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StallFirstHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_hedge_wins_against_stalled_first_attempt(stalled_upstream):
+    client = BackendClient("test", stalled_upstream, hedge_after=0.1, hedge_ratio=1.0)
+    started = time.perf_counter()
+    response = client.post("/employees", hedge=True)
+    elapsed = time.perf_counter() - started
+
+    assert response.json() == {"first": False}
+    assert elapsed < 1.0
+    assert client.hedge_stats() == {"hedged": 1, "hedges_won": 1}
+
+
+def test_fast_first_attempt_is_not_hedged(stalled_upstream):
+    StallFirstHandler.seen = 1  # nothing stalls
+    client = BackendClient("test", stalled_upstream, hedge_after=0.5, hedge_ratio=1.0)
+    assert client.post("/employees", hedge=True).status_code == 200
+    assert client.hedge_stats() == {"hedged": 0, "hedges_won": 0}
+    assert client.stats.requests == 1
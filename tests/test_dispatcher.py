@@ -0,0 +1,51 @@
+import threading
+import time
+
+from dispatcher import MAX_BODY_LENGTH, OutboundDispatcher
+
+
+class Flaky(Exception):
+    status = 503
+
+
+def test_backoff_does_not_hold_the_worker():
+    sent = []
+    failures = {"a": 1}
+    lock = threading.Lock()
+
+    def send(message):
+        with lock:
+            if failures.get(message.to):
+                failures[message.to] -= 1
+                raise Flaky("try again")
+            sent.append((message.to, time.monotonic()))
+
+    dispatcher = OutboundDispatcher(send, workers=1, rate=1000, burst=1000, backoff=1.0)
+    started = time.monotonic()
+    dispatcher.enqueue("a", "first")
+    time.sleep(0.05)
+    dispatcher.enqueue("b", "second")
+    assert dispatcher.flush(timeout=5)
+
+    assert [to for to, _ in sent] == ["b", "a"]
+    # b went out while a was backing off on the only worker
+    assert sent[0][1] - started < 0.5
+    assert dispatcher.stats()["retries"] == 1
+
+
+def test_split_parts_stay_in_order_across_a_retry():
+    sent = []
+    calls = {"n": 0}
+
+    def send(message):
+        calls["n"] += 1
+        if calls["n"] == 2:
+            raise Flaky("try again")
+        sent.append(message.body[0])
+
+    dispatcher = OutboundDispatcher(send, workers=1, rate=1000, burst=1000, backoff=0.05)
+    dispatcher.enqueue("a", " ".join(["x" * (MAX_BODY_LENGTH - 1), "y" * (MAX_BODY_LENGTH - 1), "z"]))
+    assert dispatcher.flush(timeout=5)
+
+    assert sent == ["x", "y", "z"]
+    assert dispatcher.stats()["sent"] == 3
@@ -0,0 +1,26 @@
+import threading
+import time
+
+from fanout import FanOut, QueueTimeout
+
+
+def test_deadline_starts_when_the_call_runs():
+    fanout = FanOut(workers=2, timeout=0.3)
+    outcomes = fanout.gather(*[lambda: time.sleep(0.2) or 1 for _ in range(4)])
+    assert [outcome.value for outcome in outcomes] == [1, 1, 1, 1]
+
+
+def test_unstarted_call_is_dropped_after_its_timeout():
+    fanout = FanOut(workers=1, timeout=0.1)
+    release = threading.Event()
+    fanout.gather(lambda: release.wait(5))  # times out but keeps the only thread busy
+    ran = []
+    started = time.monotonic()
+    outcome, = fanout.gather(lambda: ran.append(1), timeout=0.2)
+    elapsed = time.monotonic() - started
+    release.set()
+
+    assert isinstance(outcome.error, QueueTimeout)
+    assert elapsed < 0.5
+    time.sleep(0.05)
+    assert ran == []
@@ -0,0 +1,44 @@
+import threading
+import time
+
+import pytest
+
+from idempotency import MessageLedger
+
+
+@pytest.fixture(params=["memory", "directory"])
+def ledgers(request, tmp_path):
+    """Two ledgers for the same messages: one process, or two workers sharing a directory"""
+    if request.param == "memory":
+        ledger = MessageLedger(wait=0.1, claim_ttl=0.4)
+        return ledger, ledger
+    return (MessageLedger(str(tmp_path), wait=0.1, claim_ttl=0.4),
+            MessageLedger(str(tmp_path), wait=0.1, claim_ttl=0.4))
+
+
+def run_in_thread(ledger, sid, fn, **kwargs):
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault("response", ledger.run(sid, fn, **kwargs)))
+    thread.start()
+    time.sleep(0.05)
+    return thread, result
+
+
+def test_reply_is_sent_once_after_a_duplicate_gives_up(ledgers):
+    first, second = ledgers
+    late = []
+    thread, result = run_in_thread(first, "SM1", lambda: time.sleep(0.5) or ["reply"], on_late=late.append)
+
+    assert second.run("SM1", lambda: ["ran twice"], on_late=late.append) is None
+    thread.join()
+    assert result["response"] == ["reply"]
+    assert late == [["reply"]]
+
+
+def test_slow_first_delivery_keeps_its_claim(tmp_path):
+    first = MessageLedger(str(tmp_path), wait=3, claim_ttl=0.4)
+    second = MessageLedger(str(tmp_path), wait=3, claim_ttl=0.4)
+    thread, _ = run_in_thread(first, "SM2", lambda: time.sleep(1.2) or ["reply"])
+
+    assert second.run("SM2", lambda: ["ran twice"]) == ["reply"]
+    thread.join()
@@ -0,0 +1,27 @@
+import json
+import os
+import re
+
+import metrics
+
+
+def upstream_count(text):
+    match = re.search(r'chat_upstream_request_seconds_count\{upstream="backend",method="GET",status="2xx"\} (\d+)', text)
+    return int(match.group(1)) if match else 0
+
+
+def test_gone_workers_histograms_survive_their_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    buckets = len(metrics.UPSTREAM_SECONDS.buckets) + 1
+    gone = tmp_path / "99999.json"
+    gone.write_text(json.dumps({
+        "histograms": {metrics.UPSTREAM_SECONDS.name: [[["backend", "GET", "2xx"], [5] + [0] * (buckets - 1), 0.05]]},
+        "samples": [],
+    }))
+    before = upstream_count(metrics.render())
+
+    os.utime(gone, (0, 0))
+    assert upstream_count(metrics.render()) == before
+    assert not gone.exists()
+    # Folded exactly once: a second scrape does not count the gone worker again
+    assert upstream_count(metrics.render()) == before
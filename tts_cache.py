@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+class TTSCache:
+    """
+    Disk-backed, content-addressed cache of synthesized reply audio
+
+    Clips are stored as <sha256(lang, text)>.mp3 in `directory`, which can be
+    shared by every gunicorn worker on the host. Files are written to a
+    unique temp name and renamed into place, so readers never see a partial
+    clip. A read bumps the file's mtime, and once the directory grows past
+    `max_bytes` the least recently used clips are deleted. The URL a clip was
+    uploaded to is kept next to it in <key>.url for `url_ttl` seconds so the
+    upload can be skipped as well.
+
+    Args:
+        directory: Cache directory (created if missing)
+        max_bytes: Total size of cached clips before LRU eviction
+        url_ttl: Seconds a remembered hosted URL stays valid
+    """
+
+    def __init__(self, directory, max_bytes=50 * 1024 * 1024, url_ttl=3000):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.url_ttl = url_ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.url_hits = 0
+        self.writes = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(text, lang):
+        return hashlib.sha256(f"{lang}\0{text}".encode("utf-8")).hexdigest()
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, f"{key}.{ext}")
+
+    def _count(self, attr):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def _atomic_write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self, text, lang="en"):
+        """Return cached mp3 bytes for (text, lang), or None"""
+        path = self._path(self.key(text, lang), "mp3")
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return data
+
+    def put(self, text, lang, data):
+        self._atomic_write(self._path(self.key(text, lang), "mp3"), data)
+        self._count("writes")
+        self._evict()
+
+    def get_url(self, text, lang="en"):
+        """Return the hosted URL of an already uploaded clip if it has not expired"""
+        path = self._path(self.key(text, lang), "url")
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires_at", 0) <= time.time():
+            return None
+        self._count("url_hits")
+        return entry.get("url")
+
+    def put_url(self, text, lang, url):
+        entry = {"url": url, "expires_at": time.time() + self.url_ttl}
+        self._atomic_write(self._path(self.key(text, lang), "url"), json.dumps(entry).encode("utf-8"))
+
+    def _evict(self):
+        clips = []
+        total = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".mp3"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                clips.append((stat.st_mtime, stat.st_size, entry.name[:-4]))
+                total += stat.st_size
+
+        for _, size, key in sorted(clips):
+            if total <= self.max_bytes:
+                break
+            for ext in ("mp3", "url"):
+                try:
+                    os.remove(self._path(key, ext))
+                except OSError:
+                    pass
+            total -= size
+            self._count("evictions")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "url_hits": self.url_hits,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,280 @@
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+# speech_recognition, pydub and gtts are imported on first use: text-only
+# traffic never needs them, and they are a large share of a cold start
+
+# Voice notes larger than this are spilled to a per-message temp file instead of memory
+AUDIO_SPOOL_MAX_BYTES = int(os.getenv("AUDIO_SPOOL_MAX_BYTES", 5 * 1024 * 1024))
+# "thread" decodes on the calling thread, "process" offloads decoding to a process pool
+STT_MODE = os.getenv("STT_MODE", "thread")
+STT_WORKERS = int(os.getenv("STT_WORKERS", 2))
+STT_TIMEOUT = float(os.getenv("STT_TIMEOUT", 30))
+# Recognition input format: mono, 16 kHz, 16-bit PCM
+STT_SAMPLE_RATE = 16000
+STT_SAMPLE_WIDTH = 2
+
+_recognizer = None
+_recognizer_lock = threading.Lock()
+
+
+def get_recognizer():
+    """Speech-to-text recognizer (holds only settings, safe to share between threads), built on first use"""
+    global _recognizer
+    if _recognizer is None:
+        with _recognizer_lock:
+            if _recognizer is None:
+                import speech_recognition as sr
+                _recognizer = sr.Recognizer()
+    return _recognizer
+
+
+def __getattr__(name):
+    # voice.recognizer keeps working without importing speech_recognition at import time
+    if name == "recognizer":
+        return get_recognizer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def load():
+    """Import the speech libraries and build the recognizer now, e.g. from a warm-up request"""
+    import gtts  # noqa: F401
+    import pydub  # noqa: F401
+    get_recognizer()
+
+
+class AudioBuffer:
+    """
+    Audio bytes kept in memory, spilled to a unique temp file past max_bytes
+
+    Each buffer belongs to one message, so concurrent voice notes never share
+    a path. Use as a context manager (or call close()) to release the memory
+    and remove any spilled file.
+    """
+
+    def __init__(self, max_bytes=AUDIO_SPOOL_MAX_BYTES, suffix=".ogg"):
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.size = 0
+        self.path = None
+        self._memory = io.BytesIO()
+        self._file = None
+
+    def write(self, chunk):
+        if self._file is None and self.size + len(chunk) > self.max_bytes:
+            self._file = tempfile.NamedTemporaryFile(prefix="voice-", suffix=self.suffix, delete=False)
+            self._file.write(self._memory.getvalue())
+            self._memory = None
+            self.path = self._file.name
+        (self._file or self._memory).write(chunk)
+        self.size += len(chunk)
+
+    def source(self):
+        """Return what AudioSegment.from_file should read: the temp path if spilled, else a BytesIO"""
+        if self._file is not None:
+            self._file.flush()
+            return self.path
+        self._memory.seek(0)
+        return self._memory
+
+    def getvalue(self):
+        if self._file is not None:
+            self._file.flush()
+            with open(self.path, "rb") as f:
+                return f.read()
+        return self._memory.getvalue()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._file = None
+        self._memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_stream(response, chunk_size=64 * 1024):
+    """Read a streamed requests response into an AudioBuffer and release the connection"""
+    buffer = AudioBuffer()
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            buffer.write(chunk)
+    except Exception:
+        buffer.close()
+        raise
+    finally:
+        response.close()
+    return buffer
+
+
+class SpeechTimeout(Exception):
+    """Decoding a voice note took longer than the configured STT timeout"""
+
+
+class StageStats:
+    """Thread-safe count/total/max timings per pipeline stage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def record(self, stage, seconds):
+        with self._lock:
+            count, total, peak = self._stages.get(stage, (0, 0.0, 0.0))
+            self._stages[stage] = (count + 1, total + seconds, max(peak, seconds))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                stage: {
+                    "count": count,
+                    "avg_ms": round(total / count * 1000, 2),
+                    "max_ms": round(peak * 1000, 2),
+                }
+                for stage, (count, total, peak) in self._stages.items()
+            }
+
+
+def decode_for_recognition(source):
+    """
+    CPU-bound half of speech-to-text, safe to run in a worker process
+
+    Args:
+        source: Audio as bytes, a file-like object or a path
+
+    Returns:
+        (mono 16 kHz 16-bit PCM bytes, {stage: seconds})
+    """
+    from pydub import AudioSegment
+
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    started = time.perf_counter()
+    audio = AudioSegment.from_file(source)
+    decoded = time.perf_counter()
+    audio = audio.set_channels(1).set_frame_rate(STT_SAMPLE_RATE).set_sample_width(STT_SAMPLE_WIDTH)
+    pcm = audio.raw_data
+    resampled = time.perf_counter()
+    return pcm, {"decode": decoded - started, "resample": resampled - decoded}
+
+
+class SpeechToText:
+    """
+    Speech-to-text with an optional process pool for the decode stage
+
+    Decoding and downsampling to mono 16 kHz happen either on the calling
+    thread ("thread" mode) or in a pool of `workers` processes ("process"
+    mode) so a long voice note does not hold the GIL on a request thread.
+    The recognition call itself is network-bound and stays on the caller.
+    A job that exceeds `timeout` is cancelled if it has not started yet and
+    abandoned otherwise; the caller gets SpeechTimeout either way.
+
+    Args:
+        mode: "thread" or "process"
+        workers: Process pool size in "process" mode
+        timeout: Seconds to wait for the decode stage
+    """
+
+    def __init__(self, mode=STT_MODE, workers=STT_WORKERS, timeout=STT_TIMEOUT):
+        self.mode = mode
+        self.workers = workers
+        self.timeout = timeout
+        self.stages = StageStats()
+        self.timeouts = 0
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a process that already runs worker threads is unsafe
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+    def _reset_pool(self, pool, terminate=False):
+        """Replace pool on the next decode; terminate=True also kills its workers, e.g. one stuck on a bad file"""
+        with self._lock:
+            if self._pool is not pool:
+                return  # Another call already replaced it
+            self._pool = None
+        # ProcessPoolExecutor has no public way to stop a running task
+        processes = list((pool._processes or {}).values()) if terminate else []
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    def decode(self, source):
+        """Run decode_for_recognition according to mode; returns PCM bytes"""
+        if self.mode != "process":
+            pcm, timings = decode_for_recognition(source)
+        else:
+            if hasattr(source, "read"):
+                source = source.read()
+            submitted = time.perf_counter()
+            pool = self._executor()
+            future = pool.submit(decode_for_recognition, source)
+            try:
+                pcm, timings = future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                # The worker is still busy with this file and would hold its slot until it finishes
+                self.timeouts += 1
+                self._reset_pool(pool, terminate=True)
+                raise SpeechTimeout(f"decode exceeded {self.timeout}s")
+            except BrokenProcessPool:
+                self._reset_pool(pool)
+                raise
+            timings["queue"] = max(time.perf_counter() - submitted - sum(timings.values()), 0.0)
+        for stage, seconds in timings.items():
+            self.stages.record(stage, seconds)
+        return pcm
+
+    def transcribe(self, source):
+        import speech_recognition as sr
+
+        pcm = self.decode(source)
+        started = time.perf_counter()
+        try:
+            audio_data = sr.AudioData(pcm, STT_SAMPLE_RATE, STT_SAMPLE_WIDTH)
+            return get_recognizer().recognize_google(audio_data)
+        finally:
+            self.stages.record("recognize", time.perf_counter() - started)
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "workers": self.workers if self.mode == "process" else 0,
+            "timeouts": self.timeouts,
+            "stages": self.stages.snapshot(),
+        }
+
+
+stt = SpeechToText()
+
+
+def transcribe(source):
+    """Decode audio (path or file-like) and run Google Speech Recognition on it, without touching disk"""
+    return stt.transcribe(source)
+
+
+def synthesize(text, lang="en"):
+    """Return gTTS mp3 bytes for text"""
+    from gtts import gTTS
+
+    mp3 = io.BytesIO()
+    gTTS(text=text, lang=lang).write_to_fp(mp3)
+    return mp3.getvalue()